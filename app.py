@@ -7,13 +7,17 @@ from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from sqlalchemy.orm import DeclarativeBase
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from db_profiles import engine_options, configure_engine
+from db_routing import RoutingSession, REPLICA_BIND, init_replica_routing
+
+# Configure logging; set LOG_LEVEL=DEBUG to see SQLAlchemy and library chatter again
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 # Create the app
 app = Flask(__name__)
@@ -21,12 +25,92 @@ app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_develo
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///attendance_system.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Engine deployment profile (see db_profiles.py): "auto" picks "sqlite" or "postgresql" from
+# DATABASE_URL; "legacy" keeps the old pool_recycle/pool_pre_ping settings
+app.config["DB_PROFILE"] = os.environ.get("DB_PROFILE", "auto")
+app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+app.config["SQLITE_SYNCHRONOUS"] = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+app.config["SQLITE_MMAP_SIZE"] = int(os.environ.get("SQLITE_MMAP_SIZE", "268435456"))
+app.config["SQLITE_CACHE_SIZE"] = int(os.environ.get("SQLITE_CACHE_SIZE", "-65536"))
+app.config["SQLITE_BEGIN_MODE"] = os.environ.get("SQLITE_BEGIN_MODE", "deferred")
+app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", "10"))
+app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+app.config["DB_POOL_RECYCLE"] = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+app.config["DB_POOL_PRE_PING"] = os.environ.get("DB_POOL_PRE_PING", "0") == "1"
+app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "30000"))
+app.config["DB_PREPARE_THRESHOLD"] = os.environ.get("DB_PREPARE_THRESHOLD")
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+
+# Read replica for dashboards, reports and history (see db_routing.py); users who just wrote
+# read from the primary for REPLICA_PIN_SECONDS so they see their own changes
+if os.environ.get("REPLICA_DATABASE_URL"):
+    app.config["SQLALCHEMY_BINDS"] = {
+        REPLICA_BIND: {"url": os.environ["REPLICA_DATABASE_URL"],
+                       **engine_options(app.config, os.environ["REPLICA_DATABASE_URL"])}
+    }
+app.config["REPLICA_PIN_SECONDS"] = float(os.environ.get("REPLICA_PIN_SECONDS", "5"))
+
+# Seconds to keep logged-in user profiles in a per-process cache (0 disables it)
+app.config["IDENTITY_CACHE_TTL"] = float(os.environ.get("IDENTITY_CACHE_TTL", "0"))
+
+# Notification delivery (see notifications.py), e.g. "stdout" or "file:/path/to/notifications.log"
+app.config["NOTIFICATION_TRANSPORT"] = os.environ.get("NOTIFICATION_TRANSPORT", "stdout")
+app.config["NOTIFICATION_RATE_LIMIT"] = float(os.environ.get("NOTIFICATION_RATE_LIMIT", "0")) or None
+
+# Entries kept in the per-process cache of rendered reports and dashboards (0 disables it)
+app.config["RESPONSE_CACHE_SIZE"] = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+
+# Cache for attendance statistics (see result_cache.py): "none", "memory" or "sqlite:/path/to/cache.db"
+app.config["RESULT_CACHE"] = os.environ.get("RESULT_CACHE", "none")
+app.config["RESULT_CACHE_SIZE"] = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))
+app.config["RESULT_CACHE_TTL"] = float(os.environ.get("RESULT_CACHE_TTL", "60"))
+
+# Password hashing (see passwords.py): werkzeug method such as "scrypt:32768:8:1" or
+# "pbkdf2:sha256:1000000"; stored hashes made with other parameters are upgraded at login.
+# Hashes run on PASSWORD_HASH_WORKERS threads per process (0 hashes in the request thread); at most
+# PASSWORD_HASH_QUEUE more may wait, for up to PASSWORD_HASH_TIMEOUT seconds, before logins get a 503
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+app.config["PASSWORD_SALT_LENGTH"] = int(os.environ.get("PASSWORD_SALT_LENGTH", "16"))
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", "32"))
+app.config["PASSWORD_HASH_TIMEOUT"] = float(os.environ.get("PASSWORD_HASH_TIMEOUT", "10"))
+
+# Check-in API for card readers (see checkins.py): events per request, queued events beyond which
+# devices are told to retry later, and the worker's batch size and lateness rules
+app.config["CHECKIN_MAX_BATCH"] = int(os.environ.get("CHECKIN_MAX_BATCH", "500"))
+app.config["CHECKIN_MAX_PENDING"] = int(os.environ.get("CHECKIN_MAX_PENDING", "50000"))
+app.config["CHECKIN_RETRY_AFTER"] = int(os.environ.get("CHECKIN_RETRY_AFTER", "5"))
+app.config["CHECKIN_BATCH_SIZE"] = int(os.environ.get("CHECKIN_BATCH_SIZE", "1000"))
+app.config["CHECKIN_LATE_AFTER_MINUTES"] = float(os.environ.get("CHECKIN_LATE_AFTER_MINUTES", "5"))
+app.config["CHECKIN_EARLY_MINUTES"] = float(os.environ.get("CHECKIN_EARLY_MINUTES", "15"))
+app.config["CHECKIN_RETENTION_DAYS"] = float(os.environ.get("CHECKIN_RETENTION_DAYS", "7"))
+
+# In-memory timetable index (see timetable.py): days around today that are indexed, and how often
+# each worker checks for sessions or enrollments changed by other workers
+app.config["TIMETABLE_DAYS_BACK"] = int(os.environ.get("TIMETABLE_DAYS_BACK", "14"))
+app.config["TIMETABLE_DAYS_AHEAD"] = int(os.environ.get("TIMETABLE_DAYS_AHEAD", "180"))
+app.config["TIMETABLE_SYNC_SECONDS"] = float(os.environ.get("TIMETABLE_SYNC_SECONDS", "5"))
+
+# Per-request SQL instrumentation (see instrumentation.py): Server-Timing headers and a slow request log
+app.config["SQL_INSTRUMENTATION"] = os.environ.get("SQL_INSTRUMENTATION", "1") != "0"
+app.config["SERVER_TIMING_HEADER"] = os.environ.get("SERVER_TIMING_HEADER", "1") != "0"
+app.config["SLOW_REQUEST_MS"] = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+app.config["SLOW_REQUEST_QUERIES"] = int(os.environ.get("SLOW_REQUEST_QUERIES", "50"))
+app.config["REPEATED_QUERY_THRESHOLD"] = int(os.environ.get("REPEATED_QUERY_THRESHOLD", "10"))
+
+# Comma-separated usernames allowed to view and reset /admin/metrics; nobody when unset
+app.config["ADMIN_USERNAMES"] = {name.strip() for name in os.environ.get("ADMIN_USERNAMES", "").split(",")
+                                 if name.strip()}
+
+# Prometheus metrics on /metrics (see metrics.py). Set METRICS_DIR to a directory shared by all
+# gunicorn workers so their samples are summed; METRICS_TOKEN requires "Authorization: Bearer <token>"
+app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR")
+app.config["METRICS_FLUSH_INTERVAL"] = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
 # Initialize the database
 db.init_app(app)
 
@@ -38,9 +122,18 @@ login_manager.init_app(app)
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
 
+# Time SQL statements per request
+from instrumentation import init_instrumentation
+init_instrumentation(app)
+
 with app.app_context():
+    # Install the profile's connect hooks (e.g. SQLite pragmas) before the first connection
+    for engine in db.engines.values():
+        configure_engine(engine, app.config)
+
     # Import models to ensure they're registered with SQLAlchemy
-    from models import User, Student, Faculty, Course, Attendance, AbsenceRequest
+    from models import (User, Student, Faculty, Course, Attendance, AbsenceRequest, AttendanceRollup,
+                        NotificationOutbox, CourseDataVersion, CheckinDevice, CheckinEvent)
     
     # Create all tables in the database
     db.create_all()
@@ -49,12 +142,23 @@ with app.app_context():
     from routes import register_routes
     register_routes(app)
 
+    # Send read-only routes to the replica, if one is configured
+    init_replica_routing(app)
+
+    # Request, connection pool and attendance write metrics
+    from metrics import init_metrics
+    init_metrics(app)
+
+    # Register CLI commands (e.g. `flask rollups rebuild`)
+    from commands import register_commands
+    register_commands(app)
+
     # Setup user loader for login_manager
-    from models import User
+    from profiles import load_identity
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_identity(int(user_id))
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
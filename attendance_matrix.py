@@ -0,0 +1,197 @@
+from datetime import date
+
+from sqlalchemy import select
+
+from app import db
+from models import CourseEnrollment, CourseSession, Attendance
+
+# One byte per (student, session) cell
+UNRECORDED = 0
+PRESENT = 1
+LATE = 2
+ABSENT = 3
+EXCUSED = 4
+
+STATUS_CODES = {'present': PRESENT, 'late': LATE, 'absent': ABSENT, 'excused': EXCUSED}
+
+# Maps every code to b'a' for absent and b'.' otherwise, for streak scans
+_ABSENT_MASK = bytes.maketrans(bytes(range(5)), b'...a.')
+
+# Rows fetched per round trip when loading attendance
+FETCH_SIZE = 5000
+
+class AttendanceMatrix:
+    """
+    Attendance of one course as a students x sessions grid of status codes.
+
+    Cells live in a single bytearray, row-major with one row per enrolled
+    student, so a 1000 x 60 course takes 60 KB. Aggregates are computed with
+    bytes.count() over row slices and strided column slices, which run in C,
+    instead of walking ORM objects.
+
+    Attributes:
+        course_id: ID of the course
+        student_ids: Student IDs in row order
+        sessions: (id, session_date, start_time, title) tuples in column
+                  order, chronological
+        cells: bytearray of status codes
+    """
+
+    def __init__(self, course_id, student_ids, sessions, as_of=None):
+        self.course_id = course_id
+        self.student_ids = list(student_ids)
+        self.sessions = list(sessions)
+        self.width = len(self.sessions)
+        self.cells = bytearray(len(self.student_ids) * self.width)
+        self._rows = {student_id: index for index, student_id in enumerate(self.student_ids)}
+        self._columns = {session[0]: index for index, session in enumerate(self.sessions)}
+        # Sessions up to as_of have been held; streaks ignore the ones still to come
+        as_of = as_of or date.today()
+        self.held = sum(1 for session in self.sessions if session[1] <= as_of)
+
+    @property
+    def shape(self):
+        return len(self.student_ids), self.width
+
+    def set(self, student_id, session_id, status):
+        """
+        Record a status; ignored for students or sessions outside the matrix.
+        Statuses other than the four known ones are treated as no record.
+        """
+        row = self._rows.get(student_id)
+        column = self._columns.get(session_id)
+        if row is not None and column is not None:
+            self.cells[row * self.width + column] = STATUS_CODES.get(status, UNRECORDED)
+
+    def row(self, index):
+        start = index * self.width
+        return self.cells[start:start + self.width]
+
+    def column(self, index):
+        return self.cells[index::self.width] if self.width else bytearray()
+
+    def _counts(self, cells):
+        return {
+            'present': cells.count(PRESENT),
+            'late': cells.count(LATE),
+            'absent': cells.count(ABSENT),
+            'excused': cells.count(EXCUSED),
+            'unrecorded': cells.count(UNRECORDED)
+        }
+
+    def student_counts(self):
+        """Status counts per student, in row order."""
+        return [self._counts(self.row(index)) for index in range(len(self.student_ids))]
+
+    def session_counts(self):
+        """Status counts per session, in column order."""
+        return [self._counts(self.column(index)) for index in range(self.width)]
+
+    def student_stats(self):
+        """
+        Attendance stats per student, matching calculate_attendance: sessions
+        without a record count as absent and excused sessions are left out of
+        the denominator.
+
+        Returns:
+            Dictionary mapping student ID to attendance stats
+        """
+        results = {}
+        for student_id, counts in zip(self.student_ids, self.student_counts()):
+            required = self.width - counts['excused']
+            attended = counts['present'] + counts['late']
+            results[student_id] = {
+                'total': self.width,
+                'present': counts['present'],
+                'absent': counts['absent'] + counts['unrecorded'],
+                'late': counts['late'],
+                'excused': counts['excused'],
+                'percentage': round(attended / required * 100, 2) if self.width and required > 0 else 0
+            }
+        return results
+
+    def absence_streaks(self):
+        """
+        Consecutive 'absent' records per student among sessions already held.
+
+        Returns:
+            Dictionary mapping student ID to (longest streak, current streak),
+            where the current streak ends at the latest held session
+        """
+        masked = self.cells.translate(_ABSENT_MASK)
+        streaks = {}
+        for index, student_id in enumerate(self.student_ids):
+            start = index * self.width
+            row = masked[start:start + self.held]
+            longest = max(map(len, row.split(b'.'))) if row else 0
+            streaks[student_id] = (longest, len(row) - len(row.rstrip(b'a')))
+        return streaks
+
+    def below_threshold(self, min_percent):
+        """IDs of students whose attendance percentage is under min_percent."""
+        if not self.width:
+            return []
+        return [student_id for student_id, stats in self.student_stats().items()
+                if stats['percentage'] < min_percent]
+
+def load_course_matrices(course_ids, as_of=None):
+    """
+    Load the attendance matrices of several courses with three queries.
+
+    Args:
+        course_ids: Iterable of course IDs
+        as_of: Date up to which sessions count as held (defaults to today)
+
+    Returns:
+        Dictionary mapping course ID to AttendanceMatrix
+    """
+    course_ids = list(course_ids)
+    if not course_ids:
+        return {}
+
+    students = {course_id: [] for course_id in course_ids}
+    for course_id, student_id in db.session.execute(
+        select(CourseEnrollment.course_id, CourseEnrollment.student_id).where(
+            CourseEnrollment.course_id.in_(course_ids)
+        ).order_by(CourseEnrollment.course_id, CourseEnrollment.student_id)
+    ):
+        students[course_id].append(student_id)
+
+    sessions = {course_id: [] for course_id in course_ids}
+    for session_id, course_id, session_date, start_time, title in db.session.execute(
+        select(CourseSession.id, CourseSession.course_id, CourseSession.session_date,
+               CourseSession.start_time, CourseSession.title).where(
+            CourseSession.course_id.in_(course_ids)
+        ).order_by(CourseSession.course_id, CourseSession.session_date, CourseSession.start_time,
+                   CourseSession.id)
+    ):
+        sessions[course_id].append((session_id, session_date, start_time, title))
+
+    matrices = {course_id: AttendanceMatrix(course_id, students[course_id], sessions[course_id], as_of)
+                for course_id in course_ids}
+    # Where each session's column lives, so the fill loop below does no per-record method calls
+    targets = {}
+    for course_id, course_sessions in sessions.items():
+        matrix = matrices[course_id]
+        for column, session in enumerate(course_sessions):
+            targets[session[0]] = (matrix.cells, matrix._rows, matrix.width, column)
+
+    rows = db.session.execute(
+        select(Attendance.session_id, Attendance.student_id, Attendance.status).join(
+            CourseSession, Attendance.session_id == CourseSession.id
+        ).where(
+            CourseSession.course_id.in_(course_ids)
+        ).execution_options(yield_per=FETCH_SIZE)
+    )
+    for session_id, student_id, status in rows:
+        cells, row_of, width, column = targets[session_id]
+        row = row_of.get(student_id)
+        if row is not None:
+            # Unknown statuses (e.g. rows written before validation) count as no record
+            cells[row * width + column] = STATUS_CODES.get(status, UNRECORDED)
+
+    return matrices
+
+def load_course_matrix(course_id, as_of=None):
+    """Load one course's AttendanceMatrix."""
+    return load_course_matrices([course_id], as_of)[course_id]
@@ -0,0 +1,585 @@
+"""
+Benchmark the main routes against a synthetic institution.
+
+Generates N faculty, M courses and K students with enrollments, a term of
+course sessions with realistic attendance, and absence requests in a scratch
+SQLite database, then drives the main routes through the Flask test client
+and prints latency percentiles, query counts and peak memory as JSON.
+
+    python benchmark.py --students 5000 --courses 120 --output bench.json
+
+The database given with --database is deleted and regenerated unless
+--reuse is passed; never point it at real data. --database-url runs against
+another server such as PostgreSQL instead, dropping and recreating its tables.
+
+With --concurrency N, N threads also drive a mixed load for --duration
+seconds: half take attendance on different sessions of the benchmark course,
+half load dashboards. Throughput, latency and failed requests (such as
+SQLite's "database is locked") are reported. --compare-profiles runs the
+whole benchmark once per engine profile (see db_profiles.py) on a freshly
+generated database and reports them side by side:
+
+    python benchmark.py --concurrency 8 --compare-profiles legacy,sqlite
+
+--login-concurrency measures sign-in throughput at several levels of
+concurrency, for --login-duration seconds each, against the password hashing
+pool (PASSWORD_HASH_WORKERS and friends, see passwords.py). Logins refused
+because the hashing queue was full are counted separately from errors:
+
+    PASSWORD_HASH_WORKERS=4 python benchmark.py --iterations 0 --login-concurrency 1,4,16,64
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, time as dt_time, timedelta
+
+DEFAULT_DATABASE = '/tmp/attendance_benchmark.db'
+PASSWORD = 'benchmark'
+DEPARTMENTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'Economics']
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--faculty', type=int, default=20, help='Number of faculty members')
+    parser.add_argument('--courses', type=int, default=60, help='Number of courses')
+    parser.add_argument('--students', type=int, default=2000, help='Number of students')
+    parser.add_argument('--courses-per-student', type=int, default=5, help='Enrollments per student')
+    parser.add_argument('--weeks', type=int, default=14, help='Length of the term in weeks')
+    parser.add_argument('--sessions-per-week', type=int, default=2, help='Sessions per course per week')
+    parser.add_argument('--absence-rate', type=float, default=0.05,
+                        help='Absence requests per enrollment')
+    parser.add_argument('--iterations', type=int, default=30, help='Requests per scenario')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the generator')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='Scratch SQLite database file')
+    parser.add_argument('--database-url', help='Benchmark this database URL instead of the scratch SQLite file')
+    parser.add_argument('--reuse', action='store_true', help='Reuse an existing benchmark database')
+    parser.add_argument('--profile', help='Engine profile to use (DB_PROFILE), e.g. legacy, sqlite or postgresql')
+    parser.add_argument('--compare-profiles', help='Comma-separated profiles to benchmark one after another')
+    parser.add_argument('--concurrency', type=int, default=0, help='Threads for the concurrent load test (0 skips it)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run the concurrent load test')
+    parser.add_argument('--login-concurrency',
+                        help='Comma-separated thread counts for the login throughput test, e.g. 1,4,16')
+    parser.add_argument('--login-duration', type=float, default=5.0,
+                        help='Seconds to run each level of the login throughput test')
+    parser.add_argument('--response-cache', action='store_true',
+                        help='Keep the rendered response cache enabled while measuring')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    return parser.parse_args(argv)
+
+def _chunks(rows, size=5000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _insert(db, model, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(model.__table__.insert(), chunk)
+
+def _attendance_status(rng, propensity):
+    """Draw one student's status for a session given how reliably they attend."""
+    roll = rng.random()
+    if roll < propensity:
+        return 'present'
+    if roll < propensity + (1 - propensity) * 0.35:
+        return 'late'
+    if roll < propensity + (1 - propensity) * 0.9:
+        return 'absent'
+    return 'excused'
+
+def generate_institution(args):
+    """
+    Fill the benchmark database with a synthetic institution.
+
+    Every student gets an attendance propensity drawn from a Beta(8, 2)
+    distribution (most attend 70-95% of sessions, a tail attends far less), a
+    few records are left unrecorded, and sessions follow a weekly schedule
+    from the start of the term up to today. Rows are written with bulk
+    inserts and rollups are rebuilt at the end.
+
+    Returns:
+        Dictionary of row counts per table
+    """
+    from app import db
+    from passwords import hash_password
+    from models import (User, Student, Faculty, Course, CourseEnrollment, CourseSession, Attendance,
+                        AbsenceRequest)
+    import rollups
+
+    rng = random.Random(args.seed)
+    password_hash = hash_password(PASSWORD)
+    today = date.today()
+    term_start = today - timedelta(weeks=args.weeks)
+    now = datetime.utcnow()
+
+    users = []
+    for i in range(args.faculty):
+        users.append({'id': i + 1, 'username': f'faculty{i}', 'email': f'faculty{i}@bench.test',
+                      'password_hash': password_hash, 'user_type': 'faculty'})
+    for i in range(args.students):
+        user_id = args.faculty + i + 1
+        users.append({'id': user_id, 'username': f'student{i}', 'email': f'student{i}@bench.test',
+                      'password_hash': password_hash, 'user_type': 'student'})
+    _insert(db, User, users)
+
+    _insert(db, Faculty, [
+        {'id': i + 1, 'user_id': i + 1, 'faculty_id': f'F{i:05d}', 'full_name': f'Faculty {i}',
+         'department': DEPARTMENTS[i % len(DEPARTMENTS)], 'position': 'Lecturer'}
+        for i in range(args.faculty)
+    ])
+    _insert(db, Student, [
+        {'id': i + 1, 'user_id': args.faculty + i + 1, 'student_id': f'S{i:06d}',
+         'full_name': f'Student {i}', 'department': rng.choice(DEPARTMENTS),
+         'year_of_study': rng.randint(1, 4)}
+        for i in range(args.students)
+    ])
+    _insert(db, Course, [
+        {'id': i + 1, 'course_code': f'C{i:04d}', 'title': f'Course {i}', 'faculty_id': i % args.faculty + 1,
+         'schedule': 'Weekly', 'location': f'Room {i % 40}', 'min_attendance_percent': 75.0}
+        for i in range(args.courses)
+    ])
+
+    enrollments = []
+    members = {course_id: [] for course_id in range(1, args.courses + 1)}
+    for student_id in range(1, args.students + 1):
+        for course_id in rng.sample(range(1, args.courses + 1), min(args.courses_per_student, args.courses)):
+            enrollments.append({'student_id': student_id, 'course_id': course_id, 'enrollment_date': now})
+            members[course_id].append(student_id)
+    _insert(db, CourseEnrollment, enrollments)
+
+    propensity = {student_id: rng.betavariate(8, 2) for student_id in range(1, args.students + 1)}
+    sessions = []
+    attendance = []
+    session_id = 0
+    for course_id in range(1, args.courses + 1):
+        weekdays = sorted(rng.sample(range(5), min(args.sessions_per_week, 5)))
+        start_hour = 8 + course_id % 9
+        for week in range(args.weeks + 1):
+            for weekday in weekdays:
+                session_date = term_start + timedelta(weeks=week, days=weekday - term_start.weekday())
+                if session_date < term_start or session_date > today:
+                    continue
+                session_id += 1
+                sessions.append({'id': session_id, 'course_id': course_id, 'session_date': session_date,
+                                 'start_time': dt_time(start_hour), 'end_time': dt_time(start_hour + 1)})
+                if session_date == today:
+                    continue
+                for student_id in members[course_id]:
+                    if rng.random() < 0.03:
+                        continue
+                    attendance.append({'student_id': student_id, 'session_id': session_id,
+                                       'status': _attendance_status(rng, propensity[student_id]),
+                                       'recorded_at': now})
+    _insert(db, CourseSession, sessions)
+    _insert(db, Attendance, attendance)
+
+    absence_requests = []
+    for enrollment in enrollments:
+        if rng.random() >= args.absence_rate:
+            continue
+        from_date = term_start + timedelta(days=rng.randint(0, args.weeks * 7))
+        absence_requests.append({
+            'student_id': enrollment['student_id'], 'course_id': enrollment['course_id'],
+            'request_date': min(from_date, today), 'from_date': from_date,
+            'to_date': from_date + timedelta(days=rng.randint(0, 3)),
+            'reason': 'Benchmark absence', 'status': rng.choice(['pending', 'pending', 'approved', 'rejected']),
+            'responded_at': None
+        })
+    for absence_request in absence_requests:
+        if absence_request['status'] != 'pending':
+            absence_request['responded_at'] = now
+    _insert(db, AbsenceRequest, absence_requests)
+
+    rollups.rebuild_rollups()
+    db.session.commit()
+
+    return {
+        'faculty': args.faculty,
+        'courses': args.courses,
+        'students': args.students,
+        'enrollments': len(enrollments),
+        'sessions': len(sessions),
+        'attendance': len(attendance),
+        'absence_requests': len(absence_requests)
+    }
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class QueryCounter:
+    """Counts statements sent to the database through an engine event."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def _login(app, username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Could not log in as {username}')
+    return client
+
+def build_scenarios(app):
+    """
+    Pick the busiest course and one of its students, and describe each
+    benchmarked route as (name, client, request function) tuples.
+    """
+    from sqlalchemy import func
+    from app import db
+    from models import Course, CourseEnrollment, CourseSession, AbsenceRequest, Faculty, Student, User
+
+    with app.app_context():
+        course_id, _ = db.session.query(
+            CourseEnrollment.course_id, func.count(CourseEnrollment.id)
+        ).group_by(CourseEnrollment.course_id).order_by(func.count(CourseEnrollment.id).desc()).first()
+        course = db.session.get(Course, course_id)
+        faculty_username = db.session.query(User.username).join(Faculty, Faculty.user_id == User.id).filter(
+            Faculty.id == course.faculty_id
+        ).scalar()
+        student_ids = [student_id for (student_id,) in db.session.query(
+            CourseEnrollment.student_id
+        ).filter_by(course_id=course_id).order_by(CourseEnrollment.id)]
+        student_username = db.session.query(User.username).join(Student, Student.user_id == User.id).filter(
+            Student.id == student_ids[0]
+        ).scalar()
+        session_ids = [session_id for (session_id,) in db.session.query(CourseSession.id).filter_by(
+            course_id=course_id
+        ).order_by(CourseSession.session_date.desc())]
+        student_usernames = [username for (username,) in db.session.query(User.username).join(
+            Student, Student.user_id == User.id
+        ).filter(Student.id.in_(student_ids[:50]))]
+        pending_ids = [request_id for (request_id,) in db.session.query(AbsenceRequest.id).join(
+            Course, AbsenceRequest.course_id == Course.id
+        ).filter(
+            Course.faculty_id == course.faculty_id,
+            AbsenceRequest.status == 'pending'
+        ).order_by(AbsenceRequest.id)]
+
+    faculty_client = _login(app, faculty_username)
+    student_client = _login(app, student_username)
+
+    statuses = ['present', 'late', 'absent', 'excused']
+    take_counter = iter(range(10 ** 9))
+    pending = iter(pending_ids)
+
+    def take_attendance():
+        iteration = next(take_counter)
+        session_id = session_ids[iteration % len(session_ids)]
+        form = {f'status_{student_id}': statuses[(index + iteration) % len(statuses)]
+                for index, student_id in enumerate(student_ids)}
+        return faculty_client.post(f'/faculty/take_attendance/{session_id}', data=form)
+
+    def respond_absence_request():
+        request_id = next(pending, None)
+        if request_id is None:
+            return None
+        return faculty_client.post(f'/faculty/respond_absence_request/{request_id}',
+                                   data={'status': 'approved', 'response_notes': 'Benchmark'})
+
+    return {
+        'course_id': course_id,
+        'enrolled_students': len(student_ids),
+        'faculty_username': faculty_username,
+        'student_usernames': student_usernames,
+        'student_ids': student_ids,
+        'session_ids': session_ids,
+        'scenarios': [
+            ('faculty_dashboard', lambda: faculty_client.get('/faculty/dashboard')),
+            ('student_dashboard', lambda: student_client.get('/student/dashboard')),
+            ('api_course_report', lambda: faculty_client.get(f'/api/course_report/{course_id}')),
+            ('take_attendance', take_attendance),
+            ('respond_absence_request', respond_absence_request),
+        ]
+    }
+
+def run_scenario(request, iterations, counter):
+    """
+    Issue a request repeatedly and collect latency, query count and peak memory.
+
+    The first request warms up caches and is not measured. Latency is timed
+    without tracemalloc; one extra request runs under tracemalloc for the
+    peak allocation.
+    """
+    request()
+    latencies = []
+    queries = []
+    status_codes = {}
+    for _ in range(iterations):
+        counter.count = 0
+        started = time.perf_counter()
+        response = request()
+        elapsed = time.perf_counter() - started
+        if response is None:
+            break
+        latencies.append(elapsed * 1000)
+        queries.append(counter.count)
+        status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+
+    tracemalloc.start()
+    response = request()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if not latencies:
+        return {'iterations': 0}
+    return {
+        'iterations': len(latencies),
+        'status_codes': {str(code): count for code, count in sorted(status_codes.items())},
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p90': round(percentile(latencies, 0.90), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3)
+        },
+        'queries': {
+            'min': min(queries),
+            'median': percentile(queries, 0.50),
+            'max': max(queries)
+        },
+        'peak_memory_kb': round(peak / 1024, 1) if response is not None else None
+    }
+
+def run_concurrent(app, setup, threads, duration):
+    """
+    Drive a mixed read/write load from several threads for a fixed time.
+
+    Even-numbered threads save attendance for their own sessions of the
+    benchmark course; odd-numbered threads load a student's dashboard.
+    Requests that fail with a server error or raise count as errors.
+    """
+    statuses = ['present', 'late', 'absent', 'excused']
+    session_ids = setup['session_ids']
+    student_ids = setup['student_ids']
+    deadline = time.perf_counter() + duration
+    results = {'write': [], 'read': []}
+    errors = {'write': {}, 'read': {}}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        writer = index % 2 == 0
+        kind = 'write' if writer else 'read'
+        if writer:
+            client = _login(app, setup['faculty_username'])
+        else:
+            client = _login(app, setup['student_usernames'][index % len(setup['student_usernames'])])
+        latencies = []
+        failures = {}
+        iteration = 0
+        barrier.wait()
+        while time.perf_counter() < deadline:
+            if writer:
+                session_id = session_ids[(index // 2 + iteration * ((threads + 1) // 2)) % len(session_ids)]
+                form = {f'status_{student_id}': statuses[(position + iteration) % len(statuses)]
+                        for position, student_id in enumerate(student_ids)}
+                send = lambda: client.post(f'/faculty/take_attendance/{session_id}', data=form)
+            else:
+                send = lambda: client.get('/student/dashboard')
+            iteration += 1
+            started = time.perf_counter()
+            try:
+                response = send()
+                failure = str(response.status_code) if response.status_code >= 500 else None
+            except Exception as exc:
+                failure = type(exc).__name__
+            if failure:
+                failures[failure] = failures.get(failure, 0) + 1
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+        with lock:
+            results[kind].extend(latencies)
+            for failure, count in failures.items():
+                errors[kind][failure] = errors[kind].get(failure, 0) + count
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    report = {'threads': threads, 'duration_seconds': duration}
+    for kind, latencies in results.items():
+        report[kind] = {
+            'completed': len(latencies),
+            'per_second': round(len(latencies) / duration, 2),
+            'errors': errors[kind],
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p95': round(percentile(latencies, 0.95), 3),
+                'max': round(max(latencies), 3)
+            } if latencies else None
+        }
+    return report
+
+def login_throughput(app, usernames, levels, duration):
+    """
+    Sign in repeatedly from 1, 2, ... threads and report logins per second
+    at each level of concurrency.
+
+    Each attempt uses a new client, so every one verifies a password. A 503
+    means the hashing queue turned the login away and counts as rejected.
+    """
+    report = []
+    for threads in levels:
+        deadline = time.perf_counter() + duration
+        latencies = []
+        outcomes = {'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        def worker(index):
+            username = usernames[index % len(usernames)]
+            mine = []
+            rejected = errors = 0
+            barrier.wait()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = app.test_client().post('/login', data={'username': username,
+                                                                    'password': PASSWORD}).status_code
+                except Exception:
+                    status = None
+                if status == 302:
+                    mine.append((time.perf_counter() - started) * 1000)
+                elif status == 503:
+                    rejected += 1
+                else:
+                    errors += 1
+            with lock:
+                latencies.extend(mine)
+                outcomes['rejected'] += rejected
+                outcomes['errors'] += errors
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        report.append({
+            'threads': threads,
+            'logins': len(latencies),
+            'per_second': round(len(latencies) / duration, 2),
+            'rejected': outcomes['rejected'],
+            'errors': outcomes['errors'],
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 3),
+                'p95': round(percentile(latencies, 0.95), 3),
+                'max': round(max(latencies), 3)
+            } if latencies else None
+        })
+    return report
+
+def compare_profiles(args):
+    """Run the benchmark in a fresh process per profile and combine the reports."""
+    options = []
+    for key, value in vars(args).items():
+        if key in ('compare_profiles', 'profile', 'reuse', 'output') or value is None or value is False:
+            continue
+        flag = '--' + key.replace('_', '-')
+        options += [flag] if value is True else [flag, str(value)]
+
+    reports = {}
+    for profile in [name.strip() for name in args.compare_profiles.split(',') if name.strip()]:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), *options, '--profile', profile],
+                                   check=True, capture_output=True, text=True)
+        reports[profile] = json.loads(completed.stdout)
+    return {'generated_at': datetime.utcnow().isoformat(), 'profiles': reports}
+
+def write_report(report, path=None):
+    output = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w') as handle:
+            handle.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.compare_profiles:
+        write_report(compare_profiles(args), args.output)
+        return
+
+    if args.profile:
+        os.environ['DB_PROFILE'] = args.profile
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+        fresh = not args.reuse
+    else:
+        if not args.reuse:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(args.database + suffix):
+                    os.remove(args.database + suffix)
+        fresh = not os.path.exists(args.database)
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+
+    from app import app, db
+    from db_profiles import resolve_profile
+
+    if args.database_url and fresh:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    if not args.response_cache:
+        app.config['RESPONSE_CACHE_SIZE'] = 0
+
+    started = time.perf_counter()
+    with app.app_context():
+        data = generate_institution(args) if fresh else None
+    generation_seconds = time.perf_counter() - started
+
+    setup = build_scenarios(app)
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    results = {}
+    for name, request in setup['scenarios']:
+        results[name] = run_scenario(request, args.iterations, counter)
+    concurrent = run_concurrent(app, setup, args.concurrency, args.duration) if args.concurrency > 0 else None
+    logins = None
+    if args.login_concurrency:
+        levels = [int(level) for level in args.login_concurrency.split(',') if level.strip()]
+        logins = login_throughput(app, setup['student_usernames'], levels, args.login_duration)
+
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'data': data,
+        'generation_seconds': round(generation_seconds, 2) if fresh else None,
+        'benchmark_course': {'id': setup['course_id'], 'enrolled_students': setup['enrolled_students']},
+        'settings': {
+            'db_profile': resolve_profile(app.config),
+            'engine_options': {key: value for key, value in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+                               if key != 'connect_args'},
+            'result_cache': app.config.get('RESULT_CACHE'),
+            'response_cache_size': app.config.get('RESPONSE_CACHE_SIZE'),
+            'identity_cache_ttl': app.config.get('IDENTITY_CACHE_TTL'),
+            'password_hash_method': app.config.get('PASSWORD_HASH_METHOD'),
+            'password_hash_workers': app.config.get('PASSWORD_HASH_WORKERS'),
+            'password_hash_queue': app.config.get('PASSWORD_HASH_QUEUE')
+        },
+        'scenarios': results,
+        'concurrent': concurrent,
+        'logins': logins
+    }
+
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+import hashlib
+import logging
+import secrets
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from app import db
+from models import (Student, Course, CourseSession, CourseEnrollment, Attendance, CheckinDevice,
+                    CheckinEvent)
+from utils import dialect_insert, upsert_attendance, check_attendance_thresholds
+from course_versions import bump_course_versions
+from metrics import registry, Counter
+import rollups
+
+logger = logging.getLogger(__name__)
+
+# A scan only ever raises a student's recorded attendance: no record < absent/excused < late < present
+STATUS_RANK = {None: 0, 'absent': 1, 'excused': 1, 'late': 2, 'present': 3}
+
+checkin_events = Counter(registry, 'checkin_events_total',
+                         'Check-in events by outcome: accepted, duplicate and throttled when posted; '
+                         'applied, ignored and rejected when the worker processes them.',
+                         ('outcome',))
+
+class CheckinError(ValueError):
+    """Raised for a malformed check-in request; the message is returned to the device."""
+
+class CheckinBackpressure(Exception):
+    """Raised when too many check-ins are waiting to be applied."""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many check-ins are waiting to be applied')
+        self.retry_after = retry_after
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_device(name, location=None):
+    """
+    Register a card reader or kiosk in the caller's transaction.
+
+    Returns:
+        Tuple of (CheckinDevice, bearer token); only a hash of the token is
+        stored, so it cannot be shown again
+    """
+    token = secrets.token_urlsafe(32)
+    device = CheckinDevice(name=name, location=location, token_hash=_token_hash(token))
+    db.session.add(device)
+    return device, token
+
+def authenticate_device(authorization):
+    """
+    Active device for an "Authorization: Bearer <token>" header, or None.
+    """
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return CheckinDevice.query.filter_by(token_hash=_token_hash(token.strip()), active=True).first()
+
+def _parse_scanned_at(value, received_at):
+    if value is None:
+        return received_at
+    if not isinstance(value, str):
+        raise CheckinError('scanned_at must be an ISO 8601 string')
+    try:
+        scanned_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise CheckinError('scanned_at must be an ISO 8601 string')
+    # Sessions are stored in local time, so times with a zone are converted to it
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone().replace(tzinfo=None)
+    return scanned_at
+
+def parse_event(event, received_at):
+    """
+    Validate one scan event.
+
+    Args:
+        event: Dictionary with idempotency_key, student_id (the student ID
+               number on the card), optional scanned_at (ISO 8601, defaults to
+               the time it was received) and optionally session_id or
+               course_code; without either, the session is found from the
+               device's location
+        received_at: Local time the request arrived
+
+    Returns:
+        Dictionary of CheckinEvent column values
+
+    Raises:
+        CheckinError: If the event is malformed
+    """
+    if not isinstance(event, dict):
+        raise CheckinError('Each event must be a JSON object')
+    key = event.get('idempotency_key')
+    if not isinstance(key, str) or not 0 < len(key) <= 100:
+        raise CheckinError('idempotency_key must be a string of 1 to 100 characters')
+    student_number = event.get('student_id')
+    if not isinstance(student_number, str) or not 0 < len(student_number) <= 20:
+        raise CheckinError('student_id must be a string of 1 to 20 characters')
+    session_id = event.get('session_id')
+    if session_id is not None and (not isinstance(session_id, int) or isinstance(session_id, bool)):
+        raise CheckinError('session_id must be an integer')
+    course_code = event.get('course_code')
+    if course_code is not None and (not isinstance(course_code, str) or len(course_code) > 20):
+        raise CheckinError('course_code must be a string of up to 20 characters')
+    return {
+        'idempotency_key': key,
+        'student_number': student_number.strip(),
+        'session_id': session_id,
+        'course_code': course_code,
+        'scanned_at': _parse_scanned_at(event.get('scanned_at'), received_at)
+    }
+
+def pending_checkins():
+    return db.session.query(func.count(CheckinEvent.id)).filter(CheckinEvent.status == 'pending').scalar()
+
+def ingest_checkins(device, payload, config):
+    """
+    Validate and queue posted scan events in the caller's transaction.
+
+    Events are written to the check-in queue with one INSERT ... ON CONFLICT
+    DO NOTHING statement; a replayed (device, idempotency_key) pair is
+    counted as a duplicate and not queued again. The check-in worker applies
+    queued events to attendance in bulk.
+
+    Args:
+        device: CheckinDevice that posted the events
+        payload: Decoded JSON body, a single event or {"events": [...]}
+        config: Flask config with the CHECKIN_* settings
+
+    Returns:
+        Dictionary with accepted and duplicate counts and a list of rejected
+        events as {'index': position, 'error': message}
+
+    Raises:
+        CheckinError: If the body is not an event or list of events
+        CheckinBackpressure: If CHECKIN_MAX_PENDING events are already waiting
+    """
+    if isinstance(payload, dict) and 'events' in payload:
+        events = payload['events']
+        if not isinstance(events, list):
+            raise CheckinError('events must be a list')
+    elif isinstance(payload, dict):
+        events = [payload]
+    else:
+        raise CheckinError('Expected a JSON object')
+    max_batch = config.get('CHECKIN_MAX_BATCH', 500)
+    if len(events) > max_batch:
+        raise CheckinError(f'At most {max_batch} events may be posted at once')
+
+    received_at = datetime.now()
+    rows = {}
+    rejected = []
+    duplicates = 0
+    for index, event in enumerate(events):
+        try:
+            row = parse_event(event, received_at)
+        except CheckinError as error:
+            rejected.append({'index': index, 'error': str(error)})
+            continue
+        if row['idempotency_key'] in rows:
+            duplicates += 1
+            continue
+        rows[row['idempotency_key']] = row
+
+    new_rows = []
+    if rows:
+        existing = {key for (key,) in db.session.query(CheckinEvent.idempotency_key).filter(
+            CheckinEvent.device_id == device.id,
+            CheckinEvent.idempotency_key.in_(list(rows))
+        )}
+        duplicates += len(existing)
+        new_rows = [{'device_id': device.id, 'received_at': datetime.utcnow(), 'status': 'pending', **row}
+                    for key, row in rows.items() if key not in existing]
+
+    # Replays are answered even when the queue is full; only new events are turned away
+    if new_rows and pending_checkins() + len(new_rows) > config.get('CHECKIN_MAX_PENDING', 50000):
+        checkin_events.inc(len(new_rows), outcome='throttled')
+        raise CheckinBackpressure(config.get('CHECKIN_RETRY_AFTER', 5))
+
+    if new_rows:
+        # DO NOTHING covers a replay racing this request from another worker
+        statement = dialect_insert(CheckinEvent.__table__).on_conflict_do_nothing(
+            index_elements=['device_id', 'idempotency_key']
+        )
+        db.session.execute(statement, new_rows)
+
+    device.last_seen_at = datetime.utcnow()
+    checkin_events.inc(len(new_rows), outcome='accepted')
+    checkin_events.inc(duplicates, outcome='duplicate')
+    return {'accepted': len(new_rows), 'duplicates': duplicates, 'rejected': rejected}
+
+class CheckinWorker:
+    """
+    Applies queued check-ins to attendance in batches.
+
+    Each batch is resolved with a handful of queries (students, sessions,
+    enrollments and existing records for the whole batch), coalesced to the
+    earliest scan per student and session, and written with one bulk upsert.
+    A scan up to CHECKIN_LATE_AFTER_MINUTES after the session starts counts
+    as present and a later one as late; scans are accepted from
+    CHECKIN_EARLY_MINUTES before the start until the end of the session. A
+    scan never lowers a status already recorded, so a late scan does not
+    overwrite "present" taken by hand.
+
+    Rollups, course versions and low attendance warnings are updated in the
+    same transaction, as when attendance is taken through the form. Run one
+    worker per database: batches are claimed with SKIP LOCKED, but two
+    workers applying scans for the same student and session at once could
+    both count the change in the rollups.
+    """
+
+    def __init__(self, batch_size=1000, late_after=timedelta(minutes=5), early=timedelta(minutes=15),
+                 retention=timedelta(days=7)):
+        self.batch_size = batch_size
+        self.late_after = late_after
+        self.early = early
+        self.retention = retention
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            batch_size=config.get('CHECKIN_BATCH_SIZE', 1000),
+            late_after=timedelta(minutes=config.get('CHECKIN_LATE_AFTER_MINUTES', 5)),
+            early=timedelta(minutes=config.get('CHECKIN_EARLY_MINUTES', 15)),
+            retention=timedelta(days=config.get('CHECKIN_RETENTION_DAYS', 7))
+        )
+
+    def _claim_batch(self):
+        return CheckinEvent.query.filter(
+            CheckinEvent.status == 'pending'
+        ).order_by(CheckinEvent.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+    def _candidate_sessions(self, batch, locations):
+        """Sessions that events without a session_id could belong to, by date."""
+        dates = {event.scanned_at.date() for event in batch if event.session_id is None}
+        codes = {event.course_code for event in batch if event.session_id is None and event.course_code}
+        places = {locations[event.device_id] for event in batch
+                  if event.session_id is None and not event.course_code and locations.get(event.device_id)}
+        if not dates or not (codes or places):
+            return []
+        match = []
+        if codes:
+            match.append(Course.course_code.in_(codes))
+        if places:
+            match.append(Course.location.in_(places))
+        return db.session.query(
+            CourseSession.id, CourseSession.course_id, CourseSession.session_date, CourseSession.start_time,
+            CourseSession.end_time, Course.course_code, Course.location
+        ).join(Course, CourseSession.course_id == Course.id).filter(
+            CourseSession.session_date.in_(dates), or_(*match)
+        ).all()
+
+    def _in_window(self, session, scanned_at):
+        """True if a scan falls between CHECKIN_EARLY_MINUTES before the start and the end of a session."""
+        return (session.session_date == scanned_at.date()
+                and datetime.combine(session.session_date, session.start_time) - self.early <= scanned_at
+                <= datetime.combine(session.session_date, session.end_time))
+
+    def _find_session(self, event, sessions_by_id, candidates, locations):
+        if event.session_id is not None:
+            session = sessions_by_id.get(event.session_id)
+            if session is None:
+                return None, 'Unknown session'
+            if not self._in_window(session, event.scanned_at):
+                return None, 'The scan is outside the session'
+            return session, None
+        if event.course_code:
+            matches = [row for row in candidates if row.course_code == event.course_code]
+        elif locations.get(event.device_id):
+            matches = [row for row in candidates if row.location == locations[event.device_id]]
+        else:
+            return None, 'No session_id or course_code, and the device has no location'
+        # The session in progress, or about to start, at the time of the scan
+        matches = [row for row in matches if self._in_window(row, event.scanned_at)]
+        if not matches:
+            return None, 'No session at the time of the scan'
+        return min(matches, key=lambda row: abs(
+            datetime.combine(row.session_date, row.start_time) - event.scanned_at
+        )), None
+
+    def apply_once(self):
+        """
+        Apply one batch of queued check-ins.
+
+        Returns:
+            Number of events processed
+        """
+        batch = self._claim_batch()
+        if not batch:
+            self._prune()
+            db.session.commit()
+            return 0
+
+        now = datetime.utcnow()
+        students = dict(db.session.query(Student.student_id, Student.id).filter(
+            Student.student_id.in_({event.student_number for event in batch})
+        ).all())
+        locations = dict(db.session.query(CheckinDevice.id, CheckinDevice.location).filter(
+            CheckinDevice.id.in_({event.device_id for event in batch})
+        ).all())
+        session_ids = {event.session_id for event in batch if event.session_id is not None}
+        sessions_by_id = {row.id: row for row in db.session.query(
+            CourseSession.id, CourseSession.course_id, CourseSession.session_date, CourseSession.start_time,
+            CourseSession.end_time
+        ).filter(CourseSession.id.in_(session_ids))} if session_ids else {}
+        candidates = self._candidate_sessions(batch, locations)
+
+        # Earliest scan per (student, session) wins
+        resolved = {}
+        earliest = {}
+        for event in batch:
+            student_id = students.get(event.student_number)
+            if student_id is None:
+                event.status, event.error = 'rejected', 'Unknown student ID'
+                continue
+            session, error = self._find_session(event, sessions_by_id, candidates, locations)
+            if session is None:
+                event.status, event.error = 'rejected', error
+                continue
+            key = (student_id, session.id)
+            resolved[event.id] = key
+            if key not in earliest or event.scanned_at < earliest[key][0]:
+                earliest[key] = (event.scanned_at, session, event.id)
+
+        enrolled = set()
+        existing = {}
+        if earliest:
+            student_ids = {student_id for student_id, _ in earliest}
+            course_ids = {session.course_id for _, session, _ in earliest.values()}
+            enrolled = set(db.session.query(CourseEnrollment.student_id, CourseEnrollment.course_id).filter(
+                CourseEnrollment.student_id.in_(student_ids), CourseEnrollment.course_id.in_(course_ids)
+            ).all())
+            existing = {(student_id, session_id): status for student_id, session_id, status in db.session.query(
+                Attendance.student_id, Attendance.session_id, Attendance.status
+            ).filter(
+                Attendance.student_id.in_(student_ids),
+                Attendance.session_id.in_({session_id for _, session_id in earliest})
+            )}
+
+        records = []
+        changes = defaultdict(list)
+        outcome = {}
+        for (student_id, session_id), (scanned_at, session, _) in earliest.items():
+            if (student_id, session.course_id) not in enrolled:
+                outcome[(student_id, session_id)] = ('rejected', None, 'Student is not enrolled in this course')
+                continue
+            start = datetime.combine(session.session_date, session.start_time)
+            status = 'present' if scanned_at <= start + self.late_after else 'late'
+            old_status = existing.get((student_id, session_id))
+            if STATUS_RANK.get(status, 0) <= STATUS_RANK.get(old_status, 0):
+                outcome[(student_id, session_id)] = ('ignored', old_status, None)
+                continue
+            records.append({'student_id': student_id, 'session_id': session_id, 'status': status,
+                            'notes': f'Checked in at {scanned_at:%H:%M}'})
+            changes[session.course_id].append((student_id, old_status, status))
+            outcome[(student_id, session_id)] = ('applied', status, None)
+
+        upsert_attendance(records)
+        for course_id, course_changes in changes.items():
+            rollups.apply_status_changes(course_id, course_changes)
+        if changes:
+            bump_course_versions(list(changes))
+            for course in Course.query.filter(Course.id.in_(list(changes))).all():
+                check_attendance_thresholds(course, {student_id for student_id, _, _ in changes[course.id]})
+
+        counts = defaultdict(int)
+        for event in batch:
+            if event.id in resolved:
+                key = resolved[event.id]
+                status, attendance_status, error = outcome[key]
+                # Later scans of the same student and session were coalesced into the earliest one
+                if status == 'applied' and earliest[key][2] != event.id:
+                    status = 'ignored'
+                event.status, event.attendance_status, event.error = status, attendance_status, error
+            event.applied_at = now
+            counts[event.status] += 1
+
+        db.session.commit()
+        for status, count in counts.items():
+            checkin_events.inc(count, outcome=status)
+        registry.flush()
+        return len(batch)
+
+    def _prune(self):
+        # Processed events are kept for a while so that late replays are still recognised
+        CheckinEvent.query.filter(
+            CheckinEvent.status != 'pending',
+            CheckinEvent.received_at < datetime.utcnow() - self.retention
+        ).delete(synchronize_session=False)
+
+    def run(self, poll_interval=1.0, stop_event=None):
+        """
+        Keep applying check-ins until stop_event is set.
+
+        Full batches are followed immediately by the next one; otherwise the
+        worker sleeps for poll_interval seconds, so scans arriving at a period
+        boundary are applied together.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                processed = self.apply_once()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Applying check-ins failed')
+                processed = 0
+            if processed < self.batch_size:
+                stop_event.wait(poll_interval)
@@ -0,0 +1,277 @@
+import click
+from flask.cli import AppGroup
+
+from app import db
+import index_audit
+import rollups
+from notifications import NotificationWorker
+from exports import EXPORT_FORMATS, department_course_ids, iter_export
+from roster_import import RosterError, read_roster, import_students, import_enrollments
+import result_cache
+from db_routing import replica_configured, sync_sqlite_replica
+from models import Course, CheckinDevice
+from checkins import CheckinWorker, create_device, pending_checkins
+from recurrence import generate_term_sessions, parse_holidays, ScheduleError
+
+def register_commands(app):
+    
+    rollup_cli = AppGroup('rollups', help='Maintain the attendance rollup table.')
+    
+    @rollup_cli.command('rebuild')
+    @click.option('--course-id', 'course_ids', type=int, multiple=True,
+                  help='Only rebuild these courses (repeatable).')
+    def rebuild_rollups(course_ids):
+        """Recompute attendance rollups from the raw attendance tables."""
+        written = rollups.rebuild_rollups(course_ids=course_ids or None)
+        db.session.commit()
+        if course_ids:
+            result_cache.invalidate(course_ids=course_ids)
+        else:
+            result_cache.get_result_cache().clear()
+        click.echo(f'Rebuilt {written} attendance rollup rows')
+    
+    @rollup_cli.command('verify')
+    @click.option('--course-id', 'course_ids', type=int, multiple=True,
+                  help='Only verify these courses (repeatable).')
+    def verify_rollups(course_ids):
+        """Report rollup rows that drifted from the raw attendance tables."""
+        drift = rollups.verify_rollups(course_ids=course_ids or None)
+        for entry in drift:
+            click.echo(f"student {entry['student_id']} course {entry['course_id']}: "
+                       f"expected {entry['expected']}, found {entry['actual']}")
+        if drift:
+            raise click.ClickException(f'{len(drift)} attendance rollup rows have drifted')
+        click.echo('Attendance rollups are consistent')
+    
+    app.cli.add_command(rollup_cli)
+    
+    schema_cli = AppGroup('schema', help='Inspect and maintain database indexes.')
+    
+    @schema_cli.command('create-indexes')
+    def create_indexes():
+        """Create indexes declared on the models that are missing from the database."""
+        names = index_audit.create_missing_indexes()
+        click.echo(f'Checked {len(names)} indexes')
+    
+    @schema_cli.command('audit')
+    @click.option('--all', 'show_all', is_flag=True, help='Also list queries without full table scans.')
+    def audit_indexes(show_all):
+        """EXPLAIN every query issued by the GET routes and flag full table scans."""
+        findings = index_audit.audit_route_queries(app)
+        if not findings:
+            click.echo('No data to audit: create at least one course first')
+            return
+        
+        flagged = [finding for finding in findings if finding['scans']]
+        for finding in (findings if show_all else flagged):
+            status = 'FULL SCAN ' + ', '.join(finding['scans']) if finding['scans'] else 'ok'
+            click.echo(f"[{status}] {', '.join(finding['endpoints'])}")
+            click.echo('    ' + ' '.join(finding['statement'].split()))
+            for line in finding['plan']:
+                click.echo(f'      {line}')
+        
+        click.echo(f'{len(flagged)} of {len(findings)} distinct queries read a whole table')
+    
+    app.cli.add_command(schema_cli)
+    
+    notification_cli = AppGroup('notifications', help='Deliver queued notifications.')
+    
+    @notification_cli.command('drain')
+    def drain_notifications():
+        """Deliver every notification that is currently due, then exit."""
+        worker = NotificationWorker.from_config(app.config)
+        total = 0
+        while True:
+            processed = worker.drain_once()
+            total += processed
+            if processed < worker.batch_size:
+                break
+        click.echo(f'Processed {total} notifications')
+    
+    @notification_cli.command('worker')
+    @click.option('--poll-interval', default=5.0, show_default=True, help='Seconds to wait when the outbox is empty.')
+    def notification_worker(poll_interval):
+        """Run a long-lived worker that drains the notification outbox."""
+        worker = NotificationWorker.from_config(app.config)
+        click.echo(f"Notification worker started ({app.config['NOTIFICATION_TRANSPORT']})")
+        try:
+            worker.run(poll_interval=poll_interval)
+        except KeyboardInterrupt:
+            click.echo('Notification worker stopped')
+    
+    app.cli.add_command(notification_cli)
+    
+    cache_cli = AppGroup('cache', help='Inspect the attendance result cache.')
+    
+    @cache_cli.command('stats')
+    def cache_stats():
+        """Show the result cache backend, its size and this process's counters."""
+        backend = result_cache.get_result_cache()
+        stats = backend.stats.as_dict()
+        click.echo(f"{backend.name}: {backend.size()} entries, " +
+                   ', '.join(f'{name} {count}' for name, count in stats.items()))
+    
+    @cache_cli.command('clear')
+    def cache_clear():
+        """Drop every cached attendance result."""
+        result_cache.get_result_cache().clear()
+        click.echo('Result cache cleared')
+    
+    app.cli.add_command(cache_cli)
+    
+    session_cli = AppGroup('sessions', help='Create course sessions.')
+    
+    @session_cli.command('generate')
+    @click.option('--start', 'term_start', type=click.DateTime(['%Y-%m-%d']), required=True,
+                  help='First day of the term (YYYY-MM-DD).')
+    @click.option('--end', 'term_end', type=click.DateTime(['%Y-%m-%d']), required=True,
+                  help='Last day of the term (YYYY-MM-DD).')
+    @click.option('--holiday', 'holidays', multiple=True,
+                  help='Date or range to skip, e.g. 2026-03-16:2026-03-20 (repeatable).')
+    @click.option('--holidays-file', type=click.File('r'), help='File with one holiday date or range per line.')
+    @click.option('--course-id', 'course_ids', type=int, multiple=True, help='Course to schedule (repeatable).')
+    @click.option('--department', help='Schedule every course taught in this department.')
+    @click.option('--all', 'all_courses', is_flag=True, help='Schedule every course.')
+    @click.option('--dry-run', is_flag=True, help='Show what would be created without writing anything.')
+    def generate_sessions(term_start, term_end, holidays, holidays_file, course_ids, department, all_courses, dry_run):
+        """Expand course schedules into the sessions of a term, skipping ones that exist."""
+        query = Course.query
+        if all_courses:
+            pass
+        elif course_ids or department:
+            course_ids = list(course_ids) + (department_course_ids(department) if department else [])
+            query = query.filter(Course.id.in_(course_ids))
+        else:
+            raise click.UsageError('Pass --course-id, --department or --all')
+        courses = query.order_by(Course.id).all()
+        
+        try:
+            excluded = parse_holidays(list(holidays) + (holidays_file.readlines() if holidays_file else []))
+            plan = generate_term_sessions(courses, term_start.date(), term_end.date(), excluded, dry_run=dry_run)
+        except ScheduleError as exc:
+            raise click.ClickException(str(exc))
+        
+        for course in courses:
+            result = plan[course.id]
+            if result['error']:
+                click.echo(f'{course.course_code}: skipped, {result["error"]}', err=True)
+                continue
+            click.echo(f'{course.course_code}: {len(result["planned"])} new, {result["existing"]} existing')
+            if dry_run:
+                for session_date, start_time, end_time in result['planned']:
+                    click.echo(f'  {session_date:%a %Y-%m-%d} {start_time:%H:%M}-{end_time:%H:%M}')
+        
+        created = sum(len(result['planned']) for result in plan.values())
+        if dry_run:
+            click.echo(f'Dry run: {created} sessions would be created')
+        else:
+            db.session.commit()
+            click.echo(f'Created {created} sessions')
+    
+    app.cli.add_command(session_cli)
+    
+    replica_cli = AppGroup('replica', help='Manage the read replica used for reports and dashboards.')
+    
+    @replica_cli.command('sync')
+    def replica_sync():
+        """Copy the primary SQLite database to the replica file (local testing only)."""
+        if not replica_configured(app):
+            raise click.ClickException('No replica configured; set REPLICA_DATABASE_URL')
+        try:
+            path = sync_sqlite_replica(app)
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(f'Replica {path} is now a copy of the primary')
+    
+    app.cli.add_command(replica_cli)
+    
+    checkin_cli = AppGroup('checkins', help='Manage check-in devices and apply queued check-ins.')
+    
+    @checkin_cli.command('add-device')
+    @click.argument('name')
+    @click.option('--location', help='Room the device is in; scans without a course match sessions there.')
+    def add_device(name, location):
+        """Register a card reader or kiosk and print its token."""
+        device, token = create_device(name, location)
+        db.session.commit()
+        click.echo(f'Device {device.id} ({device.name}) created. Its token is shown only once:')
+        click.echo(token)
+    
+    @checkin_cli.command('list-devices')
+    def list_devices():
+        """List registered devices."""
+        for device in CheckinDevice.query.order_by(CheckinDevice.id):
+            state = 'active' if device.active else 'revoked'
+            click.echo(f"{device.id}\t{device.name}\t{device.location or '-'}\t{state}\t"
+                       f"last seen {device.last_seen_at or 'never'}")
+    
+    @checkin_cli.command('revoke-device')
+    @click.argument('device_id', type=int)
+    def revoke_device(device_id):
+        """Stop accepting check-ins from a device."""
+        device = db.session.get(CheckinDevice, device_id)
+        if device is None:
+            raise click.ClickException(f'No device {device_id}')
+        device.active = False
+        db.session.commit()
+        click.echo(f'Device {device_id} revoked')
+    
+    @checkin_cli.command('apply')
+    def apply_checkins():
+        """Apply every queued check-in to attendance, then exit."""
+        worker = CheckinWorker.from_config(app.config)
+        total = 0
+        while True:
+            processed = worker.apply_once()
+            total += processed
+            if processed < worker.batch_size:
+                break
+        click.echo(f'Processed {total} check-ins; {pending_checkins()} still queued')
+    
+    @checkin_cli.command('worker')
+    @click.option('--poll-interval', default=1.0, show_default=True,
+                  help='Seconds to wait when fewer than a full batch of check-ins is queued.')
+    def checkin_worker(poll_interval):
+        """Run a long-lived worker that applies queued check-ins in batches."""
+        worker = CheckinWorker.from_config(app.config)
+        click.echo('Check-in worker started')
+        try:
+            worker.run(poll_interval=poll_interval)
+        except KeyboardInterrupt:
+            click.echo('Check-in worker stopped')
+    
+    app.cli.add_command(checkin_cli)
+    
+    @app.cli.command('export-attendance')
+    @click.option('--course-id', 'course_ids', type=int, multiple=True, help='Course to export (repeatable).')
+    @click.option('--department', help='Export every course taught in this department.')
+    @click.option('--format', 'export_format', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv',
+                  show_default=True)
+    @click.option('--output', type=click.File('w'), default='-', help='Output file (defaults to stdout).')
+    def export_attendance(course_ids, department, export_format, output):
+        """Stream the student x session attendance matrix for courses or a department."""
+        course_ids = list(course_ids)
+        if department:
+            course_ids += department_course_ids(department)
+        if not course_ids:
+            raise click.UsageError('Pass --course-id or --department')
+        
+        for chunk in iter_export(course_ids, export_format):
+            output.write(chunk)
+    
+    @app.cli.command('import-roster')
+    @click.argument('kind', type=click.Choice(['students', 'enrollments']))
+    @click.argument('roster', type=click.File('rb'))
+    def import_roster(kind, roster):
+        """Import a CSV roster of students or enrollments in one transaction."""
+        try:
+            rows = read_roster(roster)
+        except RosterError as exc:
+            raise click.ClickException(str(exc))
+        result = import_students(rows) if kind == 'students' else import_enrollments(rows)
+        db.session.commit()
+        
+        for line, message in result['errors']:
+            click.echo(f'line {line}: {message}', err=True)
+        click.echo(f"Imported {result['created']} {kind}, skipped {result['skipped']} already present, "
+                   f"rejected {len(result['errors'])} rows")
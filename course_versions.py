@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from app import db
+from models import CourseDataVersion
+from http_cache import response_cache
+import result_cache
+from timetable import courses_changed
+
+def bump_course_versions(course_ids):
+    """
+    Record that data for some courses changed, in the caller's transaction.
+
+    Each course's version is incremented with one INSERT ... ON CONFLICT
+    statement, so concurrent writers never lose an increment. Call this from
+    every write that changes a course's attendance, sessions, enrollments,
+    absence requests or details; it also drops the course's cached responses
+    and attendance results, and refreshes its timetable entries on commit.
+
+    Args:
+        course_ids: Iterable of course IDs
+    """
+    # Imported here because utils imports this module
+    from utils import dialect_insert
+
+    course_ids = sorted(set(course_ids))
+    if not course_ids:
+        return
+
+    now = datetime.utcnow()
+    statement = dialect_insert(CourseDataVersion.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['course_id'],
+        set_={
+            'version': CourseDataVersion.__table__.c.version + 1,
+            'updated_at': statement.excluded.updated_at
+        }
+    )
+    db.session.execute(statement, [
+        {'course_id': course_id, 'version': 1, 'updated_at': now}
+        for course_id in course_ids
+    ])
+
+    response_cache.invalidate_courses(course_ids)
+    result_cache.invalidate(course_ids=course_ids)
+    courses_changed(course_ids)
+
+def get_course_versions(course_ids):
+    """
+    Read the current data version of some courses with one query.
+
+    Args:
+        course_ids: Iterable of course IDs
+
+    Returns:
+        Dictionary mapping course ID to (version, updated_at); courses that were
+        never changed map to (0, None)
+    """
+    course_ids = list(course_ids)
+    versions = {course_id: (0, None) for course_id in course_ids}
+    if course_ids:
+        versions.update({
+            course_id: (version, updated_at)
+            for course_id, version, updated_at in db.session.query(
+                CourseDataVersion.course_id, CourseDataVersion.version, CourseDataVersion.updated_at
+            ).filter(CourseDataVersion.course_id.in_(course_ids))
+        })
+    return versions
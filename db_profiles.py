@@ -0,0 +1,144 @@
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# Registered engine profiles, keyed by the name used in DB_PROFILE
+PROFILES = {}
+
+def register_profile(name, options, on_engine=None):
+    """
+    Register an engine deployment profile.
+
+    Args:
+        name: Name used in the DB_PROFILE setting
+        options: Function taking (url, config) and returning keyword arguments
+                 for create_engine (SQLALCHEMY_ENGINE_OPTIONS)
+        on_engine: Optional function taking (engine, config), called once the
+                   engine exists, e.g. to install connect-time hooks
+    """
+    PROFILES[name] = (options, on_engine)
+
+def resolve_profile(config, url=None):
+    """
+    Name of the profile to use; 'auto' picks one from the database URL's dialect.
+
+    Args:
+        config: Flask config
+        url: Database URL; defaults to SQLALCHEMY_DATABASE_URI
+    """
+    name = config.get('DB_PROFILE', 'auto')
+    if name == 'auto':
+        backend = make_url(url or config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        name = backend if backend in PROFILES else 'legacy'
+    if name not in PROFILES:
+        raise ValueError(f'Unknown database profile: {name}')
+    return name
+
+def engine_options(config, url=None):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS for the configured profile.
+
+    Args:
+        config: Flask config with SQLALCHEMY_DATABASE_URI and DB_* / SQLITE_* settings
+        url: Database URL; defaults to SQLALCHEMY_DATABASE_URI
+
+    Returns:
+        Dictionary of create_engine keyword arguments
+    """
+    url = url or config['SQLALCHEMY_DATABASE_URI']
+    options, _ = PROFILES[resolve_profile(config, url)]
+    return options(make_url(url), config)
+
+def configure_engine(engine, config):
+    """Apply the configured profile's engine hooks; call before the first connection."""
+    _, on_engine = PROFILES[resolve_profile(config, engine.url)]
+    if on_engine is not None:
+        on_engine(engine, config)
+
+def _legacy_options(url, config):
+    # The settings this app always used: recycle connections and ping before each checkout
+    return {
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }
+
+def _sqlite_options(url, config):
+    return {
+        # pysqlite's own lock wait, in seconds; busy_timeout below covers the same for SQLite itself
+        'connect_args': {'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000},
+    }
+
+def _sqlite_pragmas(engine, config):
+    """
+    Apply journal and cache pragmas to every new SQLite connection.
+
+    WAL lets readers proceed while one writer commits; busy_timeout makes a
+    second writer wait for the lock instead of failing with "database is
+    locked". With SQLITE_BEGIN_MODE 'immediate' every transaction takes the
+    write lock up front, which avoids the lock-upgrade failures WAL reports
+    without waiting when two transactions read and then both try to write.
+    """
+    pragmas = [
+        ('journal_mode', 'WAL'),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 268435456))),
+        ('cache_size', int(config.get('SQLITE_CACHE_SIZE', -65536))),
+        ('temp_store', 'MEMORY'),
+    ]
+    immediate = config.get('SQLITE_BEGIN_MODE', 'deferred') == 'immediate'
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+        if immediate:
+            # Let SQLAlchemy emit BEGIN itself instead of pysqlite's deferred one
+            dbapi_connection.isolation_level = None
+
+    if immediate:
+        @event.listens_for(engine, 'begin')
+        def begin_immediate(connection):
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+def _postgres_options(url, config):
+    server_options = [
+        f"-c statement_timeout={int(config.get('DB_STATEMENT_TIMEOUT_MS', 30000))}",
+        f"-c idle_in_transaction_session_timeout={int(config.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))}",
+    ]
+    connect_args = {
+        'options': ' '.join(server_options),
+        'application_name': config.get('DB_APPLICATION_NAME', 'attendance'),
+        'connect_timeout': int(config.get('DB_CONNECT_TIMEOUT', 10)),
+    }
+
+    prepare_threshold = config.get('DB_PREPARE_THRESHOLD')
+    if prepare_threshold is not None:
+        if url.get_driver_name() == 'psycopg':
+            # Server-side prepared statements after this many executions; 0 turns them off
+            # (needed behind PgBouncer in transaction pooling mode)
+            connect_args['prepare_threshold'] = int(prepare_threshold) or None
+        else:
+            logger.warning('DB_PREPARE_THRESHOLD needs the psycopg (version 3) driver, '
+                           'e.g. postgresql+psycopg://; ignoring it for %s', url.get_driver_name())
+
+    return {
+        'pool_size': int(config.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(config.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(config.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(config.get('DB_POOL_RECYCLE', 1800)),
+        # Pinging costs a round trip per checkout; recycling and the server's timeouts usually suffice
+        'pool_pre_ping': bool(config.get('DB_POOL_PRE_PING', False)),
+        # Reuse the most recent connection so idle extras can be recycled away
+        'pool_use_lifo': True,
+        'connect_args': connect_args,
+    }
+
+register_profile('legacy', _legacy_options)
+register_profile('sqlite', _sqlite_options, _sqlite_pragmas)
+register_profile('postgresql', _postgres_options)
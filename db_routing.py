@@ -0,0 +1,94 @@
+import sqlite3
+import time
+
+from flask import request, session, current_app
+from flask_sqlalchemy.session import Session as FlaskSession
+
+# Bind key of the read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+# Methods that never write; any other successful request pins the user to the primary
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+class RoutingSession(FlaskSession):
+    """
+    Session that sends plain SELECTs to the replica when the request allows it.
+
+    Replica reads are opt-in per session through info['use_replica'], which
+    the request hooks below set for read-only routes. Flushes, INSERT/UPDATE/
+    DELETE statements and anything that is not a SELECT always go to the
+    primary, so a route marked read-only by mistake still writes correctly.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('use_replica') and not self._flushing \
+                and getattr(clause, 'is_select', False):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_reads(view):
+    """
+    Mark a view as read-only so its queries may be served by the replica.
+
+    Only GET and HEAD requests are routed, and never for a user who wrote
+    within the last REPLICA_PIN_SECONDS.
+    """
+    view.replica_reads = True
+    return view
+
+def replica_configured(app=None):
+    app = app or current_app
+    return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+def pinned_to_primary():
+    """True while the current user's recent write may not have reached the replica yet."""
+    return session.get('primary_until', 0) > time.time()
+
+def _route_request():
+    from app import db
+
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method in ('GET', 'HEAD') and getattr(view, 'replica_reads', False) \
+            and not pinned_to_primary():
+        db.session.info['use_replica'] = True
+
+def _pin_after_write(response):
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        session['primary_until'] = time.time() + current_app.config.get('REPLICA_PIN_SECONDS', 5)
+    return response
+
+def init_replica_routing(app):
+    """Route read-only requests to the replica bind when one is configured."""
+    if not replica_configured(app):
+        return
+    app.before_request(_route_request)
+    app.after_request(_pin_after_write)
+
+def sync_sqlite_replica(app):
+    """
+    Copy the primary SQLite database over the replica file.
+
+    For local testing of replica routing with two SQLite files; real
+    deployments use the database's own replication.
+
+    Returns:
+        Path of the replica file
+    """
+    from app import db
+
+    primary = db.engines[None].url
+    replica = db.engines[REPLICA_BIND].url
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        raise ValueError('Replica sync only supports SQLite primary and replica databases')
+
+    db.engines[REPLICA_BIND].dispose()
+    source = sqlite3.connect(primary.database)
+    target = sqlite3.connect(replica.database)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return replica.database
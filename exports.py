@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+from itertools import groupby
+
+from sqlalchemy import select
+
+from app import db
+from models import Student, Faculty, Course, CourseEnrollment, CourseSession, Attendance
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'columnar': ('application/x-ndjson', 'jsonl'),
+}
+
+# Single-letter codes used by the columnar format; '-' marks a session without a record
+STATUS_CODES = {'present': 'P', 'absent': 'A', 'late': 'L', 'excused': 'E'}
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 1000
+
+# Students per row group in the columnar format
+ROW_GROUP_SIZE = 1000
+
+def department_course_ids(department):
+    """Return the IDs of courses taught by faculty in a department."""
+    return [course_id for (course_id,) in db.session.query(Course.id).join(
+        Faculty, Course.faculty_id == Faculty.id
+    ).filter(
+        Faculty.department == department
+    ).order_by(Course.id).all()]
+
+def iter_matrix_rows(course_ids):
+    """
+    Stream the student x session attendance matrix for one or more courses.
+
+    One query walks enrollments joined to every session of the course and the
+    matching attendance record (if any), ordered by course, student and
+    session. Rows come from a server-side cursor and are folded per student,
+    so memory use stays proportional to one course's session count.
+
+    Args:
+        course_ids: Iterable of course IDs
+
+    Yields:
+        (course, sessions, student, statuses) tuples, where course is a
+        (id, course_code, title) tuple, sessions a list of (date, start_time)
+        tuples, student an (id, student_id, full_name) tuple and statuses a
+        list aligned with sessions holding the status or None
+    """
+    statement = select(
+        Course.id, Course.course_code, Course.title,
+        Student.id, Student.student_id, Student.full_name,
+        CourseSession.session_date, CourseSession.start_time,
+        Attendance.status
+    ).select_from(CourseEnrollment).join(
+        Course, CourseEnrollment.course_id == Course.id
+    ).join(
+        Student, CourseEnrollment.student_id == Student.id
+    ).outerjoin(
+        CourseSession, CourseSession.course_id == CourseEnrollment.course_id
+    ).outerjoin(
+        Attendance, (Attendance.session_id == CourseSession.id) &
+                    (Attendance.student_id == CourseEnrollment.student_id)
+    ).where(
+        CourseEnrollment.course_id.in_(list(course_ids))
+    ).order_by(
+        Course.id, Student.id, CourseSession.session_date, CourseSession.start_time, CourseSession.id
+    ).execution_options(yield_per=FETCH_SIZE)
+
+    rows = db.session.execute(statement)
+    for _, student_rows in groupby(rows, key=lambda row: (row[0], row[3])):
+        student_rows = list(student_rows)
+        first = student_rows[0]
+        sessions = [(row[6], row[7]) for row in student_rows if row[6] is not None]
+        statuses = [row[8] for row in student_rows if row[6] is not None]
+        yield first[0:3], sessions, first[3:6], statuses
+
+def _session_label(session):
+    session_date, start_time = session
+    return f"{session_date.isoformat()} {start_time.strftime('%H:%M')}"
+
+def iter_csv(course_ids):
+    """
+    Render the matrix as CSV. Each course starts with its own header row
+    naming the session columns, so several courses can share one file.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    current_course = None
+
+    for index, (course, sessions, student, statuses) in enumerate(iter_matrix_rows(course_ids)):
+        if course[0] != current_course:
+            current_course = course[0]
+            writer.writerow(['course_code', 'student_id', 'name'] + [_session_label(s) for s in sessions])
+        writer.writerow([course[1], student[1], student[2]] + [status or '' for status in statuses])
+
+        if index % 100 == 99:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def iter_columnar(course_ids):
+    """
+    Render the matrix as newline-delimited JSON row groups.
+
+    Each line holds up to ROW_GROUP_SIZE students of one course as parallel
+    column arrays, with each student's statuses packed into one string of
+    STATUS_CODES letters aligned with the 'sessions' column list.
+    """
+    group = None
+
+    def flush(group):
+        return json.dumps(group, separators=(',', ':')) + '\n'
+
+    for course, sessions, student, statuses in iter_matrix_rows(course_ids):
+        if group is None or group['course_id'] != course[0] or len(group['student_id']) >= ROW_GROUP_SIZE:
+            if group is not None:
+                yield flush(group)
+            group = {
+                'course_id': course[0],
+                'course_code': course[1],
+                'course_title': course[2],
+                'sessions': [_session_label(s) for s in sessions],
+                'student_id': [],
+                'name': [],
+                'statuses': []
+            }
+        group['student_id'].append(student[1])
+        group['name'].append(student[2])
+        group['statuses'].append(''.join(STATUS_CODES.get(status, '-') for status in statuses))
+
+    if group is not None:
+        yield flush(group)
+
+def iter_export(course_ids, export_format):
+    """Return a generator of text chunks for the requested export format."""
+    if export_format == 'csv':
+        return iter_csv(course_ids)
+    if export_format == 'columnar':
+        return iter_columnar(course_ids)
+    raise ValueError(f'Unknown export format: {export_format}')
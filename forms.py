@@ -1,8 +1,10 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField
 from wtforms import TextAreaField, IntegerField, DateField, TimeField, FloatField
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional
 from models import User, Student, Faculty
+from recurrence import parse_holidays, ScheduleError
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -71,6 +73,23 @@ class CourseSessionForm(FlaskForm):
     notes = TextAreaField('Notes', validators=[Optional()])
     submit = SubmitField('Save Session')
 
+class TermSessionsForm(FlaskForm):
+    term_start = DateField('Term Start', validators=[DataRequired()])
+    term_end = DateField('Term End', validators=[DataRequired()])
+    holidays = TextAreaField('Holidays', validators=[Optional()])
+    preview = SubmitField('Preview')
+    submit = SubmitField('Create Sessions')
+
+    def validate_term_end(self, term_end):
+        if self.term_start.data and term_end.data and term_end.data < self.term_start.data:
+            raise ValidationError('The term must end on or after its first day.')
+
+    def validate_holidays(self, holidays):
+        try:
+            parse_holidays((holidays.data or '').splitlines())
+        except ScheduleError as exc:
+            raise ValidationError(str(exc))
+
 class AttendanceForm(FlaskForm):
     status = SelectField('Status', choices=[
         ('present', 'Present'), 
@@ -95,3 +114,11 @@ class AbsenceRequestResponseForm(FlaskForm):
     ], validators=[DataRequired()])
     response_notes = TextAreaField('Notes', validators=[Optional()])
     submit = SubmitField('Submit Response')
+
+class RosterImportForm(FlaskForm):
+    kind = SelectField('Roster Type', choices=[
+        ('enrollments', 'Enrollments (student_id, course_code)'),
+        ('students', 'Students (student_id, full_name, department, year_of_study, email)')
+    ], validators=[DataRequired()])
+    roster = FileField('CSV File', validators=[FileRequired(), FileAllowed(['csv'], 'CSV files only')])
+    submit = SubmitField('Import')
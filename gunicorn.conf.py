@@ -0,0 +1,16 @@
+# Gunicorn reads this file from the working directory, e.g. `gunicorn main:app`
+import os
+
+def on_starting(server):
+    # Archive worker files from a previous run before new workers can reuse their pids
+    if os.environ.get('METRICS_DIR'):
+        from metrics import registry
+        registry.configure(os.environ['METRICS_DIR'], 0)
+        registry.archive_stale_workers()
+
+def child_exit(server, worker):
+    # Keep an exited worker's request counts in the shared /metrics totals
+    if os.environ.get('METRICS_DIR'):
+        from metrics import registry
+        registry.configure(os.environ['METRICS_DIR'], 0)
+        registry.mark_process_dead(worker.pid)
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, date, time, timezone
+
+from flask import request, session, current_app
+from sqlalchemy import inspect
+
+class ResponseCache:
+    """
+    Bounded LRU of rendered response bodies for one process.
+
+    Keys embed the ETag they were rendered for, so a course version bump in any
+    worker makes old entries unreachable; invalidate_courses() additionally
+    frees them right away in the worker that did the write.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._keys_by_course = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _maxsize(self):
+        return current_app.config.get('RESPONSE_CACHE_SIZE', 256)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, body, course_ids):
+        maxsize = self._maxsize()
+        if maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (body, tuple(course_ids))
+            self._entries.move_to_end(key)
+            for course_id in course_ids:
+                self._keys_by_course.setdefault(course_id, set()).add(key)
+            while len(self._entries) > maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        _, course_ids = self._entries.pop(key)
+        for course_id in course_ids:
+            keys = self._keys_by_course.get(course_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_course[course_id]
+
+    def invalidate_courses(self, course_ids):
+        with self._lock:
+            for course_id in course_ids:
+                for key in list(self._keys_by_course.get(course_id, ())):
+                    if key in self._entries:
+                        self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_course.clear()
+
+response_cache = ResponseCache()
+
+def make_etag(*parts):
+    """Hash the values a response depends on into an ETag."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:32]
+
+def fingerprint(obj):
+    """Column values of a model object, for ETags of pages that display it."""
+    if obj is None:
+        return None
+    return tuple(
+        (attr.key, getattr(obj, attr.key))
+        for attr in inspect(obj).mapper.column_attrs
+        if attr.key != 'password_hash'
+    )
+
+def last_modified_from(versions, daily=False):
+    """
+    Latest updated_at among (version, updated_at) pairs, or None.
+
+    With daily=True the result is never earlier than the start of today, for
+    responses whose ETag also includes the date; otherwise If-Modified-Since
+    would keep answering 304 with yesterday's body.
+    """
+    timestamps = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+    if daily:
+        # updated_at is naive UTC, so express local midnight the same way
+        midnight = datetime.combine(date.today(), time.min).astimezone(timezone.utc).replace(tzinfo=None)
+        timestamps.append(midnight)
+    return max(timestamps) if timestamps else None
+
+def has_pending_flashes():
+    """Pages showing flashed messages must be rendered fresh and not cached."""
+    return bool(session.get('_flashes'))
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Check the request's conditional headers against the current validators.
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted when no
+    ETag was sent and the response has a Last-Modified time.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= request.if_modified_since
+    return False
+
+def with_validators(response, etag, last_modified=None):
+    """Attach ETag, Last-Modified and a revalidate-every-time Cache-Control header."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
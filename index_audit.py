@@ -0,0 +1,167 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import db
+from db_routing import REPLICA_BIND, replica_configured
+from models import Faculty, Course, CourseEnrollment, CourseSession, AbsenceRequest
+
+# Plan lines that mean a whole table is read row by row
+SQLITE_SCAN = re.compile(r'^SCAN (?!.*USING (?:COVERING )?INDEX)(?!.*(?:SUBQUERY|CONSTANT ROW))(\w+)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+def create_missing_indexes():
+    """
+    Create any index declared on the models that does not exist in the database yet.
+
+    db.create_all() only creates indexes together with new tables, so existing
+    databases need this after index definitions change.
+
+    Returns:
+        List of index names that were checked
+    """
+    names = []
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            names.append(index.name)
+    return names
+
+@contextmanager
+def capture_queries():
+    """
+    Record every SELECT statement sent to the database inside the block,
+    including reads routed to the replica when one is configured.
+
+    Yields:
+        List that is filled with (statement, parameters) tuples
+    """
+    statements = []
+    engines = [db.engine]
+    if replica_configured():
+        engines.append(db.engines[REPLICA_BIND])
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def explain(statement, parameters):
+    """
+    Run EXPLAIN QUERY PLAN (SQLite) or EXPLAIN (Postgres) for a statement.
+
+    Returns:
+        Tuple of (plan lines, list of tables read with a full scan)
+    """
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as conn:
+        if dialect == 'sqlite':
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+            plan = [row[-1] for row in rows]
+            pattern = SQLITE_SCAN
+        elif dialect == 'postgresql':
+            rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).all()
+            plan = [row[0] for row in rows]
+            pattern = POSTGRES_SCAN
+        else:
+            raise ValueError(f'EXPLAIN is not supported for the {dialect} dialect')
+
+    scans = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            scans.append(match.group(1))
+    return plan, scans
+
+def _sample_route_values():
+    """Pick existing rows to fill in the URL parameters of the audited routes."""
+    course = Course.query.join(CourseSession).first() or Course.query.first()
+    if not course:
+        return None
+
+    faculty = Faculty.query.get(course.faculty_id)
+    enrollment = CourseEnrollment.query.filter_by(course_id=course.id).first()
+    session = CourseSession.query.filter_by(course_id=course.id).first()
+    absence_request = AbsenceRequest.query.filter_by(course_id=course.id).first()
+
+    return {
+        'faculty_user_id': faculty.user_id,
+        'student_user_id': enrollment.student.user_id if enrollment else None,
+        'args': {
+            'course_id': course.id,
+            'session_id': session.id if session else None,
+            'request_id': absence_request.id if absence_request else None,
+            'enrollment_id': enrollment.id if enrollment else None,
+        }
+    }
+
+def _get_as_user(app, path, user_id):
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = str(user_id)
+        flask_session['_fresh'] = True
+    response = client.get(path)
+    # Read streamed bodies (exports) here so their queries run on this thread
+    response.get_data()
+    response.close()
+    return response
+
+def audit_route_queries(app):
+    """
+    Issue a GET to every route as a sample faculty and student user, then
+    EXPLAIN each SELECT the handlers ran and flag full table scans.
+
+    Only GET handlers are exercised so the audit never writes to the database;
+    POST handlers share their lookups with the matching GET handlers.
+
+    Args:
+        app: Flask application whose routes should be audited
+
+    Returns:
+        List of finding dictionaries with endpoints, statement, plan and scans
+    """
+    samples = _sample_route_values()
+    if samples is None:
+        return []
+
+    user_ids = [user_id for user_id in (samples['faculty_user_id'], samples['student_user_id']) if user_id]
+    findings = {}
+
+    for rule in app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint == 'static':
+            continue
+        if any(samples['args'].get(argument) is None for argument in rule.arguments):
+            continue
+
+        path = rule.build({argument: samples['args'][argument] for argument in rule.arguments})[1]
+
+        for user_id in user_ids:
+            # Requests run on a worker thread so each one gets a fresh app context
+            # (and login state) instead of reusing the caller's
+            with capture_queries() as statements:
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    executor.submit(_get_as_user, app, path, user_id).result()
+
+            for statement, parameters in statements:
+                finding = findings.get(statement)
+                if finding is None:
+                    plan, scans = explain(statement, parameters)
+                    finding = findings[statement] = {
+                        'statement': statement,
+                        'endpoints': [],
+                        'plan': plan,
+                        'scans': scans
+                    }
+                if rule.endpoint not in finding['endpoints']:
+                    finding['endpoints'].append(rule.endpoint)
+
+    return list(findings.values())
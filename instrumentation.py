@@ -0,0 +1,200 @@
+import json
+import logging
+import re
+import threading
+import time
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('attendance.requests')
+
+# Slowest statements kept per request and per endpoint
+SLOWEST_KEPT = 5
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_sql(statement):
+    """
+    Reduce a SQL statement to its shape so repeats of the same query group together.
+
+    Literals become ?, IN lists of any length become (?...), and whitespace is collapsed.
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    return _PLACEHOLDER_LIST.sub('(?...)', statement)
+
+class RequestStats:
+    """SQL statements issued while handling one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.statements = {}
+
+    def record(self, statement, seconds):
+        self.query_count += 1
+        self.db_seconds += seconds
+        shape = normalize_sql(statement)
+        count, total, slowest = self.statements.get(shape, (0, 0.0, 0.0))
+        self.statements[shape] = (count + 1, total + seconds, max(slowest, seconds))
+
+    def slowest(self, limit=SLOWEST_KEPT):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)
+        return [
+            {'sql': shape, 'count': count, 'total_ms': round(total * 1000, 3), 'max_ms': round(slowest * 1000, 3)}
+            for shape, (count, total, slowest) in ranked[:limit]
+        ]
+
+    def repeated(self, threshold):
+        """Statements run at least threshold times in this request, the usual sign of an N+1 loop."""
+        return [
+            {'sql': shape, 'count': count}
+            for shape, (count, _, _) in sorted(self.statements.items(), key=lambda item: -item[1][0])
+            if count >= threshold
+        ]
+
+class EndpointMetrics:
+    """Per-endpoint totals for this process, shown on /admin/metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def add(self, endpoint, stats, duration):
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {
+                'endpoint': endpoint,
+                'requests': 0,
+                'total_seconds': 0.0,
+                'max_seconds': 0.0,
+                'db_seconds': 0.0,
+                'queries': 0,
+                'max_queries': 0,
+                'statements': {}
+            })
+            entry['requests'] += 1
+            entry['total_seconds'] += duration
+            entry['max_seconds'] = max(entry['max_seconds'], duration)
+            entry['db_seconds'] += stats.db_seconds
+            entry['queries'] += stats.query_count
+            entry['max_queries'] = max(entry['max_queries'], stats.query_count)
+            for shape, (count, total, slowest) in stats.statements.items():
+                seen = entry['statements'].get(shape, (0, 0.0, 0.0))
+                entry['statements'][shape] = (seen[0] + count, seen[1] + total, max(seen[2], slowest))
+
+    def snapshot(self):
+        """
+        Returns:
+            List of per-endpoint dictionaries with averages and the slowest
+            statement shapes, busiest database time first
+        """
+        with self._lock:
+            entries = [dict(entry, statements=dict(entry['statements'])) for entry in self._endpoints.values()]
+
+        rows = []
+        for entry in entries:
+            requests = entry['requests']
+            statements = sorted(entry['statements'].items(), key=lambda item: item[1][1], reverse=True)
+            rows.append({
+                'endpoint': entry['endpoint'],
+                'requests': requests,
+                'avg_ms': round(entry['total_seconds'] / requests * 1000, 2),
+                'max_ms': round(entry['max_seconds'] * 1000, 2),
+                'avg_db_ms': round(entry['db_seconds'] / requests * 1000, 2),
+                'db_ms': round(entry['db_seconds'] * 1000, 2),
+                'avg_queries': round(entry['queries'] / requests, 1),
+                'max_queries': entry['max_queries'],
+                'statements': [
+                    {'sql': shape, 'count': count, 'per_request': round(count / requests, 1),
+                     'total_ms': round(total * 1000, 2), 'max_ms': round(slowest * 1000, 2)}
+                    for shape, (count, total, slowest) in statements[:SLOWEST_KEPT]
+                ]
+            })
+        rows.sort(key=lambda row: row['db_ms'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+endpoint_metrics = EndpointMetrics()
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    started = conn.info.get('query_started')
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+def _handle_error(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+def _start_request():
+    g._request_stats = RequestStats()
+
+def _finish_request(response):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return response
+
+    from flask import current_app
+    config = current_app.config
+    duration = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    endpoint_metrics.add(endpoint, stats, duration)
+
+    if config.get('SERVER_TIMING_HEADER', True):
+        response.headers.add('Server-Timing', f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.query_count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={(duration - stats.db_seconds) * 1000:.2f}')
+
+    slow = duration * 1000 >= config.get('SLOW_REQUEST_MS', 500)
+    chatty = stats.query_count >= config.get('SLOW_REQUEST_QUERIES', 50)
+    if slow or chatty:
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'reason': 'duration' if slow else 'query_count',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_ms': round(stats.db_seconds * 1000, 2),
+            'query_count': stats.query_count,
+            'slowest': stats.slowest(),
+            'repeated': stats.repeated(config.get('REPEATED_QUERY_THRESHOLD', 10))
+        }))
+    return response
+
+def init_instrumentation(app):
+    """
+    Record query counts and database time for every request.
+
+    Statement timing comes from engine events on every Engine (including any
+    extra binds), request boundaries from Flask hooks. Disabled when the
+    SQL_INSTRUMENTATION setting is false.
+    """
+    if not app.config.get('SQL_INSTRUMENTATION', True):
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,387 @@
+import atexit
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+from flask import g, request, current_app, Response, abort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Default latency buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# File in the metrics directory holding totals of workers that have exited
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = '.lock'
+
+class Metric:
+    """
+    A named family of samples keyed by label values.
+
+    Values live in memory; MetricsRegistry writes them to the shared directory
+    so that every worker's samples can be summed when /metrics is scraped.
+    """
+
+    type = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._registry = registry
+        registry.add(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            samples = self._registry.values.setdefault(self.name, {})
+            samples[key] = samples.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Gauge summed across live workers only; values of exited workers are dropped."""
+
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            samples = self._registry.values.setdefault(self.name, {})
+            samples[key] = samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=REQUEST_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, documentation, labels)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            samples = self._registry.values.setdefault(self.name, {})
+            # Per-bucket (not cumulative) counts followed by the sum
+            sample = samples.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[index] += 1
+                    break
+            else:
+                sample[len(self.buckets)] += 1
+            sample[-1] += value
+
+def _merge(target, metric, key, value):
+    if metric.type == 'histogram':
+        current = target.get(key)
+        target[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+    else:
+        target[key] = target.get(key, 0) + value
+
+class MetricsRegistry:
+    """
+    Metrics for this process, optionally shared with other workers through a
+    directory.
+
+    Without a directory, /metrics shows this process only. With one (the
+    METRICS_DIR setting), each worker writes its samples to <pid>.json at most
+    every flush_interval seconds, and a scrape sums the files of all workers.
+    Counters and histograms of workers that exited are folded into
+    archive.json by mark_process_dead(), so totals never go backwards.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.values = {}
+        self.directory = None
+        self.flush_interval = 1.0
+        self._pid = os.getpid()
+        self._flushed_at = 0.0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+
+    def configure(self, directory, flush_interval):
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _after_fork(self):
+        # A worker forked from a preloaded master starts from zero, not the master's
+        # values, before it handles any request; the lock may have been held mid-fork
+        self.lock = threading.Lock()
+        self.values = {}
+        self._pid = os.getpid()
+        self._flushed_at = 0.0
+
+    def _snapshot(self):
+        with self.lock:
+            return {
+                name: {key: list(value) if isinstance(value, list) else value for key, value in samples.items()}
+                for name, samples in self.values.items()
+            }
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _locked(self):
+        handle = open(self._path(LOCK_FILE), 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def flush(self, force=False):
+        """Write this worker's samples to the shared directory."""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_interval:
+            return
+        self._flushed_at = now
+
+        payload = {name: [[list(key), value] for key, value in samples.items()]
+                   for name, samples in self._snapshot().items()}
+        path = self._path(f'{self._pid}.json')
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(payload, handle)
+        os.replace(temporary, path)
+
+    def _read(self, filename):
+        try:
+            with open(self._path(filename)) as handle:
+                payload = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        return {name: {tuple(key): value for key, value in samples} for name, samples in payload.items()}
+
+    def mark_process_dead(self, pid):
+        """
+        Fold an exited worker's counters and histograms into the archive and
+        drop its gauges. Called from gunicorn's child_exit hook.
+        """
+        if not self.directory:
+            return
+        lock = self._locked()
+        try:
+            values = self._read(f'{pid}.json')
+            archive = self._read(ARCHIVE_FILE)
+            for name, samples in values.items():
+                metric = self.metrics.get(name)
+                if metric is None or metric.type == 'gauge':
+                    continue
+                for key, value in samples.items():
+                    _merge(archive.setdefault(name, {}), metric, key, value)
+            payload = {name: [[list(key), value] for key, value in samples.items()]
+                       for name, samples in archive.items()}
+            temporary = self._path(ARCHIVE_FILE + '.tmp')
+            with open(temporary, 'w') as handle:
+                json.dump(payload, handle)
+            os.replace(temporary, self._path(ARCHIVE_FILE))
+            try:
+                os.remove(self._path(f'{pid}.json'))
+            except FileNotFoundError:
+                pass
+        finally:
+            lock.close()
+
+    def archive_stale_workers(self):
+        """
+        Fold worker files left over from a previous run into the archive.
+        Called from gunicorn's on_starting hook, before any worker is forked,
+        so a new worker that reuses an old pid never shows that pid's samples.
+        """
+        if not self.directory:
+            return
+        for filename in os.listdir(self.directory):
+            stem, extension = os.path.splitext(filename)
+            if extension == '.json' and stem.isdigit():
+                self.mark_process_dead(int(stem))
+            elif filename.endswith('.json.tmp'):
+                os.remove(self._path(filename))
+
+    def collect(self):
+        """
+        Returns:
+            Dictionary mapping metric name to {label values: value}, summed
+            over every worker sharing the directory
+        """
+        self.flush(force=True)
+        if not self.directory:
+            return self._snapshot()
+
+        totals = {}
+        lock = self._locked()
+        try:
+            sources = [(None, ARCHIVE_FILE)]
+            for filename in os.listdir(self.directory):
+                stem, extension = os.path.splitext(filename)
+                if extension == '.json' and stem.isdigit():
+                    sources.append((int(stem), filename))
+            for pid, filename in sources:
+                for name, samples in self._read(filename).items():
+                    metric = self.metrics.get(name)
+                    if metric is None or (metric.type == 'gauge' and not _is_alive(pid)):
+                        continue
+                    for key, value in samples.items():
+                        _merge(totals.setdefault(name, {}), metric, key, value)
+        finally:
+            lock.close()
+        return totals
+
+    def render(self):
+        """Format all metrics in the Prometheus text exposition format."""
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            samples = values.get(name, {})
+            if not samples and not metric.labels:
+                samples = {(): [0] * (len(metric.buckets) + 2) if metric.type == 'histogram' else 0}
+            for key, value in sorted(samples.items()):
+                labels = list(zip(metric.labels, key))
+                if metric.type == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (math.inf,), value):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else repr(bound)
+                        lines.append(f'{name}_bucket{_format_labels(labels + [("le", le)])} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _is_alive(pid):
+    if pid is None or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in labels
+    )
+    return '{' + escaped + '}'
+
+registry = MetricsRegistry()
+
+requests_total = Counter(registry, 'http_requests_total', 'Requests handled, by endpoint, method and status.',
+                         ('endpoint', 'method', 'status'))
+request_duration = Histogram(registry, 'http_request_duration_seconds', 'Time to handle a request, by endpoint.',
+                             ('endpoint',))
+requests_in_flight = Gauge(registry, 'http_requests_in_flight', 'Requests currently being handled.')
+pool_checkout_wait = Histogram(registry, 'db_pool_checkout_wait_seconds',
+                               'Time spent waiting for a database connection from the pool.',
+                               buckets=CHECKOUT_BUCKETS)
+attendance_writes = Counter(registry, 'attendance_records_written_total',
+                            'Attendance records inserted or updated in committed transactions, by status.',
+                            ('status',))
+
+def count_attendance_writes(records):
+    """
+    Count attendance records written in the current transaction.
+
+    The counts are added to attendance_records_written_total when the
+    transaction commits and discarded if it rolls back.
+
+    Args:
+        records: List of dictionaries with a status key
+    """
+    from app import db
+
+    pending = db.session().info.setdefault('attendance_writes', {})
+    for record in records:
+        pending[record['status']] = pending.get(record['status'], 0) + 1
+
+def _commit_attendance_writes(session):
+    for status, count in session.info.pop('attendance_writes', {}).items():
+        attendance_writes.inc(count, status=status)
+
+def _discard_attendance_writes(session):
+    session.info.pop('attendance_writes', None)
+
+event.listen(Session, 'after_commit', _commit_attendance_writes)
+event.listen(Session, 'after_rollback', _discard_attendance_writes)
+
+def instrument_pool(engine):
+    """Time every connection checkout from an engine's pool."""
+    pool = engine.pool
+    if getattr(pool, '_checkout_timed', False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    pool._checkout_timed = True
+
+def _start_request():
+    g._metrics_started = time.perf_counter()
+    requests_in_flight.inc()
+
+def _record_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+def _finish_request(exception):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return
+    requests_in_flight.dec()
+    endpoint = request.endpoint or 'unmatched'
+    status = g.pop('_metrics_status', 500)
+    request_duration.observe(time.perf_counter() - started, endpoint=endpoint)
+    requests_total.inc(endpoint=endpoint, method=request.method, status=status)
+    registry.flush()
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app):
+    """
+    Collect request, pool and attendance write metrics and serve them on /metrics.
+
+    Must be called inside an app context so the engine's pool can be
+    instrumented.
+    """
+    from app import db
+
+    registry.configure(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_INTERVAL', 1.0))
+    for engine in db.engines.values():
+        instrument_pool(engine)
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    atexit.register(registry.flush, force=True)
@@ -1,7 +1,7 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from app import db
+from passwords import hash_password, verify_password, password_needs_rehash
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,19 +15,22 @@ class User(UserMixin, db.Model):
     faculty = db.relationship('Faculty', backref='user', uselist=False, cascade="all, delete-orphan")
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     student_id = db.Column(db.String(20), unique=True, nullable=False)
-    full_name = db.Column(db.String(100), nullable=False)
+    full_name = db.Column(db.String(100), nullable=False, index=True)
     department = db.Column(db.String(100), nullable=False)
     year_of_study = db.Column(db.Integer, nullable=False)
     phone = db.Column(db.String(15), nullable=True)
@@ -36,13 +39,26 @@ class Student(db.Model):
     enrollments = db.relationship('CourseEnrollment', backref='student', lazy=True, cascade="all, delete-orphan")
     attendance_records = db.relationship('Attendance', backref='student', lazy=True, cascade="all, delete-orphan")
     absence_requests = db.relationship('AbsenceRequest', backref='student', lazy=True, cascade="all, delete-orphan")
+    attendance_rollups = db.relationship('AttendanceRollup', backref='student', lazy=True, cascade="all, delete-orphan")
+    notifications = db.relationship('NotificationOutbox', backref='student', lazy=True, cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Enroll picker search matches case-insensitive prefixes of lower(column);
+        # text_pattern_ops lets PostgreSQL serve LIKE 'abc%' from the index
+        db.Index('ix_student_full_name_lower', db.func.lower(full_name).label('full_name_lower'),
+                 postgresql_ops={'full_name_lower': 'text_pattern_ops'}),
+        db.Index('ix_student_student_id_lower', db.func.lower(student_id).label('student_id_lower'),
+                 postgresql_ops={'student_id_lower': 'text_pattern_ops'}),
+        db.Index('ix_student_department_lower', db.func.lower(department).label('department_lower'),
+                 postgresql_ops={'department_lower': 'text_pattern_ops'}),
+    )
     
     def __repr__(self):
         return f'<Student {self.student_id}>'
 
 class Faculty(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     faculty_id = db.Column(db.String(20), unique=True, nullable=False)
     full_name = db.Column(db.String(100), nullable=False)
     department = db.Column(db.String(100), nullable=False)
@@ -59,7 +75,7 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     course_code = db.Column(db.String(20), unique=True, nullable=False)
     title = db.Column(db.String(100), nullable=False)
-    faculty_id = db.Column(db.Integer, db.ForeignKey('faculty.id'), nullable=False)
+    faculty_id = db.Column(db.Integer, db.ForeignKey('faculty.id'), nullable=False, index=True)
     schedule = db.Column(db.String(200), nullable=False)
     location = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -68,6 +84,9 @@ class Course(db.Model):
     # Relationships
     enrollments = db.relationship('CourseEnrollment', backref='course', lazy=True, cascade="all, delete-orphan")
     sessions = db.relationship('CourseSession', backref='course', lazy=True, cascade="all, delete-orphan")
+    attendance_rollups = db.relationship('AttendanceRollup', backref='course', lazy=True, cascade="all, delete-orphan")
+    notifications = db.relationship('NotificationOutbox', backref='course', lazy=True, cascade="all, delete-orphan")
+    data_version = db.relationship('CourseDataVersion', backref='course', uselist=False, lazy=True, cascade="all, delete-orphan")
     
     def __repr__(self):
         return f'<Course {self.course_code}>'
@@ -80,6 +99,8 @@ class CourseEnrollment(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('student_id', 'course_id', name='unique_enrollment'),
+        # Roster lookups filter by course only; the unique constraint covers lookups by student
+        db.Index('ix_course_enrollment_course', 'course_id'),
     )
     
     def __repr__(self):
@@ -97,6 +118,14 @@ class CourseSession(db.Model):
     # Relationships
     attendance_records = db.relationship('Attendance', backref='session', lazy=True, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Session lists, date-range lookups and today's sessions all filter by course then date;
+        # attendance history pages through (session_date, id) in index order
+        db.Index('ix_course_session_course_date_id', 'course_id', 'session_date', 'id'),
+        # The timetable index loads every course's sessions within a date window
+        db.Index('ix_course_session_date', 'session_date'),
+    )
+    
     def __repr__(self):
         return f'<CourseSession {self.course_id} on {self.session_date}>'
 
@@ -110,6 +139,8 @@ class Attendance(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('student_id', 'session_id', name='unique_attendance'),
+        # Per-session roster and status breakdowns
+        db.Index('ix_attendance_session_status', 'session_id', 'status'),
     )
     
     def __repr__(self):
@@ -129,5 +160,104 @@ class AbsenceRequest(db.Model):
     responded_at = db.Column(db.DateTime, nullable=True)
     course = db.relationship('Course')
     
+    __table_args__ = (
+        db.Index('ix_absence_request_student_status', 'student_id', 'status'),
+        db.Index('ix_absence_request_course_status', 'course_id', 'status'),
+        # Request lists page through (request_date, id), newest first
+        db.Index('ix_absence_request_student_date', 'student_id', 'request_date', 'id'),
+        db.Index('ix_absence_request_date', 'request_date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<AbsenceRequest {self.student_id} for {self.from_date} to {self.to_date}: {self.status}>'
+
+class AttendanceRollup(db.Model):
+    # Per-student-per-course counters maintained alongside Attendance writes (see rollups.py)
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    session_count = db.Column(db.Integer, default=0, nullable=False)
+    recorded_count = db.Column(db.Integer, default=0, nullable=False)
+    present_count = db.Column(db.Integer, default=0, nullable=False)
+    absent_count = db.Column(db.Integer, default=0, nullable=False)
+    late_count = db.Column(db.Integer, default=0, nullable=False)
+    excused_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_rollup'),
+        db.Index('ix_attendance_rollup_course', 'course_id'),
+    )
+    
+    def __repr__(self):
+        return f'<AttendanceRollup {self.student_id}-{self.course_id}>'
+
+class NotificationOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)  # e.g. 'low_attendance'
+    attendance_percentage = db.Column(db.Float, nullable=True)
+    min_attendance_percent = db.Column(db.Float, nullable=True)
+    status = db.Column(db.String(10), default='pending', nullable=False)  # 'pending', 'sent', 'skipped', 'failed'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Worker polling and per-student deduplication
+        db.Index('ix_notification_outbox_status_available', 'status', 'available_at'),
+        db.Index('ix_notification_outbox_dedupe', 'student_id', 'course_id', 'kind', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<NotificationOutbox {self.kind} {self.student_id}-{self.course_id}: {self.status}>'
+
+class CheckinDevice(db.Model):
+    # A card reader or QR kiosk allowed to post check-ins (see checkins.py)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 of the bearer token
+    location = db.Column(db.String(100), nullable=True)  # Matches Course.location for scans without a course
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<CheckinDevice {self.name}>'
+
+class CheckinEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('checkin_device.id'), nullable=False)
+    idempotency_key = db.Column(db.String(100), nullable=False)
+    student_number = db.Column(db.String(20), nullable=False)  # Student.student_id read from the card
+    # Scans for a deleted session lose their target and are matched by course code or device location
+    session_id = db.Column(db.Integer, db.ForeignKey('course_session.id', ondelete='SET NULL'), nullable=True)
+    course_code = db.Column(db.String(20), nullable=True)
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    status = db.Column(db.String(10), default='pending', nullable=False)  # 'pending', 'applied', 'ignored', 'rejected'
+    attendance_status = db.Column(db.String(10), nullable=True)
+    error = db.Column(db.String(200), nullable=True)
+    applied_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Replays of the same scan from the same device are dropped by this constraint
+        db.UniqueConstraint('device_id', 'idempotency_key', name='unique_checkin_key'),
+        db.Index('ix_checkin_event_status', 'status', 'id'),
+        db.Index('ix_checkin_event_received', 'received_at'),
+    )
+    
+    def __repr__(self):
+        return f'<CheckinEvent {self.device_id}:{self.idempotency_key} {self.status}>'
+
+class CourseDataVersion(db.Model):
+    # Bumped whenever a course's attendance, sessions, enrollments or absence requests change (see course_versions.py)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<CourseDataVersion {self.course_id} v{self.version}>'
@@ -0,0 +1,281 @@
+import json
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app import db
+from models import Student, Course, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+LOW_ATTENDANCE = 'low_attendance'
+
+# Registered transport factories, keyed by the scheme used in NOTIFICATION_TRANSPORT
+TRANSPORTS = {}
+
+def register_transport(name, factory):
+    """
+    Register a notification transport.
+
+    Args:
+        name: Scheme used in the NOTIFICATION_TRANSPORT setting, e.g. 'smtp'
+        factory: Callable taking the text after 'name:' (or None) and returning an
+                 object with a send(message) method
+    """
+    TRANSPORTS[name] = factory
+
+def get_transport(setting):
+    """
+    Build the transport described by a NOTIFICATION_TRANSPORT setting such as
+    'stdout' or 'file:/var/log/attendance/notifications.log'.
+    """
+    name, _, argument = setting.partition(':')
+    if name not in TRANSPORTS:
+        raise ValueError(f'Unknown notification transport: {name}')
+    return TRANSPORTS[name](argument or None)
+
+class LogTransport:
+    """Writes one JSON line per notification to stdout or a file, for local use and testing."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps(message, default=str)
+        with self._lock:
+            if self.path:
+                with open(self.path, 'a') as handle:
+                    handle.write(line + '\n')
+            else:
+                sys.stdout.write(line + '\n')
+                sys.stdout.flush()
+
+register_transport('stdout', lambda argument: LogTransport())
+register_transport('file', lambda argument: LogTransport(argument))
+
+def queue_low_attendance_notifications(course, warnings):
+    """
+    Add low attendance warnings to the outbox in the caller's transaction.
+
+    A student who already has a pending warning for the course gets that row
+    updated with the latest percentage instead of a second row.
+
+    Args:
+        course: Course object the warnings are about
+        warnings: Dictionary mapping student ID to current attendance percentage
+    """
+    if not warnings:
+        return
+
+    pending = NotificationOutbox.query.filter(
+        NotificationOutbox.course_id == course.id,
+        NotificationOutbox.kind == LOW_ATTENDANCE,
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.student_id.in_(list(warnings))
+    ).all()
+
+    for notification in pending:
+        notification.attendance_percentage = warnings[notification.student_id]
+        notification.min_attendance_percent = course.min_attendance_percent
+
+    queued = {notification.student_id for notification in pending}
+    db.session.add_all([
+        NotificationOutbox(
+            student_id=student_id,
+            course_id=course.id,
+            kind=LOW_ATTENDANCE,
+            attendance_percentage=percentage,
+            min_attendance_percent=course.min_attendance_percent
+        )
+        for student_id, percentage in warnings.items()
+        if student_id not in queued
+    ])
+
+def withdraw_low_attendance_notifications(course, student_ids):
+    """
+    Mark pending low attendance warnings as skipped for students whose
+    attendance is no longer below the course minimum. Runs in the caller's
+    transaction.
+
+    Args:
+        course: Course object the warnings are about
+        student_ids: Iterable of student IDs
+    """
+    student_ids = list(student_ids)
+    if not student_ids:
+        return
+
+    NotificationOutbox.query.filter(
+        NotificationOutbox.course_id == course.id,
+        NotificationOutbox.kind == LOW_ATTENDANCE,
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.student_id.in_(student_ids)
+    ).update({'status': 'skipped'}, synchronize_session=False)
+
+def build_message(notification, student, course):
+    """Render an outbox row into the message handed to transports."""
+    return {
+        'id': notification.id,
+        'kind': notification.kind,
+        'student_id': student.student_id,
+        'student_name': student.full_name,
+        'course_code': course.course_code,
+        'course_title': course.title,
+        'attendance_percentage': notification.attendance_percentage,
+        'min_attendance_percent': notification.min_attendance_percent,
+        'text': (f"Student {student.full_name} ({student.student_id}) has attendance of "
+                 f"{notification.attendance_percentage:.2f}% in {course.title}, which is below "
+                 f"the required minimum of {notification.min_attendance_percent}%.")
+    }
+
+class RateLimiter:
+    """Token bucket allowing `rate` sends per second on average."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Sends run on pool threads, so refill and take under a lock; sleep outside it
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class NotificationWorker:
+    """
+    Drains the notification outbox in batches and hands messages to a transport.
+
+    Sends within a batch run on a thread pool. Warnings for a student and course
+    that already got one within the cooldown window are marked skipped, and
+    failed sends are retried with backoff until max_attempts.
+    """
+
+    def __init__(self, transport, batch_size=100, max_workers=4, rate_limit=None,
+                 cooldown=timedelta(hours=24), max_attempts=5, retry_delay=timedelta(minutes=1)):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            get_transport(config.get('NOTIFICATION_TRANSPORT', 'stdout')),
+            batch_size=config.get('NOTIFICATION_BATCH_SIZE', 100),
+            max_workers=config.get('NOTIFICATION_WORKERS', 4),
+            rate_limit=config.get('NOTIFICATION_RATE_LIMIT'),
+            cooldown=timedelta(hours=config.get('NOTIFICATION_COOLDOWN_HOURS', 24))
+        )
+
+    def _claim_batch(self, now):
+        # SKIP LOCKED lets several workers drain the same outbox on PostgreSQL;
+        # SQLite ignores the locking clause and serializes writers instead
+        return NotificationOutbox.query.filter(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.available_at <= now
+        ).order_by(
+            NotificationOutbox.available_at, NotificationOutbox.id
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+    def _recently_sent(self, batch, now):
+        sent = NotificationOutbox.query.with_entities(
+            NotificationOutbox.student_id, NotificationOutbox.course_id, NotificationOutbox.kind
+        ).filter(
+            NotificationOutbox.status == 'sent',
+            NotificationOutbox.sent_at >= now - self.cooldown,
+            NotificationOutbox.student_id.in_({notification.student_id for notification in batch})
+        ).all()
+        return set(sent)
+
+    def _send(self, message):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        self.transport.send(message)
+
+    def drain_once(self):
+        """
+        Deliver one batch of due notifications.
+
+        Returns:
+            Number of outbox rows processed
+        """
+        now = datetime.utcnow()
+        batch = self._claim_batch(now)
+        if not batch:
+            db.session.rollback()
+            return 0
+
+        recently_sent = self._recently_sent(batch, now) if self.cooldown else set()
+        students = {student.id: student for student in Student.query.filter(
+            Student.id.in_({notification.student_id for notification in batch})
+        ).all()}
+        courses = {course.id: course for course in Course.query.filter(
+            Course.id.in_({notification.course_id for notification in batch})
+        ).all()}
+
+        to_send = []
+        for notification in batch:
+            key = (notification.student_id, notification.course_id, notification.kind)
+            if key in recently_sent:
+                notification.status = 'skipped'
+                continue
+            recently_sent.add(key)
+            message = build_message(notification, students[notification.student_id],
+                                    courses[notification.course_id])
+            to_send.append((notification, message))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [(notification, executor.submit(self._send, message))
+                       for notification, message in to_send]
+            for notification, future in futures:
+                notification.attempts += 1
+                try:
+                    future.result()
+                except Exception as error:
+                    logger.warning('Notification %s failed: %s', notification.id, error)
+                    notification.last_error = str(error)
+                    if notification.attempts >= self.max_attempts:
+                        notification.status = 'failed'
+                    else:
+                        notification.available_at = now + self.retry_delay * notification.attempts
+                else:
+                    notification.status = 'sent'
+                    notification.sent_at = datetime.utcnow()
+
+        db.session.commit()
+        return len(batch)
+
+    def run(self, poll_interval=5.0, stop_event=None):
+        """
+        Keep draining the outbox until stop_event is set.
+
+        Full batches are followed immediately by the next one; otherwise the
+        worker sleeps for poll_interval seconds.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Draining the notification outbox failed')
+                processed = 0
+            if processed < self.batch_size:
+                stop_event.wait(poll_interval)
@@ -0,0 +1,98 @@
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(sort_value, row_id):
+    """Encode the sort key of the last row on a page as an opaque URL-safe cursor."""
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_column):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor: Cursor string from the request
+        sort_column: Column the cursor's sort value belongs to, used to restore dates
+
+    Returns:
+        Tuple of (sort value, row ID)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        python_type = sort_column.type.python_type
+        if python_type in (date, datetime):
+            sort_value = python_type.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (TypeError, ValueError, NotImplementedError) as error:
+        raise ValueError('Invalid page cursor') from error
+
+def keyset_page(query, sort_column, id_column, key, cursor=None, per_page=DEFAULT_PAGE_SIZE, descending=True):
+    """
+    Fetch one page of a query ordered by (sort_column, id_column) using keyset pagination.
+
+    Instead of OFFSET, the next page starts after the last row seen, so the
+    database seeks straight to it through an index on the sort columns and
+    page cost does not grow with the length of the history.
+
+    Args:
+        query: Query to paginate, already filtered
+        sort_column: Column to order by, e.g. AbsenceRequest.request_date
+        id_column: Unique column breaking ties, e.g. AbsenceRequest.id
+        key: Function returning (sort value, id) for a result row
+        cursor: Cursor from a previous page, or None for the first page
+        per_page: Number of rows per page
+        descending: Whether newest rows come first
+
+    Returns:
+        Dictionary with the page's items, the cursor it started from and
+        next_cursor (None on the last page)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_column)
+        if descending:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_column > sort_value,
+                and_(sort_column == sort_value, id_column > row_id)
+            ))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+
+    # One extra row tells whether another page follows
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = encode_cursor(*key(items[-1])) if len(rows) > per_page else None
+
+    return {'items': items, 'cursor': cursor, 'next_cursor': next_cursor}
+
+def paginate_request(query, sort_column, id_column, key, descending=True):
+    """Run keyset_page with the cursor and per_page arguments of the current request."""
+    per_page = request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    return keyset_page(query, sort_column, id_column, key,
+                       cursor=request.args.get('cursor'),
+                       per_page=per_page,
+                       descending=descending)
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from metrics import registry, Counter, Gauge, Histogram
+
+# Seconds buckets for hashing and queue wait; a scrypt hash takes tens of milliseconds
+HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+hash_duration = Histogram(registry, 'password_hash_seconds', 'Time spent hashing or verifying a password.',
+                          ('operation',), buckets=HASH_BUCKETS)
+hash_wait = Histogram(registry, 'password_hash_wait_seconds',
+                      'Time a password hash waited in the queue before a hashing thread took it.',
+                      ('operation',), buckets=HASH_BUCKETS)
+hash_queue_depth = Gauge(registry, 'password_hash_queue_depth', 'Password hashes running or waiting to run.')
+hash_rejected = Counter(registry, 'password_hash_rejected_total',
+                        'Password hashes refused because the queue was full or the wait timed out, by reason.',
+                        ('operation', 'reason'))
+
+class PasswordHashBusy(Exception):
+    """Raised when the password hashing queue is full or a hash waited too long."""
+
+class HashPool:
+    """
+    Runs password hashes on a fixed number of threads with a bounded queue.
+
+    hashlib's scrypt and PBKDF2 release the GIL, so hashing on a few threads
+    caps the CPU that logins and registrations can take from a worker at
+    roughly that many cores, however many requests arrive at once. Requests
+    beyond workers + queue_size are refused immediately, and a request that
+    waits longer than timeout gives up, instead of queueing without bound.
+    With workers set to 0 hashes run in the request thread as before.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash') \
+            if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers > 0 else None
+
+    def run(self, operation, function, *args):
+        """
+        Run function(*args) on the pool and wait for its result.
+
+        Args:
+            operation: 'hash' or 'verify', used as a metric label
+
+        Raises:
+            PasswordHashBusy: If the queue is full or the result took longer
+                              than timeout
+        """
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            hash_wait.observe(started - queued_at, operation=operation)
+            try:
+                return function(*args)
+            finally:
+                hash_duration.observe(time.perf_counter() - started, operation=operation)
+
+        if self._executor is None:
+            return job()
+
+        if not self._slots.acquire(blocking=False):
+            hash_rejected.inc(operation=operation, reason='queue_full')
+            raise PasswordHashBusy('Too many passwords are being checked right now')
+        hash_queue_depth.inc()
+
+        def release(future):
+            hash_queue_depth.dec()
+            self._slots.release()
+
+        future = self._executor.submit(job)
+        future.add_done_callback(release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # A hash that already started runs to completion and frees its slot then
+            future.cancel()
+            hash_rejected.inc(operation=operation, reason='timeout')
+            raise PasswordHashBusy('Timed out waiting for a password hashing thread')
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+def get_hash_pool():
+    """Return this process's hashing pool for the current app, creating it on first use."""
+    # Keyed by process so workers forked from a preloaded master start their own threads
+    entry = current_app.extensions.get('password_hash_pool')
+    if entry is None or entry[0] != os.getpid():
+        config = current_app.config
+        pool = HashPool(config.get('PASSWORD_HASH_WORKERS', 2),
+                        config.get('PASSWORD_HASH_QUEUE', 32),
+                        config.get('PASSWORD_HASH_TIMEOUT', 10.0))
+        entry = (os.getpid(), pool)
+        current_app.extensions['password_hash_pool'] = entry
+    return entry[1]
+
+def normalized_method(method):
+    """
+    A werkzeug hash method with its default parameters filled in, as it
+    appears in stored hashes, e.g. 'scrypt' -> 'scrypt:32768:8:1'.
+    """
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = [str(2 ** 15), '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f'Unsupported password hash method: {method}')
+    return ':'.join([name] + params + defaults[len(params):])
+
+def hash_password(password):
+    """Hash a password with the configured method and salt length on the hashing pool."""
+    config = current_app.config
+    return get_hash_pool().run('hash', generate_password_hash, password,
+                               config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+                               config.get('PASSWORD_SALT_LENGTH', 16))
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash on the hashing pool."""
+    return get_hash_pool().run('verify', check_password_hash, password_hash, password)
+
+def password_needs_rehash(password_hash):
+    """
+    True if a stored hash was made with other parameters than the configured
+    PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH.
+    """
+    config = current_app.config
+    method, _, rest = password_hash.partition('$')
+    salt = rest.partition('$')[0]
+    return method != normalized_method(config.get('PASSWORD_HASH_METHOD', 'scrypt')) \
+        or len(salt) != config.get('PASSWORD_SALT_LENGTH', 16)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from flask import g, current_app
+from flask_login import current_user
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import db
+from models import User, Student, Faculty
+
+# Process-level identity snapshots: user_id -> (expires_at, snapshot)
+_identity_cache = {}
+_identity_cache_lock = threading.Lock()
+
+def _columns(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+def _snapshot(user):
+    return {
+        'user': _columns(user),
+        'student': _columns(user.student) if user.student else None,
+        'faculty': _columns(user.faculty) if user.faculty else None,
+    }
+
+def _attach(model, values):
+    # Rebuild a persistent object from cached column values without querying
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    db.session.add(obj)
+    return obj
+
+def _restore(snapshot):
+    user = _attach(User, snapshot['user'])
+    for key, model in (('student', Student), ('faculty', Faculty)):
+        profile = _attach(model, snapshot[key]) if snapshot[key] else None
+        set_committed_value(user, key, profile)
+        if profile is not None:
+            set_committed_value(profile, 'user', user)
+    return user
+
+def _cache_ttl():
+    return current_app.config.get('IDENTITY_CACHE_TTL', 0)
+
+def load_identity(user_id):
+    """
+    Load a user together with their student or faculty profile.
+
+    The result is kept on flask.g for the rest of the request. When
+    IDENTITY_CACHE_TTL is set, a snapshot is also kept per process for that
+    many seconds, so repeat requests rebuild the objects without a query.
+    Otherwise User, Student and Faculty are fetched with one joined query.
+
+    Args:
+        user_id: ID of the user
+
+    Returns:
+        User object with student and faculty already loaded, or None
+    """
+    identity = g.get('_identity')
+    if identity is not None and identity.id == user_id:
+        return identity
+
+    user = None
+    ttl = _cache_ttl()
+    if ttl:
+        with _identity_cache_lock:
+            cached = _identity_cache.get(user_id)
+        identity_key = inspect(User).identity_key_from_primary_key((user_id,))
+        if cached and cached[0] > time.monotonic() and identity_key not in db.session.identity_map:
+            user = _restore(cached[1])
+
+    if user is None:
+        user = db.session.get(User, user_id, options=[joinedload(User.student), joinedload(User.faculty)])
+        # Only cache complete identities so a profile created in another worker is never hidden
+        if ttl and user is not None and (user.student or user.faculty):
+            with _identity_cache_lock:
+                _identity_cache[user_id] = (time.monotonic() + ttl, _snapshot(user))
+
+    g._identity = user
+    return user
+
+def invalidate_identity(user_id):
+    """Drop cached identity data after a user's account or profile changes."""
+    with _identity_cache_lock:
+        _identity_cache.pop(user_id, None)
+    if g.get('_identity') is not None and g._identity.id == user_id:
+        g._identity = None
+
+def current_student():
+    """Return the logged-in user's Student profile, or None."""
+    return current_user.student if current_user.is_authenticated else None
+
+def current_faculty():
+    """Return the logged-in user's Faculty profile, or None."""
+    return current_user.faculty if current_user.is_authenticated else None
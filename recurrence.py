@@ -0,0 +1,198 @@
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from app import db
+from models import CourseSession
+from course_versions import bump_course_versions
+import rollups
+
+WEEKDAYS = {
+    'mon': 0, 'monday': 0,
+    'tue': 1, 'tues': 1, 'tuesday': 1,
+    'wed': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5,
+    'sun': 6, 'sunday': 6,
+}
+
+SCHEDULE_EXAMPLE = 'Mon Wed 09:00-10:30; Fri 14:00-15:00'
+
+# One meeting pattern: day names or day ranges, then a time range in 24-hour or AM/PM form
+_TIME = r'\d{1,2}(?::\d{2})?\s*(?:[AaPp]\.?[Mm]\.?)?'
+_MEETING = re.compile(rf'^(?P<days>[A-Za-z ,/\-]+?)\s+(?P<start>{_TIME})\s*(?:-|to)\s*(?P<end>{_TIME})$')
+
+Meeting = namedtuple('Meeting', ['weekday', 'start_time', 'end_time'])
+
+class ScheduleError(ValueError):
+    """Raised when a course schedule or holiday list cannot be parsed."""
+
+def _parse_days(text):
+    weekdays = []
+    for token in re.split(r'[\s,/]+', text.strip()):
+        if not token:
+            continue
+        first, _, last = token.partition('-')
+        if first.lower() not in WEEKDAYS or (last and last.lower() not in WEEKDAYS):
+            raise ScheduleError(f'Unknown day "{token}"')
+        start = WEEKDAYS[first.lower()]
+        end = WEEKDAYS[last.lower()] if last else start
+        if end < start:
+            raise ScheduleError(f'Day range "{token}" runs backwards')
+        weekdays.extend(range(start, end + 1))
+    return weekdays
+
+def _parse_time(text):
+    text = text.replace('.', '').replace(' ', '').upper()
+    if text.endswith(('AM', 'PM')):
+        return datetime.strptime(text, '%I:%M%p' if ':' in text else '%I%p').time()
+    return datetime.strptime(text, '%H:%M').time()
+
+def parse_schedule(text):
+    """
+    Parse a course schedule such as 'Mon Wed 09:00-10:30; Fri 14:00-15:00'.
+
+    Meetings are separated by semicolons. Each lists days (names, three-letter
+    abbreviations or ranges like Mon-Fri) followed by a time range, either
+    24-hour (09:00-10:30) or with AM/PM (10:00 AM - 11:00 AM).
+
+    Args:
+        text: Schedule string stored in Course.schedule
+
+    Returns:
+        List of Meeting tuples sorted by weekday and start time
+
+    Raises:
+        ScheduleError: If the schedule does not follow the format
+    """
+    meetings = set()
+    for part in (text or '').split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        match = _MEETING.match(part)
+        if not match:
+            raise ScheduleError(f'Cannot read "{part}"; use a format like "{SCHEDULE_EXAMPLE}"')
+        try:
+            start_time = _parse_time(match.group('start'))
+            end_time = _parse_time(match.group('end'))
+        except ValueError:
+            raise ScheduleError(f'Invalid time in "{part}"')
+        if end_time <= start_time:
+            raise ScheduleError(f'End time must be after start time in "{part}"')
+        for weekday in _parse_days(match.group('days')):
+            meetings.add(Meeting(weekday, start_time, end_time))
+    if not meetings:
+        raise ScheduleError(f'Schedule is empty; use a format like "{SCHEDULE_EXAMPLE}"')
+    return sorted(meetings)
+
+def parse_holidays(lines):
+    """
+    Parse holiday dates and ranges, one per entry: '2026-03-16' or '2026-03-16:2026-03-20'.
+
+    Args:
+        lines: Iterable of strings; blank entries are ignored
+
+    Returns:
+        Set of excluded dates
+    """
+    holidays = set()
+    for line in lines:
+        for entry in re.split(r'[\s,]+', line.strip()):
+            if not entry:
+                continue
+            first, _, last = entry.partition(':')
+            try:
+                start = date.fromisoformat(first)
+                end = date.fromisoformat(last) if last else start
+            except ValueError:
+                raise ScheduleError(f'Invalid holiday "{entry}"; use YYYY-MM-DD or YYYY-MM-DD:YYYY-MM-DD')
+            if end < start:
+                raise ScheduleError(f'Holiday range "{entry}" runs backwards')
+            holidays.update(start + timedelta(days=offset) for offset in range((end - start).days + 1))
+    return holidays
+
+def expand_meetings(meetings, term_start, term_end, holidays=()):
+    """
+    List every (date, start_time, end_time) occurrence of some meetings within a term.
+
+    Args:
+        meetings: List of Meeting tuples
+        term_start: First day of the term
+        term_end: Last day of the term (inclusive)
+        holidays: Dates on which no sessions take place
+
+    Returns:
+        Chronological list of (session_date, start_time, end_time) tuples
+    """
+    occurrences = []
+    for meeting in meetings:
+        day = term_start + timedelta(days=(meeting.weekday - term_start.weekday()) % 7)
+        while day <= term_end:
+            if day not in holidays:
+                occurrences.append((day, meeting.start_time, meeting.end_time))
+            day += timedelta(weeks=1)
+    occurrences.sort()
+    return occurrences
+
+def generate_term_sessions(courses, term_start, term_end, holidays=(), dry_run=False):
+    """
+    Create the sessions of a term for many courses in the caller's transaction.
+
+    Each course's schedule is expanded over the term; occurrences that already
+    have a session on the same date at the same start time are skipped, so
+    re-running for the same term only adds what is missing. New sessions are
+    written with one bulk INSERT, and session counters and course versions are
+    updated as for a session added by hand. Courses whose schedule cannot be
+    parsed are reported and left alone.
+
+    Args:
+        courses: Iterable of Course objects
+        term_start: First day of the term
+        term_end: Last day of the term (inclusive)
+        holidays: Dates to skip
+        dry_run: Plan only; write nothing
+
+    Returns:
+        Dictionary mapping course ID to {'planned': [(date, start, end), ...],
+        'existing': count, 'error': message or None}
+    """
+    if term_end < term_start:
+        raise ScheduleError('The term must end on or after its first day')
+
+    courses = list(courses)
+    holidays = set(holidays)
+    existing = set(db.session.query(
+        CourseSession.course_id, CourseSession.session_date, CourseSession.start_time
+    ).filter(
+        CourseSession.course_id.in_([course.id for course in courses]),
+        CourseSession.session_date.between(term_start, term_end)
+    ).all())
+
+    plan = {}
+    for course in courses:
+        try:
+            meetings = parse_schedule(course.schedule)
+        except ScheduleError as exc:
+            plan[course.id] = {'planned': [], 'existing': 0, 'error': str(exc)}
+            continue
+        occurrences = expand_meetings(meetings, term_start, term_end, holidays)
+        planned = [occurrence for occurrence in occurrences
+                   if (course.id, occurrence[0], occurrence[1]) not in existing]
+        plan[course.id] = {'planned': planned, 'existing': len(occurrences) - len(planned), 'error': None}
+
+    rows = [
+        {'course_id': course_id, 'session_date': session_date, 'start_time': start_time, 'end_time': end_time}
+        for course_id, result in plan.items()
+        for session_date, start_time, end_time in result['planned']
+    ]
+    if dry_run or not rows:
+        return plan
+
+    db.session.execute(CourseSession.__table__.insert(), rows)
+    for course_id, result in plan.items():
+        if result['planned']:
+            rollups.add_sessions(course_id, len(result['planned']))
+    bump_course_versions([course_id for course_id, result in plan.items() if result['planned']])
+    return plan
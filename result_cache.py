@@ -0,0 +1,343 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+# Registered backend factories, keyed by the scheme used in RESULT_CACHE
+BACKENDS = {}
+
+def register_backend(name, factory):
+    """
+    Register a result cache backend.
+
+    Args:
+        name: Scheme used in the RESULT_CACHE setting, e.g. 'sqlite'
+        factory: Callable taking (argument after 'name:' or None, maxsize, ttl)
+                 and returning a backend object
+    """
+    BACKENDS[name] = factory
+
+def course_tag(course_id):
+    return f'course:{course_id}'
+
+def student_tag(student_id):
+    return f'student:{student_id}'
+
+class CacheStats:
+    """Hit, miss and eviction counters for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+class NullBackend:
+    """Caches nothing; used when RESULT_CACHE is 'none'."""
+
+    name = 'none'
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get_many(self, keys):
+        self.stats.add(misses=len(keys))
+        return {}
+
+    def set_many(self, items):
+        pass
+
+    def invalidate(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return 0
+
+class MemoryBackend:
+    """
+    Bounded LRU with per-entry expiry, private to one process.
+
+    Invalidations only reach the process that made the write, so with several
+    workers other processes may serve a result for up to ttl seconds after it
+    changed; use the sqlite backend when that matters.
+    """
+
+    name = 'memory'
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        expired = 0
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    self._discard(key)
+                    expired += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+        self.stats.add(hits=len(found), misses=len(keys) - len(found), evictions=expired)
+        return found
+
+    def set_many(self, items):
+        expires_at = time.monotonic() + self.ttl
+        evicted = 0
+        with self._lock:
+            for key, (value, tags) in items.items():
+                if key in self._entries:
+                    self._discard(key)
+                self._entries[key] = (value, expires_at, tags)
+                for tag in tags:
+                    self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+                evicted += 1
+        self.stats.add(evictions=evicted)
+
+    def _discard(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def invalidate(self, tags):
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    if key in self._entries:
+                        self._discard(key)
+                        removed += 1
+        self.stats.add(invalidations=removed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def size(self):
+        return len(self._entries)
+
+class SQLiteBackend:
+    """
+    Cache stored in a local SQLite file shared by every worker on the host.
+
+    Entries are JSON encoded and tagged with the courses and students they
+    depend on, so an invalidation in any worker is seen by all of them.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, maxsize=10000, ttl=300):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entry ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_tag ('
+                         'tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_tag_key ON cache_tag (key)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        conn = self._connect()
+        placeholders = ','.join('?' * len(keys))
+        rows = conn.execute(
+            f'SELECT key, value FROM cache_entry WHERE key IN ({placeholders}) AND expires_at > ?',
+            [*keys, time.time()]
+        ).fetchall()
+        found = {key: json.loads(value) for key, value in rows}
+        self.stats.add(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, items):
+        if not items:
+            return
+        conn = self._connect()
+        expires_at = time.time() + self.ttl
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                [(key, json.dumps(value), expires_at) for key, (value, _) in items.items()]
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)',
+                [(tag, key) for key, (_, tags) in items.items() for tag in tags]
+            )
+            evicted = self._evict(conn)
+        self.stats.add(evictions=evicted)
+
+    def _evict(self, conn):
+        # Drop expired entries first, then the ones closest to expiry
+        now = time.time()
+        evicted = conn.execute('DELETE FROM cache_entry WHERE expires_at <= ?', (now,)).rowcount
+        (count,) = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()
+        if count > self.maxsize:
+            evicted += conn.execute(
+                'DELETE FROM cache_entry WHERE key IN '
+                '(SELECT key FROM cache_entry ORDER BY expires_at LIMIT ?)',
+                (count - self.maxsize,)
+            ).rowcount
+        if evicted:
+            conn.execute('DELETE FROM cache_tag WHERE key NOT IN (SELECT key FROM cache_entry)')
+        return evicted
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        if not tags:
+            return
+        conn = self._connect()
+        placeholders = ','.join('?' * len(tags))
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            removed = conn.execute(
+                f'DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_tag WHERE tag IN ({placeholders}))',
+                tags
+            ).rowcount
+            conn.execute(f'DELETE FROM cache_tag WHERE tag IN ({placeholders})', tags)
+        self.stats.add(invalidations=removed)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM cache_entry')
+            conn.execute('DELETE FROM cache_tag')
+
+    def size(self):
+        (count,) = self._connect().execute('SELECT COUNT(*) FROM cache_entry').fetchone()
+        return count
+
+register_backend('none', lambda argument, maxsize, ttl: NullBackend())
+register_backend('memory', lambda argument, maxsize, ttl: MemoryBackend(maxsize, ttl))
+register_backend('sqlite', lambda argument, maxsize, ttl: SQLiteBackend(argument or 'instance/result_cache.db', maxsize, ttl))
+
+def build_backend(setting, maxsize, ttl):
+    """
+    Build the backend described by a RESULT_CACHE setting such as 'memory' or
+    'sqlite:/var/cache/attendance/results.db'.
+    """
+    name, _, argument = setting.partition(':')
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown result cache backend: {name}')
+    return BACKENDS[name](argument or None, maxsize, ttl)
+
+def get_result_cache():
+    """Return the current app's result cache backend, creating it on first use."""
+    backend = current_app.extensions.get('result_cache')
+    if backend is None:
+        config = current_app.config
+        backend = build_backend(config.get('RESULT_CACHE', 'none'),
+                                config.get('RESULT_CACHE_SIZE', 1024),
+                                config.get('RESULT_CACHE_TTL', 60))
+        current_app.extensions['result_cache'] = backend
+    return backend
+
+def cached_results(keys, compute):
+    """
+    Look up many results at once and compute only the missing ones.
+
+    Args:
+        keys: Dictionary mapping cache key to the tags the result depends on
+        compute: Function taking the list of missing keys and returning a
+                 dictionary of key to JSON-serializable result
+
+    Results computed from the read replica are returned but not stored: the
+    replica may still lag a write whose invalidation already ran, and every
+    worker would then serve its numbers until the TTL expires.
+
+    Returns:
+        Dictionary mapping every key to its result
+    """
+    backend = get_result_cache()
+    results = backend.get_many(list(keys))
+    missing = [key for key in keys if key not in results]
+    if missing:
+        computed = compute(missing)
+        if not db.session.info.get('use_replica'):
+            backend.set_many({key: (value, keys[key]) for key, value in computed.items()})
+        results.update(computed)
+    return results
+
+def invalidate(course_ids=(), student_ids=()):
+    """
+    Drop cached results that depend on some courses or students, now and
+    again once the current transaction ends.
+
+    The second pass removes anything a concurrent request cached from data
+    read before this transaction committed.
+    """
+    tags = [course_tag(course_id) for course_id in course_ids] + \
+           [student_tag(student_id) for student_id in student_ids]
+    if not tags:
+        return
+    get_result_cache().invalidate(tags)
+
+    session = db.session()
+    session.info.setdefault('result_cache_tags', set()).update(tags)
+    session.info['result_cache'] = get_result_cache()
+
+def _invalidate_pending(session):
+    tags = session.info.pop('result_cache_tags', None)
+    backend = session.info.pop('result_cache', None)
+    if tags and backend is not None:
+        backend.invalidate(tags)
+
+event.listen(Session, 'after_commit', _invalidate_pending)
+event.listen(Session, 'after_rollback', _invalidate_pending)
@@ -0,0 +1,201 @@
+from collections import Counter, defaultdict
+from sqlalchemy import func, case
+from app import db
+from models import CourseSession, Attendance, CourseEnrollment, AttendanceRollup
+
+# Rollup counter column for each attendance status
+STATUS_COLUMNS = {
+    'present': 'present_count',
+    'absent': 'absent_count',
+    'late': 'late_count',
+    'excused': 'excused_count',
+}
+
+COUNTER_COLUMNS = ('session_count', 'recorded_count') + tuple(STATUS_COLUMNS.values())
+
+def status_count(status):
+    """SQL expression counting the grouped attendance rows that have the given status."""
+    return func.coalesce(func.sum(case((Attendance.status == status, 1), else_=0)), 0)
+
+def aggregate_attendance_counts(course_ids=None, student_ids=None):
+    """
+    Count sessions and attendance records for enrolled students from the raw tables.
+    
+    Every (student, course) pair is aggregated by a single GROUP BY query over
+    enrollments, course sessions and attendance records.
+    
+    Args:
+        course_ids: Optional iterable of course IDs to restrict to
+        student_ids: Optional iterable of student IDs to restrict to
+        
+    Returns:
+        Dictionary mapping (student_id, course_id) to a dictionary of rollup counters
+    """
+    query = db.session.query(
+        CourseEnrollment.student_id,
+        CourseEnrollment.course_id,
+        func.count(CourseSession.id),
+        func.count(Attendance.id),
+        *[status_count(status) for status in STATUS_COLUMNS]
+    ).outerjoin(
+        CourseSession, CourseSession.course_id == CourseEnrollment.course_id
+    ).outerjoin(
+        Attendance, (Attendance.session_id == CourseSession.id) &
+                    (Attendance.student_id == CourseEnrollment.student_id)
+    )
+    
+    if course_ids is not None:
+        query = query.filter(CourseEnrollment.course_id.in_(list(course_ids)))
+    if student_ids is not None:
+        query = query.filter(CourseEnrollment.student_id.in_(list(student_ids)))
+    
+    rows = query.group_by(CourseEnrollment.student_id, CourseEnrollment.course_id).all()
+    
+    return {
+        (row[0], row[1]): dict(zip(COUNTER_COLUMNS, row[2:]))
+        for row in rows
+    }
+
+def rebuild_rollups(course_ids=None, student_ids=None):
+    """
+    Recompute rollup rows from the raw attendance tables.
+    
+    Existing rows in scope are replaced. The caller is responsible for committing.
+    
+    Args:
+        course_ids: Optional iterable of course IDs to restrict to
+        student_ids: Optional iterable of student IDs to restrict to
+        
+    Returns:
+        Number of rollup rows written
+    """
+    if course_ids is not None:
+        course_ids = list(course_ids)
+    if student_ids is not None:
+        student_ids = list(student_ids)
+    
+    query = AttendanceRollup.query
+    if course_ids is not None:
+        query = query.filter(AttendanceRollup.course_id.in_(course_ids))
+    if student_ids is not None:
+        query = query.filter(AttendanceRollup.student_id.in_(student_ids))
+    query.delete(synchronize_session=False)
+    
+    counts = aggregate_attendance_counts(course_ids, student_ids)
+    if counts:
+        db.session.execute(AttendanceRollup.__table__.insert(), [
+            dict(student_id=student_id, course_id=course_id, **counters)
+            for (student_id, course_id), counters in counts.items()
+        ])
+    return len(counts)
+
+def verify_rollups(course_ids=None):
+    """
+    Compare rollup rows against the raw attendance tables.
+    
+    Args:
+        course_ids: Optional iterable of course IDs to restrict to
+        
+    Returns:
+        List of drift dictionaries with student_id, course_id, expected and actual counters.
+        A missing rollup row has actual None; a row without an enrollment has expected None.
+    """
+    if course_ids is not None:
+        course_ids = list(course_ids)
+    
+    expected = aggregate_attendance_counts(course_ids)
+    
+    query = AttendanceRollup.query
+    if course_ids is not None:
+        query = query.filter(AttendanceRollup.course_id.in_(course_ids))
+    actual = {
+        (rollup.student_id, rollup.course_id): {column: getattr(rollup, column) for column in COUNTER_COLUMNS}
+        for rollup in query.all()
+    }
+    
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key) != actual.get(key):
+            drift.append({
+                'student_id': key[0],
+                'course_id': key[1],
+                'expected': expected.get(key),
+                'actual': actual.get(key)
+            })
+    return drift
+
+def apply_status_changes(course_id, changes):
+    """
+    Adjust rollup counters for attendance records that were created or changed.
+    
+    Students sharing the same transition are updated together, so this issues one
+    UPDATE per distinct (old_status, new_status, occurrences) group rather than
+    one per student.
+    
+    Args:
+        course_id: ID of the course the sessions belong to
+        changes: Iterable of (student_id, old_status, new_status) tuples;
+                 old_status is None for a newly created record
+    """
+    occurrences = Counter(
+        (student_id, old_status, new_status)
+        for student_id, old_status, new_status in changes
+        if old_status != new_status
+    )
+    
+    groups = defaultdict(list)
+    for (student_id, old_status, new_status), count in occurrences.items():
+        groups[(old_status, new_status, count)].append(student_id)
+    
+    for (old_status, new_status, count), student_ids in groups.items():
+        values = {}
+        if old_status is None:
+            values['recorded_count'] = AttendanceRollup.recorded_count + count
+        elif old_status in STATUS_COLUMNS:
+            column = STATUS_COLUMNS[old_status]
+            values[column] = getattr(AttendanceRollup, column) - count
+        if new_status in STATUS_COLUMNS:
+            column = STATUS_COLUMNS[new_status]
+            values[column] = getattr(AttendanceRollup, column) + count
+        if not values:
+            continue
+        
+        AttendanceRollup.query.filter(
+            AttendanceRollup.course_id == course_id,
+            AttendanceRollup.student_id.in_(student_ids)
+        ).update(values, synchronize_session=False)
+
+def add_sessions(course_id, count=1):
+    """
+    Account for new sessions in a course for every enrolled student.
+    
+    Args:
+        course_id: ID of the course
+        count: Number of sessions added
+    """
+    AttendanceRollup.query.filter_by(course_id=course_id).update(
+        {'session_count': AttendanceRollup.session_count + count},
+        synchronize_session=False
+    )
+
+def add_enrollments(course_id, student_ids):
+    """
+    Create rollup rows for newly enrolled students, seeded from any existing records.
+    
+    Args:
+        course_id: ID of the course
+        student_ids: Iterable of student IDs that were enrolled
+    """
+    rebuild_rollups(course_ids=[course_id], student_ids=student_ids)
+
+def remove_enrollment(course_id, student_id):
+    """
+    Drop the rollup row for a student removed from a course.
+    
+    Args:
+        course_id: ID of the course
+        student_id: ID of the student
+    """
+    AttendanceRollup.query.filter_by(
+        course_id=course_id, student_id=student_id
+    ).delete(synchronize_session=False)
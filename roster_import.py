@@ -0,0 +1,216 @@
+import csv
+import io
+import secrets
+from collections import defaultdict
+
+from app import db
+from models import User, Student, Course, CourseEnrollment
+from utils import dialect_insert
+from course_versions import bump_course_versions
+from passwords import hash_password
+import rollups
+
+# Rows inserted per statement, and values per IN (...) lookup
+BATCH_SIZE = 500
+
+STUDENT_COLUMNS = ('student_id', 'full_name', 'department', 'year_of_study', 'email')
+ENROLLMENT_COLUMNS = ('student_id', 'course_code')
+
+class RosterError(ValueError):
+    """Raised when a roster file cannot be read as a UTF-8 CSV."""
+
+def read_roster(stream):
+    """
+    Parse an uploaded or opened CSV roster.
+
+    Args:
+        stream: Binary or text file object
+
+    Returns:
+        List of (line_number, row) tuples with header names lower-cased and
+        values stripped
+
+    Raises:
+        RosterError: If the file is not UTF-8 or is not valid CSV
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+
+    reader = csv.DictReader(stream)
+    try:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        return [
+            (reader.line_num, {key: (value or '').strip() for key, value in row.items() if key})
+            for row in reader
+        ]
+    except UnicodeDecodeError:
+        raise RosterError('The roster is not a UTF-8 text file')
+    except csv.Error as error:
+        raise RosterError(f'The roster is not a valid CSV file: {error}')
+
+def _chunks(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _lookup(column, values, *extra):
+    """Map each existing value of a unique column to its row, in IN (...) batches."""
+    found = {}
+    for chunk in _chunks(set(values)):
+        for row in db.session.query(column, *extra).filter(column.in_(chunk)).all():
+            found[row[0]] = row[1] if extra else True
+    return found
+
+def _missing_columns(rows, required):
+    if not rows:
+        return []
+    return [column for column in required if column not in rows[0][1]]
+
+def _result():
+    return {'created': 0, 'skipped': 0, 'errors': []}
+
+def import_students(rows):
+    """
+    Create student accounts and profiles from roster rows.
+
+    Rows whose student_id is already registered are skipped. Usernames default
+    to the student ID. Imported accounts share one unusable password, hashed
+    once through passwords.hash_password with the configured method, so hashing
+    cost does not grow with roster size. Everything runs in the
+    caller's transaction; the caller is responsible for committing.
+
+    Args:
+        rows: List of (line_number, row) tuples from read_roster
+
+    Returns:
+        Dictionary with created and skipped counts and a list of (line, message) errors
+    """
+    result = _result()
+    missing = _missing_columns(rows, STUDENT_COLUMNS)
+    if missing:
+        result['errors'].append((1, f"Missing columns: {', '.join(missing)}"))
+        return result
+
+    existing_ids = _lookup(Student.student_id, [row['student_id'] for _, row in rows])
+    existing_usernames = _lookup(User.username, [row.get('username') or row['student_id'] for _, row in rows])
+    existing_emails = _lookup(User.email, [row['email'] for _, row in rows])
+    unusable_password = hash_password(secrets.token_urlsafe(32))
+
+    seen_ids, seen_usernames, seen_emails = set(), set(), set()
+    pending = []
+    for line, row in rows:
+        username = row.get('username') or row['student_id']
+        empty = [column for column in STUDENT_COLUMNS if not row[column]]
+        if empty:
+            result['errors'].append((line, f"Missing value for {', '.join(empty)}"))
+            continue
+        if row['student_id'] in existing_ids:
+            result['skipped'] += 1
+            continue
+        if row['student_id'] in seen_ids:
+            result['errors'].append((line, f"Duplicate student_id {row['student_id']} in file"))
+            continue
+        if username in existing_usernames or username in seen_usernames:
+            result['errors'].append((line, f'Username {username} is already taken'))
+            continue
+        if row['email'] in existing_emails or row['email'] in seen_emails:
+            result['errors'].append((line, f"Email {row['email']} is already registered"))
+            continue
+        try:
+            year_of_study = int(row['year_of_study'])
+        except ValueError:
+            result['errors'].append((line, f"Invalid year_of_study {row['year_of_study']!r}"))
+            continue
+
+        seen_ids.add(row['student_id'])
+        seen_usernames.add(username)
+        seen_emails.add(row['email'])
+        pending.append(User(
+            username=username,
+            email=row['email'],
+            password_hash=unusable_password,
+            user_type='student',
+            student=Student(
+                student_id=row['student_id'],
+                full_name=row['full_name'],
+                department=row['department'],
+                year_of_study=year_of_study,
+                phone=row.get('phone') or None
+            )
+        ))
+
+    for batch in _chunks(pending):
+        db.session.add_all(batch)
+        db.session.flush()
+    result['created'] = len(pending)
+    return result
+
+def import_enrollments(rows, allowed_course_ids=None):
+    """
+    Enroll students in courses from roster rows of student_id and course_code.
+
+    Students and courses are resolved through lookup maps loaded up front.
+    Pairs that are already enrolled are skipped, and inserts use ON CONFLICT DO
+    NOTHING on unique_enrollment so concurrent imports cannot collide; pairs
+    another import inserted first count as skipped. Rollup rows are created
+    for every enrollment actually inserted. Everything runs in the caller's
+    transaction; the caller is responsible for committing.
+
+    Args:
+        rows: List of (line_number, row) tuples from read_roster
+        allowed_course_ids: Optional set of course IDs the importer may change
+
+    Returns:
+        Dictionary with created and skipped counts and a list of (line, message) errors
+    """
+    result = _result()
+    missing = _missing_columns(rows, ENROLLMENT_COLUMNS)
+    if missing:
+        result['errors'].append((1, f"Missing columns: {', '.join(missing)}"))
+        return result
+
+    students = _lookup(Student.student_id, [row['student_id'] for _, row in rows], Student.id)
+    courses = _lookup(Course.course_code, [row['course_code'] for _, row in rows], Course.id)
+
+    existing = set()
+    course_ids = set(courses.values())
+    for chunk in _chunks(course_ids):
+        existing.update(db.session.query(
+            CourseEnrollment.student_id, CourseEnrollment.course_id
+        ).filter(CourseEnrollment.course_id.in_(chunk)).all())
+
+    new_pairs = []
+    for line, row in rows:
+        student_id = students.get(row['student_id'])
+        course_id = courses.get(row['course_code'])
+        if student_id is None:
+            result['errors'].append((line, f"Unknown student_id {row['student_id']!r}"))
+            continue
+        if course_id is None:
+            result['errors'].append((line, f"Unknown course_code {row['course_code']!r}"))
+            continue
+        if allowed_course_ids is not None and course_id not in allowed_course_ids:
+            result['errors'].append((line, f"You do not manage course {row['course_code']}"))
+            continue
+        if (student_id, course_id) in existing:
+            result['skipped'] += 1
+            continue
+        existing.add((student_id, course_id))
+        new_pairs.append({'student_id': student_id, 'course_id': course_id})
+
+    # RETURNING yields only the rows actually inserted, not those a concurrent import already added
+    statement = dialect_insert(CourseEnrollment.__table__).on_conflict_do_nothing(
+        index_elements=['student_id', 'course_id']
+    ).returning(CourseEnrollment.student_id, CourseEnrollment.course_id)
+    enrolled_by_course = defaultdict(list)
+    for batch in _chunks(new_pairs):
+        for student_id, course_id in db.session.execute(statement, batch):
+            enrolled_by_course[course_id].append(student_id)
+    for course_id, student_ids in enrolled_by_course.items():
+        for chunk in _chunks(student_ids):
+            rollups.add_enrollments(course_id, chunk)
+    bump_course_versions(enrolled_by_course)
+
+    result['created'] = sum(len(student_ids) for student_ids in enrolled_by_course.values())
+    result['skipped'] += len(new_pairs) - result['created']
+    return result
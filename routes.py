@@ -1,14 +1,379 @@
-from datetime import datetime, date
-from flask import render_template, flash, redirect, url_for, request, jsonify
+from datetime import date, timedelta
+from flask import render_template, flash, redirect, url_for, request, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, current_user, login_required
 from urllib.parse import urlparse
-from sqlalchemy import func
+from werkzeug.utils import secure_filename
+from sqlalchemy.orm import joinedload, contains_eager
 
-from app import db
-from models import User, Student, Faculty, Course, CourseEnrollment, CourseSession, Attendance, AbsenceRequest
+from app import db, csrf
+from models import (User, Student, Faculty, Course, CourseEnrollment, CourseSession, Attendance, AbsenceRequest,
+                    CheckinEvent)
 from forms import (LoginForm, RegistrationForm, StudentProfileForm, FacultyProfileForm, CourseForm, 
-                   CourseSessionForm, AttendanceForm, AbsenceRequestForm, AbsenceRequestResponseForm)
-from utils import calculate_attendance, get_attendance_stats, send_attendance_notification
+                   CourseSessionForm, AbsenceRequestForm, AbsenceRequestResponseForm,
+                   RosterImportForm, TermSessionsForm)
+import rollups
+from recurrence import generate_term_sessions, parse_holidays
+from utils import (calculate_attendance, calculate_attendance_bulk, get_attendance_stats_bulk, upsert_attendance,
+                   check_attendance_thresholds, respond_to_absence_requests, search_available_students)
+from attendance_matrix import load_course_matrix, load_course_matrices
+from exports import EXPORT_FORMATS, department_course_ids, iter_export
+from roster_import import RosterError, read_roster, import_students, import_enrollments
+from profiles import current_student, current_faculty, invalidate_identity
+from pagination import paginate_request
+from course_versions import bump_course_versions, get_course_versions
+from http_cache import (response_cache, make_etag, fingerprint, last_modified_from, has_pending_flashes,
+                        is_not_modified, with_validators)
+from instrumentation import endpoint_metrics
+from db_routing import replica_reads
+from result_cache import get_result_cache
+from passwords import PasswordHashBusy
+from checkins import authenticate_device, ingest_checkins, CheckinError, CheckinBackpressure
+from timetable import (timetable_index, courses_changed, week_bounds, calendar_json, ical_feed, feed_token,
+                       feed_user_id)
+
+# Consecutive absences after which a student is flagged in department reports
+ABSENCE_STREAK_ALERT = 3
+
+# Shown when the password hashing queue is full
+BUSY_MESSAGE = 'The server is busy signing other users in. Please try again in a moment.'
+
+# Students per page in the enroll picker on the student management page
+STUDENT_PICKER_PAGE_SIZE = 25
+
+def export_response(course_ids, export_format, filename):
+    """Stream an attendance matrix export as a file download."""
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(
+        stream_with_context(iter_export(course_ids, export_format)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{extension}"'}
+    )
+
+# Server-side filters accepted by the paginated lists
+ABSENCE_REQUEST_STATUSES = ('pending', 'approved', 'rejected')
+ATTENDANCE_STATUSES = ('present', 'absent', 'late', 'excused', 'unrecorded')
+
+def status_filter(allowed):
+    """Return the request's status argument if it is one of the allowed values."""
+    status = request.args.get('status')
+    return status if status in allowed else None
+
+def absence_requests_query(student=None, faculty=None, status=None):
+    """
+    Build the absence request list for a student, or for every course a faculty member teaches.
+    
+    Args:
+        student: Student whose own requests are listed
+        faculty: Faculty member whose courses' requests are listed
+        status: Optional status to filter on
+        
+    Returns:
+        Query of AbsenceRequest objects with student and course loaded
+    """
+    query = AbsenceRequest.query.join(Course).options(
+        contains_eager(AbsenceRequest.course),
+        joinedload(AbsenceRequest.student)
+    )
+    if student is not None:
+        query = query.filter(AbsenceRequest.student_id == student.id)
+    if faculty is not None:
+        query = query.filter(Course.faculty_id == faculty.id)
+    if status:
+        query = query.filter(AbsenceRequest.status == status)
+    return query
+
+def paginate_absence_requests(query):
+    """Fetch one page of absence requests, newest request_date first."""
+    return paginate_request(query, AbsenceRequest.request_date, AbsenceRequest.id,
+                            key=lambda absence_request: (absence_request.request_date, absence_request.id))
+
+def attendance_history_query(student, course_id, status=None):
+    """
+    Build a student's attendance history for a course: every session joined
+    to the student's attendance record, if any.
+    
+    Args:
+        student: Student whose history is listed
+        course_id: ID of the course
+        status: Optional attendance status, or 'unrecorded' for sessions without a record
+        
+    Returns:
+        Query of (CourseSession, Attendance or None) tuples
+    """
+    query = db.session.query(
+        CourseSession, Attendance
+    ).outerjoin(
+        Attendance, (CourseSession.id == Attendance.session_id) & 
+                   (Attendance.student_id == student.id)
+    ).filter(
+        CourseSession.course_id == course_id
+    )
+    if status == 'unrecorded':
+        query = query.filter(Attendance.id.is_(None))
+    elif status:
+        query = query.filter(Attendance.status == status)
+    return query
+
+def paginate_attendance_history(query):
+    """Fetch one page of attendance history, most recent session first."""
+    return paginate_request(query, CourseSession.session_date, CourseSession.id,
+                            key=lambda row: (row[0].session_date, row[0].id))
+
+def absence_request_json(absence_request):
+    """Serialize an absence request for the JSON API."""
+    return {
+        'id': absence_request.id,
+        'student_id': absence_request.student.student_id,
+        'student_name': absence_request.student.full_name,
+        'course_code': absence_request.course.course_code,
+        'course_title': absence_request.course.title,
+        'request_date': absence_request.request_date.isoformat(),
+        'from_date': absence_request.from_date.isoformat(),
+        'to_date': absence_request.to_date.isoformat(),
+        'reason': absence_request.reason,
+        'status': absence_request.status,
+        'response_notes': absence_request.response_notes,
+        'responded_at': absence_request.responded_at.isoformat() if absence_request.responded_at else None
+    }
+
+def attendance_entry_json(session, attendance):
+    """Serialize a session and the student's attendance record for the JSON API."""
+    return {
+        'session_id': session.id,
+        'date': session.session_date.isoformat(),
+        'start_time': session.start_time.strftime('%H:%M'),
+        'end_time': session.end_time.strftime('%H:%M'),
+        'status': attendance.status if attendance else None,
+        'notes': attendance.notes if attendance else None
+    }
+
+def cached_page(name, course_ids, render, *extra):
+    """
+    Serve a dashboard with an ETag built from the logged-in user, their
+    profile and the data versions of the courses it shows, plus any extra
+    values the page depends on.
+    
+    A matching If-None-Match gets a 304 before any attendance data is read,
+    and rendered pages are kept in the response cache under their ETag. Pages
+    with pending flashed messages are always rendered fresh.
+    
+    Args:
+        name: Page name used in the ETag and cache key
+        course_ids: IDs of the courses the page shows
+        render: Function returning the rendered HTML
+        extra: Other values the page depends on, e.g. today's date
+        
+    Returns:
+        Response object
+    """
+    if has_pending_flashes():
+        return render()
+    
+    user = current_user._get_current_object()
+    versions = get_course_versions(course_ids)
+    etag = make_etag(name, fingerprint(user), fingerprint(user.student), fingerprint(user.faculty),
+                     sorted((course_id, version) for course_id, (version, _) in versions.items()), *extra)
+    
+    if is_not_modified(etag):
+        return with_validators(Response(status=304), etag)
+    
+    cache_key = (name, etag)
+    body = response_cache.get(cache_key)
+    if body is None:
+        body = render()
+        response_cache.set(cache_key, body, course_ids)
+    
+    return with_validators(Response(body, mimetype='text/html'), etag)
+
+def render_course_sessions(course, form, term_form=None, term_plan=None):
+    """Render the sessions page of a course, optionally with a term generation preview."""
+    sessions = CourseSession.query.filter_by(course_id=course.id).order_by(CourseSession.session_date, CourseSession.start_time).all()
+    
+    # Add the current date to the template context
+    today = date.today()
+    
+    return render_template('faculty/course_management.html',
+                        form=form,
+                        term_form=term_form or TermSessionsForm(),
+                        term_plan=term_plan,
+                        course=course,
+                        sessions=sessions,
+                        sessions_view=True,
+                        today=today)  # Pass today to the template
+
+def timetable_owner(user):
+    """
+    Whose timetable a user sees.
+    
+    Returns:
+        ('faculty', Faculty ID, name) or ('student', Student ID, name), or None
+        if the user has no profile yet
+    """
+    if user.user_type == 'faculty' and user.faculty:
+        return 'faculty', user.faculty.id, user.faculty.full_name
+    if user.user_type == 'student' and user.student:
+        return 'student', user.student.id, user.student.full_name
+    return None
+
+def parse_timetable_date(value):
+    """Date from a ?date= argument, defaulting to today; raises ValueError if malformed."""
+    return date.fromisoformat(value) if value else date.today()
+
+def build_course_report(course):
+    """
+    Compute the attendance report shown on the faculty reports page.
+    
+    Args:
+        course: Course object
+        
+    Returns:
+        Dictionary with course details, summary, per-student and per-session data
+    """
+    enrollments = db.session.query(CourseEnrollment, Student).join(
+        Student, CourseEnrollment.student_id == Student.id
+    ).filter(
+        CourseEnrollment.course_id == course.id
+    ).order_by(CourseEnrollment.id).all()
+    matrix = load_course_matrix(course.id)
+    course_attendance = matrix.student_stats()
+    streaks = matrix.absence_streaks()
+    
+    # Calculate overall statistics
+    total_sessions = matrix.width
+    student_data = []
+    
+    total_present = 0
+    total_absent = 0
+    total_late = 0
+    total_excused = 0
+    
+    for enrollment, student in enrollments:
+        stats = course_attendance[student.id]
+        
+        # Track overall stats
+        total_present += stats['present']
+        total_absent += stats['absent']
+        total_late += stats['late']
+        total_excused += stats['excused']
+        
+        student_data.append({
+            'student_id': student.student_id,
+            'name': student.full_name,
+            'present': stats['present'],
+            'absent': stats['absent'],
+            'late': stats['late'],
+            'excused': stats['excused'],
+            'percentage': stats['percentage'],
+            'below_threshold': stats['percentage'] < course.min_attendance_percent,
+            'longest_absence_streak': streaks[student.id][0],
+            'current_absence_streak': streaks[student.id][1]
+        })
+    
+    # Sort students by attendance percentage (ascending)
+    student_data.sort(key=lambda x: x['percentage'])
+    
+    # Calculate session statistics
+    session_data = []
+    for (_, session_date, _, title), counts in zip(matrix.sessions, matrix.session_counts()):
+        present_count = counts['present']
+        absent_count = counts['absent']
+        late_count = counts['late']
+        excused_count = counts['excused']
+        total_count = present_count + absent_count + late_count + excused_count
+        
+        if total_count > 0:
+            attendance_rate = (present_count + late_count) / total_count * 100
+        else:
+            attendance_rate = 0
+            
+        session_data.append({
+            'date': session_date.strftime('%Y-%m-%d'),
+            'title': title or f"Session on {session_date.strftime('%b %d')}",
+            'present': present_count,
+            'absent': absent_count,
+            'late': late_count,
+            'excused': excused_count,
+            'attendance_rate': attendance_rate
+        })
+    
+    # Get students below threshold
+    students_below_threshold = [s for s in student_data if s['below_threshold']]
+    
+    # Calculate overall attendance rate
+    total_attendance = total_present + total_absent + total_late + total_excused
+    if total_attendance > 0:
+        overall_attendance_rate = (total_present + total_late) / total_attendance * 100
+    else:
+        overall_attendance_rate = 0
+    
+    return {
+        'course': {
+            'id': course.id,
+            'code': course.course_code,
+            'title': course.title,
+            'min_attendance': course.min_attendance_percent
+        },
+        'summary': {
+            'total_students': len(enrollments),
+            'total_sessions': total_sessions,
+            'overall_attendance_rate': overall_attendance_rate,
+            'students_below_threshold': len(students_below_threshold)
+        },
+        'students': student_data,
+        'sessions': session_data
+    }
+
+def build_department_report(courses):
+    """
+    Summarize attendance across many courses, e.g. a whole department.
+    
+    All courses are loaded into attendance matrices with three queries.
+    
+    Args:
+        courses: List of Course objects
+        
+    Returns:
+        Dictionary with per-course summaries and department totals
+    """
+    matrices = load_course_matrices([course.id for course in courses])
+    course_data = []
+    students = set()
+    below_threshold = set()
+    on_absence_streak = set()
+    
+    for course in courses:
+        matrix = matrices[course.id]
+        below = matrix.below_threshold(course.min_attendance_percent)
+        streaking = [student_id for student_id, (_, current) in matrix.absence_streaks().items()
+                     if current >= ABSENCE_STREAK_ALERT]
+        counts = matrix.session_counts()
+        attended = sum(c['present'] + c['late'] for c in counts)
+        recorded = sum(matrix.shape[0] - c['unrecorded'] for c in counts)
+        
+        students.update(matrix.student_ids)
+        below_threshold.update(below)
+        on_absence_streak.update(streaking)
+        course_data.append({
+            'id': course.id,
+            'code': course.course_code,
+            'title': course.title,
+            'students': matrix.shape[0],
+            'sessions': matrix.width,
+            'attendance_rate': round(attended / recorded * 100, 2) if recorded else 0,
+            'students_below_threshold': len(below),
+            'students_on_absence_streak': len(streaking)
+        })
+    
+    return {
+        'summary': {
+            'courses': len(courses),
+            'students': len(students),
+            'students_below_threshold': len(below_threshold),
+            'students_on_absence_streak': len(on_absence_streak),
+            'absence_streak_alert': ABSENCE_STREAK_ALERT
+        },
+        'courses': course_data
+    }
 
 def register_routes(app):
     
@@ -31,10 +396,23 @@ def register_routes(app):
         form = LoginForm()
         if form.validate_on_submit():
             user = User.query.filter_by(username=form.username.data).first()
-            if user is None or not user.check_password(form.password.data):
+            try:
+                valid = user is not None and user.check_password(form.password.data)
+            except PasswordHashBusy:
+                flash(BUSY_MESSAGE, 'warning')
+                return render_template('login.html', title='Sign In', form=form), 503, {'Retry-After': '2'}
+            if not valid:
                 flash('Invalid username or password', 'danger')
                 return redirect(url_for('login'))
             
+            # Upgrade hashes made with older parameters while the plain password is at hand
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except PasswordHashBusy:
+                    pass
+            
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             if not next_page or urlparse(next_page).netloc != '':
@@ -56,7 +434,11 @@ def register_routes(app):
         form = RegistrationForm()
         if form.validate_on_submit():
             user = User(username=form.username.data, email=form.email.data, user_type=form.user_type.data)
-            user.set_password(form.password.data)
+            try:
+                user.set_password(form.password.data)
+            except PasswordHashBusy:
+                flash(BUSY_MESSAGE, 'warning')
+                return render_template('register.html', title='Register', form=form), 503, {'Retry-After': '2'}
             db.session.add(user)
             db.session.commit()
             
@@ -78,7 +460,7 @@ def register_routes(app):
             flash('Access denied: You are not registered as a student', 'danger')
             return redirect(url_for('index'))
         
-        if Student.query.filter_by(user_id=current_user.id).first():
+        if current_student():
             flash('You already have a student profile', 'info')
             return redirect(url_for('student_dashboard'))
         
@@ -94,6 +476,7 @@ def register_routes(app):
             )
             db.session.add(student)
             db.session.commit()
+            invalidate_identity(current_user.id)
             flash('Your student profile has been created!', 'success')
             return redirect(url_for('student_dashboard'))
             
@@ -106,7 +489,7 @@ def register_routes(app):
             flash('Access denied: You are not registered as faculty', 'danger')
             return redirect(url_for('index'))
         
-        if Faculty.query.filter_by(user_id=current_user.id).first():
+        if current_faculty():
             flash('You already have a faculty profile', 'info')
             return redirect(url_for('faculty_dashboard'))
         
@@ -122,6 +505,7 @@ def register_routes(app):
             )
             db.session.add(faculty)
             db.session.commit()
+            invalidate_identity(current_user.id)
             flash('Your faculty profile has been created!', 'success')
             return redirect(url_for('faculty_dashboard'))
             
@@ -129,48 +513,58 @@ def register_routes(app):
 
     # Student routes
     @app.route('/student/dashboard')
+    @replica_reads
     @login_required
     def student_dashboard():
         if current_user.user_type != 'student':
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student:
             return redirect(url_for('create_student_profile'))
         
-        enrollments = CourseEnrollment.query.filter_by(student_id=student.id).all()
-        courses = [enrollment.course for enrollment in enrollments]
+        course_ids = [course_id for (course_id,) in db.session.query(
+            CourseEnrollment.course_id
+        ).filter_by(student_id=student.id).order_by(CourseEnrollment.id)]
         
-        attendance_stats = {}
-        for course in courses:
-            attendance_stats[course.id] = calculate_attendance(student.id, course.id)
+        def render():
+            courses_by_id = {course.id: course for course in Course.query.filter(Course.id.in_(course_ids))}
+            courses = [courses_by_id[course_id] for course_id in course_ids]
             
-        recent_absences = Attendance.query.join(CourseSession).join(Course)\
-            .filter(Attendance.student_id == student.id)\
-            .filter(Attendance.status == 'absent')\
-            .order_by(CourseSession.session_date.desc())\
-            .limit(5).all()
+            attendance_stats = {
+                course_id: stats
+                for (_, course_id), stats in calculate_attendance_bulk(student_ids=[student.id]).items()
+            }
             
-        pending_requests = AbsenceRequest.query.filter_by(
-            student_id=student.id, status='pending'
-        ).order_by(AbsenceRequest.from_date.desc()).all()
-        
-        return render_template('student/dashboard.html', 
-                              student=student,
-                              courses=courses,
-                              attendance_stats=attendance_stats,
-                              recent_absences=recent_absences,
-                              pending_requests=pending_requests)
+            recent_absences = Attendance.query.join(CourseSession).join(Course)\
+                .filter(Attendance.student_id == student.id)\
+                .filter(Attendance.status == 'absent')\
+                .order_by(CourseSession.session_date.desc())\
+                .limit(5).all()
+            
+            pending_requests = AbsenceRequest.query.filter_by(
+                student_id=student.id, status='pending'
+            ).order_by(AbsenceRequest.from_date.desc()).all()
+            
+            return render_template('student/dashboard.html', 
+                                  student=student,
+                                  courses=courses,
+                                  attendance_stats=attendance_stats,
+                                  recent_absences=recent_absences,
+                                  pending_requests=pending_requests)
+        
+        return cached_page('student_dashboard', course_ids, render)
 
     @app.route('/student/view_attendance/<int:course_id>')
+    @replica_reads
     @login_required
     def student_view_attendance(course_id):
         if current_user.user_type != 'student':
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student:
             return redirect(url_for('create_student_profile'))
         
@@ -184,23 +578,22 @@ def register_routes(app):
             flash('You are not enrolled in this course', 'danger')
             return redirect(url_for('student_dashboard'))
         
-        attendance_records = db.session.query(
-            CourseSession, Attendance
-        ).outerjoin(
-            Attendance, (CourseSession.id == Attendance.session_id) & 
-                       (Attendance.student_id == student.id)
-        ).filter(
-            CourseSession.course_id == course_id
-        ).order_by(
-            CourseSession.session_date
-        ).all()
+        status = status_filter(ATTENDANCE_STATUSES)
+        try:
+            page = paginate_attendance_history(attendance_history_query(student, course_id, status))
+        except ValueError as error:
+            flash(str(error), 'warning')
+            return redirect(url_for('student_view_attendance', course_id=course_id, status=status))
         
         stats = calculate_attendance(student.id, course_id)
         
         return render_template('student/view_attendance.html',
                               student=student,
                               course=course,
-                              attendance_records=attendance_records,
+                              attendance_records=page['items'],
+                              page=page,
+                              status=status,
+                              statuses=ATTENDANCE_STATUSES,
                               stats=stats)
 
     @app.route('/student/absence_request', methods=['GET', 'POST'])
@@ -210,7 +603,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student:
             return redirect(url_for('create_student_profile'))
         
@@ -235,6 +628,7 @@ def register_routes(app):
                 status='pending'
             )
             db.session.add(request)
+            bump_course_versions([request.course_id])
             db.session.commit()
             flash('Your absence request has been submitted', 'success')
             return redirect(url_for('student_dashboard'))
@@ -248,57 +642,61 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student:
             return redirect(url_for('create_student_profile'))
         
-        requests = AbsenceRequest.query.filter_by(student_id=student.id).order_by(
-            AbsenceRequest.request_date.desc()
-        ).all()
+        status = status_filter(ABSENCE_REQUEST_STATUSES)
+        try:
+            page = paginate_absence_requests(absence_requests_query(student=student, status=status))
+        except ValueError as error:
+            flash(str(error), 'warning')
+            return redirect(url_for('view_absence_requests', status=status))
         
         return render_template('student/absence_request.html',
-                              requests=requests,
+                              requests=page['items'],
+                              page=page,
+                              status=status,
+                              statuses=ABSENCE_REQUEST_STATUSES,
                               view_only=True)
 
     @app.route('/faculty/dashboard')
+    @replica_reads
     @login_required
     def faculty_dashboard():
         if current_user.user_type != 'faculty':
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         if not faculty:
             return redirect(url_for('create_faculty_profile'))
         
         courses = Course.query.filter_by(faculty_id=faculty.id).all()
-        
         today = date.today()
-        today_sessions = CourseSession.query.join(Course).filter(
-            Course.faculty_id == faculty.id,
-            CourseSession.session_date == today
-        ).order_by(CourseSession.start_time).all()
-        
-        pending_requests = AbsenceRequest.query.join(Course).filter(
-            Course.faculty_id == faculty.id,
-            AbsenceRequest.status == 'pending'
-        ).count()
         
-        course_stats = {}
-        for course in courses:
-            stats = get_attendance_stats(course.id)
-            course_stats[course.id] = stats
-        
-        # Fix: Use dictionary key access instead of attribute access
-        no_actions_needed = pending_requests == 0 and not any(course_stats[course.id]['below_threshold'] > 0 for course in courses)
-        
-        return render_template('faculty/dashboard.html',
-                            faculty=faculty,
-                            courses=courses,
-                            today_sessions=today_sessions,
-                            pending_requests=pending_requests,
-                            course_stats=course_stats,
-                            no_actions_needed=no_actions_needed)
+        def render():
+            today_sessions = timetable_index.day('faculty', faculty.id, today)
+            
+            pending_requests = AbsenceRequest.query.join(Course).filter(
+                Course.faculty_id == faculty.id,
+                AbsenceRequest.status == 'pending'
+            ).count()
+            
+            course_stats = get_attendance_stats_bulk(courses)
+            
+            # Fix: Use dictionary key access instead of attribute access
+            no_actions_needed = pending_requests == 0 and not any(course_stats[course.id]['below_threshold'] > 0 for course in courses)
+            
+            return render_template('faculty/dashboard.html',
+                                faculty=faculty,
+                                courses=courses,
+                                today_sessions=today_sessions,
+                                pending_requests=pending_requests,
+                                course_stats=course_stats,
+                                no_actions_needed=no_actions_needed)
+            
+        return cached_page('faculty_dashboard', [course.id for course in courses], render, today)
 
     @app.route('/faculty/course_management', methods=['GET', 'POST'])
     @login_required
@@ -307,7 +705,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         if not faculty:
             return redirect(url_for('create_faculty_profile'))
         
@@ -341,7 +739,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         course = Course.query.get_or_404(course_id)
         
         if course.faculty_id != faculty.id:
@@ -352,6 +750,7 @@ def register_routes(app):
         
         if form.validate_on_submit():
             form.populate_obj(course)
+            bump_course_versions([course.id])
             db.session.commit()
             flash('Course has been updated!', 'success')
             return redirect(url_for('course_management'))
@@ -368,7 +767,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         course = Course.query.get_or_404(course_id)
         
         if course.faculty_id != faculty.id:
@@ -376,6 +775,7 @@ def register_routes(app):
             return redirect(url_for('course_management'))
         
         db.session.delete(course)
+        courses_changed([course.id])
         db.session.commit()
         flash('Course has been deleted!', 'success')
         return redirect(url_for('course_management'))
@@ -387,7 +787,7 @@ def register_routes(app):
                 flash('Access denied', 'danger')
                 return redirect(url_for('index'))
             
-            faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+            faculty = current_faculty()
             course = Course.query.get_or_404(course_id)
             
             if course.faculty_id != faculty.id:
@@ -408,7 +808,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         course = Course.query.get_or_404(course_id)
         
         if course.faculty_id != faculty.id:
@@ -427,21 +827,49 @@ def register_routes(app):
                 notes=form.notes.data
             )
             db.session.add(session)
+            rollups.add_sessions(course.id)
+            bump_course_versions([course.id])
             db.session.commit()
             flash('Session has been added!', 'success')
             return redirect(url_for('course_sessions', course_id=course.id))
         
-        sessions = CourseSession.query.filter_by(course_id=course.id).order_by(CourseSession.session_date, CourseSession.start_time).all()
+        return render_course_sessions(course, form)
+    
+    @app.route('/faculty/course/<int:course_id>/sessions/generate', methods=['POST'])
+    @login_required
+    def generate_course_sessions(course_id):
+        if current_user.user_type != 'faculty':
+            flash('Access denied', 'danger')
+            return redirect(url_for('index'))
         
-        # Add the current date to the template context
-        today = date.today()
+        faculty = current_faculty()
+        course = Course.query.get_or_404(course_id)
         
-        return render_template('faculty/course_management.html',
-                            form=form,
-                            course=course,
-                            sessions=sessions,
-                            sessions_view=True,
-                            today=today)  # Pass today to the template
+        if course.faculty_id != faculty.id:
+            flash('You do not have permission to manage this course', 'danger')
+            return redirect(url_for('course_management'))
+        
+        term_form = TermSessionsForm()
+        if not term_form.validate_on_submit():
+            for errors in term_form.errors.values():
+                for error in errors:
+                    flash(error, 'danger')
+            return redirect(url_for('course_sessions', course_id=course.id))
+        
+        holidays = parse_holidays((term_form.holidays.data or '').splitlines())
+        dry_run = term_form.preview.data
+        plan = generate_term_sessions([course], term_form.term_start.data, term_form.term_end.data,
+                                      holidays, dry_run=dry_run)[course.id]
+        
+        if plan['error']:
+            flash(f"The course schedule could not be read: {plan['error']}", 'danger')
+            return redirect(url_for('course_sessions', course_id=course.id))
+        if dry_run:
+            return render_course_sessions(course, CourseSessionForm(formdata=None), term_form, plan)
+        
+        db.session.commit()
+        flash(f"Created {len(plan['planned'])} sessions; {plan['existing']} already existed.", 'success')
+        return redirect(url_for('course_sessions', course_id=course.id))
 
     @app.route('/faculty/student_management/<int:course_id>', methods=['GET'])
     @login_required
@@ -450,24 +878,28 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         course = Course.query.get_or_404(course_id)
         
         if course.faculty_id != faculty.id:
             flash('You do not have permission to manage this course', 'danger')
             return redirect(url_for('course_management'))
         
-        enrollments = CourseEnrollment.query.filter_by(course_id=course.id).all()
-        students = [enrollment.student for enrollment in enrollments]
+        enrollments = CourseEnrollment.query.options(
+            joinedload(CourseEnrollment.student)
+        ).filter_by(course_id=course.id).order_by(CourseEnrollment.id).all()
         
-        # Get all students that are not enrolled in this course
-        all_students = Student.query.all()
-        available_students = [s for s in all_students if s not in students]
+        # Only the first page of students not enrolled in this course; the
+        # enroll picker fetches further pages and searches through the API
+        available_students, has_more = search_available_students(course.id, per_page=STUDENT_PICKER_PAGE_SIZE)
         
         return render_template('faculty/student_management.html',
                               course=course,
                               enrollments=enrollments,
-                              available_students=available_students)
+                              available_students=available_students,
+                              has_more_students=has_more,
+                              page_size=STUDENT_PICKER_PAGE_SIZE,
+                              import_form=RosterImportForm())
 
     @app.route('/faculty/enroll_student', methods=['POST'])
     @login_required
@@ -476,7 +908,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         
         student_id = request.form.get('student_id')
         course_id = request.form.get('course_id')
@@ -505,11 +937,57 @@ def register_routes(app):
                 course_id=course.id
             )
             db.session.add(enrollment)
+            rollups.add_enrollments(course.id, [student.id])
+            bump_course_versions([course.id])
             db.session.commit()
             flash(f'Student {student.full_name} has been enrolled in {course.title}', 'success')
         
         return redirect(url_for('student_management', course_id=course.id))
 
+    @app.route('/faculty/import_roster', methods=['POST'])
+    @login_required
+    def import_roster():
+        if current_user.user_type != 'faculty':
+            flash('Access denied', 'danger')
+            return redirect(url_for('index'))
+        
+        faculty = current_faculty()
+        course_id = request.form.get('course_id', type=int)
+        redirect_to = url_for('student_management', course_id=course_id) if course_id else url_for('course_management')
+        
+        form = RosterImportForm()
+        if not form.validate_on_submit():
+            for errors in form.errors.values():
+                for error in errors:
+                    flash(error, 'danger')
+            return redirect(redirect_to)
+        
+        try:
+            rows = read_roster(form.roster.data.stream)
+        except RosterError as error:
+            flash(str(error), 'danger')
+            return redirect(redirect_to)
+        
+        if form.kind.data == 'students':
+            try:
+                result = import_students(rows)
+            except PasswordHashBusy:
+                db.session.rollback()
+                flash(BUSY_MESSAGE, 'warning')
+                return redirect(redirect_to)
+        else:
+            allowed_course_ids = {course_id for (course_id,) in db.session.query(Course.id).filter_by(faculty_id=faculty.id)}
+            result = import_enrollments(rows, allowed_course_ids=allowed_course_ids)
+        db.session.commit()
+        
+        flash(f"Imported {result['created']} {form.kind.data}, skipped {result['skipped']} already present", 'success')
+        if result['errors']:
+            shown = result['errors'][:10]
+            details = '; '.join(f'line {line}: {message}' for line, message in shown)
+            more = len(result['errors']) - len(shown)
+            flash(f"{len(result['errors'])} rows were rejected: {details}" + (f' (and {more} more)' if more else ''), 'warning')
+        return redirect(redirect_to)
+
     @app.route('/faculty/remove_enrollment/<int:enrollment_id>', methods=['POST'])
     @login_required
     def remove_enrollment(enrollment_id):
@@ -517,7 +995,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         
         enrollment = CourseEnrollment.query.get_or_404(enrollment_id)
         course = Course.query.get(enrollment.course_id)
@@ -530,6 +1008,8 @@ def register_routes(app):
         course_id = course.id
         
         db.session.delete(enrollment)
+        rollups.remove_enrollment(course_id, student.id)
+        bump_course_versions([course_id])
         db.session.commit()
         
         flash(f'Student {student.full_name} has been removed from {course.title}', 'success')
@@ -542,7 +1022,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         session = CourseSession.query.get_or_404(session_id)
         course = Course.query.get(session.course_id)
         
@@ -550,45 +1030,61 @@ def register_routes(app):
             flash('You do not have permission to manage this course', 'danger')
             return redirect(url_for('faculty_dashboard'))
         
-        enrollments = CourseEnrollment.query.filter_by(course_id=course.id).all()
-        students = [enrollment.student for enrollment in enrollments]
-        
-        # Check if attendance has already been taken
-        existing_records = {}
-        for record in Attendance.query.filter_by(session_id=session.id).all():
-            existing_records[record.student_id] = record
-        
         if request.method == 'POST':
-            for student in students:
-                status = request.form.get(f'status_{student.id}')
-                notes = request.form.get(f'notes_{student.id}', '')
+            # Only IDs and statuses are needed to save, so skip loading full ORM objects
+            student_ids = [student_id for (student_id,) in db.session.query(
+                CourseEnrollment.student_id
+            ).filter_by(course_id=course.id).order_by(CourseEnrollment.id).all()]
+            existing_statuses = dict(db.session.query(
+                Attendance.student_id, Attendance.status
+            ).filter_by(session_id=session.id).all())
+            
+            form_data = request.form.to_dict()
+            records = []
+            status_changes = []
+            for student_id in student_ids:
+                status = form_data.get(f'status_{student_id}')
+                if not status:
+                    continue
+                if status not in rollups.STATUS_COLUMNS:
+                    flash(f'Invalid attendance status: {status}', 'danger')
+                    return redirect(url_for('take_attendance', session_id=session.id))
                 
-                if student.id in existing_records:
-                    # Update existing record
-                    record = existing_records[student.id]
-                    record.status = status
-                    record.notes = notes
-                else:
-                    # Create new record
-                    record = Attendance(
-                        student_id=student.id,
-                        session_id=session.id,
-                        status=status,
-                        notes=notes
-                    )
-                    db.session.add(record)
+                records.append({
+                    'student_id': student_id,
+                    'session_id': session.id,
+                    'status': status,
+                    'notes': form_data.get(f'notes_{student_id}', '')
+                })
+                status_changes.append((student_id, existing_statuses.get(student_id), status))
             
-            db.session.commit()
+            upsert_attendance(records)
+            rollups.apply_status_changes(course.id, status_changes)
+            bump_course_versions([course.id])
             
-            # Check for attendance thresholds and send notifications
-            for student in students:
-                attendance_stats = calculate_attendance(student.id, course.id)
-                if attendance_stats['percentage'] < course.min_attendance_percent:
-                    send_attendance_notification(student, course, attendance_stats['percentage'])
+            # Recheck low attendance warnings only for students whose status changed.
+            # The outbox is written in the same transaction and delivered by the notification worker.
+            check_attendance_thresholds(course, {
+                student_id for student_id, old_status, new_status in status_changes
+                if old_status != new_status
+            })
+            
+            db.session.commit()
             
             flash('Attendance has been recorded successfully', 'success')
             return redirect(url_for('course_sessions', course_id=course.id))
         
+        students = Student.query.join(
+            CourseEnrollment, CourseEnrollment.student_id == Student.id
+        ).filter(
+            CourseEnrollment.course_id == course.id
+        ).order_by(CourseEnrollment.id).all()
+        
+        # Check if attendance has already been taken
+        existing_records = {}
+        for record in Attendance.query.filter_by(session_id=session.id).all():
+            existing_records[record.student_id] = record
+        
         return render_template('faculty/take_attendance.html',
                               session=session,
                               course=course,
@@ -602,18 +1098,22 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         
-        # Get absence requests for courses taught by this faculty
-        requests = AbsenceRequest.query.join(Course).filter(
-            Course.faculty_id == faculty.id
-        ).order_by(
-            AbsenceRequest.status == 'pending',
-            AbsenceRequest.request_date.desc()
-        ).all()
+        # Get absence requests for courses taught by this faculty, one page at a time
+        status = status_filter(ABSENCE_REQUEST_STATUSES)
+        try:
+            page = paginate_absence_requests(absence_requests_query(faculty=faculty, status=status))
+        except ValueError as error:
+            flash(str(error), 'warning')
+            return redirect(url_for('faculty_absence_requests', status=status))
         
         return render_template('faculty/absence_requests.html',
-                              requests=requests)
+                              requests=page['items'],
+                              page=page,
+                              status=status,
+                              statuses=ABSENCE_REQUEST_STATUSES,
+                              batch_form=AbsenceRequestResponseForm())
 
     @app.route('/faculty/respond_absence_request/<int:request_id>', methods=['GET', 'POST'])
     @login_required
@@ -622,7 +1122,7 @@ def register_routes(app):
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         
         absence_request = AbsenceRequest.query.get_or_404(request_id)
         course = Course.query.get(absence_request.course_id)
@@ -634,41 +1134,8 @@ def register_routes(app):
         form = AbsenceRequestResponseForm()
         
         if form.validate_on_submit():
-            absence_request.status = form.status.data
-            absence_request.response_notes = form.response_notes.data
-            absence_request.responded_at = datetime.utcnow()
-            
-            # If approved, update attendance records to "excused" for the days in the request range
-            if form.status.data == 'approved':
-                from_date = absence_request.from_date
-                to_date = absence_request.to_date
-                
-                # Find sessions in this date range
-                sessions = CourseSession.query.filter(
-                    CourseSession.course_id == course.id,
-                    CourseSession.session_date >= from_date,
-                    CourseSession.session_date <= to_date
-                ).all()
-                
-                for session in sessions:
-                    # Check if attendance record exists
-                    attendance = Attendance.query.filter_by(
-                        student_id=absence_request.student_id,
-                        session_id=session.id
-                    ).first()
-                    
-                    if attendance:
-                        attendance.status = 'excused'
-                        attendance.notes = f"Excused absence: {absence_request.reason}"
-                    else:
-                        # Create new attendance record with excused status
-                        attendance = Attendance(
-                            student_id=absence_request.student_id,
-                            session_id=session.id,
-                            status='excused',
-                            notes=f"Excused absence: {absence_request.reason}"
-                        )
-                        db.session.add(attendance)
+            # Approval excuses every session in the absence period with one upsert
+            respond_to_absence_requests([absence_request], form.status.data, form.response_notes.data)
             
             db.session.commit()
             flash('Response to absence request has been submitted', 'success')
@@ -683,14 +1150,51 @@ def register_routes(app):
                               course=course,
                               responding=True)
 
+    @app.route('/faculty/absence_requests/batch', methods=['POST'])
+    @login_required
+    def respond_absence_requests_batch():
+        if current_user.user_type != 'faculty':
+            flash('Access denied', 'danger')
+            return redirect(url_for('index'))
+        
+        faculty = current_faculty()
+        form = AbsenceRequestResponseForm()
+        
+        if not form.validate_on_submit():
+            flash('Please choose whether to approve or reject the selected requests', 'danger')
+            return redirect(url_for('faculty_absence_requests'))
+        
+        request_ids = request.form.getlist('request_ids', type=int)
+        if not request_ids:
+            flash('No absence requests were selected', 'warning')
+            return redirect(url_for('faculty_absence_requests'))
+        
+        # Only pending requests for this faculty's courses can be answered
+        absence_requests = AbsenceRequest.query.join(Course).filter(
+            AbsenceRequest.id.in_(request_ids),
+            AbsenceRequest.status == 'pending',
+            Course.faculty_id == faculty.id
+        ).all()
+        
+        excused = respond_to_absence_requests(absence_requests, form.status.data, form.response_notes.data)
+        db.session.commit()
+        
+        flash(f'{form.status.data.title()} {len(absence_requests)} absence requests'
+              + (f', excusing {excused} attendance records' if form.status.data == 'approved' else ''), 'success')
+        skipped = len(set(request_ids)) - len(absence_requests)
+        if skipped:
+            flash(f'{skipped} selected requests were already answered or are not yours', 'warning')
+        return redirect(url_for('faculty_absence_requests'))
+
     @app.route('/faculty/reports', methods=['GET'])
+    @replica_reads
     @login_required
     def attendance_reports():
         if current_user.user_type != 'faculty':
             flash('Access denied', 'danger')
             return redirect(url_for('index'))
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         courses = Course.query.filter_by(faculty_id=faculty.id).all()
         
         # Get data for course selection
@@ -709,103 +1213,296 @@ def register_routes(app):
         return render_template('faculty/reports.html',
                               courses=course_data)
 
+    @app.route('/api/course/<int:course_id>/available_students', methods=['GET'])
+    @login_required
+    def api_available_students(course_id):
+        if current_user.user_type != 'faculty':
+            return jsonify({'error': 'Access denied'}), 403
+        
+        faculty = current_faculty()
+        course = Course.query.get_or_404(course_id)
+        
+        if course.faculty_id != faculty.id:
+            return jsonify({'error': 'You do not have permission to manage this course'}), 403
+        
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', STUDENT_PICKER_PAGE_SIZE, type=int), 1), 100)
+        students, has_more = search_available_students(course.id, request.args.get('q'), page, per_page)
+        
+        return jsonify({
+            'students': [{
+                'id': student.id,
+                'student_id': student.student_id,
+                'name': student.full_name,
+                'department': student.department,
+                'year_of_study': student.year_of_study
+            } for student in students],
+            'page': page,
+            'has_more': has_more
+        })
+
+    @app.route('/api/absence_requests', methods=['GET'])
+    @login_required
+    def api_absence_requests():
+        if current_user.user_type == 'student':
+            student = current_student()
+            if not student:
+                return jsonify({'error': 'Student profile not found'}), 404
+            query = absence_requests_query(student=student, status=status_filter(ABSENCE_REQUEST_STATUSES))
+        elif current_user.user_type == 'faculty':
+            faculty = current_faculty()
+            if not faculty:
+                return jsonify({'error': 'Faculty profile not found'}), 404
+            query = absence_requests_query(faculty=faculty, status=status_filter(ABSENCE_REQUEST_STATUSES))
+        else:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        try:
+            page = paginate_absence_requests(query)
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        
+        return jsonify({
+            'requests': [absence_request_json(absence_request) for absence_request in page['items']],
+            'next_cursor': page['next_cursor']
+        })
+
+    @app.route('/api/course/<int:course_id>/attendance_history', methods=['GET'])
+    @replica_reads
+    @login_required
+    def api_attendance_history(course_id):
+        if current_user.user_type != 'student':
+            return jsonify({'error': 'Access denied'}), 403
+        
+        student = current_student()
+        if not student:
+            return jsonify({'error': 'Student profile not found'}), 404
+        
+        enrollment = CourseEnrollment.query.filter_by(
+            student_id=student.id, course_id=course_id
+        ).first()
+        if not enrollment:
+            return jsonify({'error': 'You are not enrolled in this course'}), 403
+        
+        try:
+            page = paginate_attendance_history(
+                attendance_history_query(student, course_id, status_filter(ATTENDANCE_STATUSES))
+            )
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        
+        return jsonify({
+            'sessions': [attendance_entry_json(session, attendance) for session, attendance in page['items']],
+            'next_cursor': page['next_cursor']
+        })
+
     @app.route('/api/course_report/<int:course_id>', methods=['GET'])
+    @replica_reads
     @login_required
     def api_course_report(course_id):
         if current_user.user_type != 'faculty':
             return jsonify({'error': 'Access denied'}), 403
         
-        faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+        faculty = current_faculty()
         course = Course.query.get_or_404(course_id)
         
         if course.faculty_id != faculty.id:
             return jsonify({'error': 'You do not have permission to view this course'}), 403
         
-        enrollments = CourseEnrollment.query.filter_by(course_id=course.id).all()
-        sessions = CourseSession.query.filter_by(course_id=course.id).all()
+        versions = get_course_versions([course.id])
+        # Streaks depend on which sessions have been held, so the report also changes daily
+        etag = make_etag('course_report', course.id, versions[course.id][0], date.today())
+        last_modified = last_modified_from(versions, daily=True)
         
-        # Calculate overall statistics
-        total_sessions = len(sessions)
-        student_data = []
+        # Answer conditional requests from the version alone, without reading attendance
+        if is_not_modified(etag, last_modified):
+            return with_validators(Response(status=304), etag, last_modified)
         
-        total_present = 0
-        total_absent = 0
-        total_late = 0
-        total_excused = 0
+        cache_key = ('course_report', etag)
+        body = response_cache.get(cache_key)
+        if body is None:
+            body = jsonify(build_course_report(course)).get_data()
+            response_cache.set(cache_key, body, [course.id])
         
-        for enrollment in enrollments:
-            student = Student.query.get(enrollment.student_id)
-            stats = calculate_attendance(student.id, course.id)
-            
-            # Track overall stats
-            total_present += stats['present']
-            total_absent += stats['absent']
-            total_late += stats['late']
-            total_excused += stats['excused']
-            
-            student_data.append({
-                'student_id': student.student_id,
-                'name': student.full_name,
-                'present': stats['present'],
-                'absent': stats['absent'],
-                'late': stats['late'],
-                'excused': stats['excused'],
-                'percentage': stats['percentage'],
-                'below_threshold': stats['percentage'] < course.min_attendance_percent
-            })
+        return with_validators(Response(body, mimetype='application/json'), etag, last_modified)
+
+    @app.route('/api/department_report', methods=['GET'])
+    @replica_reads
+    @login_required
+    def api_department_report():
+        if current_user.user_type != 'faculty':
+            return jsonify({'error': 'Access denied'}), 403
         
-        # Sort students by attendance percentage (ascending)
-        student_data.sort(key=lambda x: x['percentage'])
-        
-        # Calculate session statistics
-        session_data = []
-        for s in sessions:
-            present_count = Attendance.query.filter_by(session_id=s.id, status='present').count()
-            absent_count = Attendance.query.filter_by(session_id=s.id, status='absent').count()
-            late_count = Attendance.query.filter_by(session_id=s.id, status='late').count()
-            excused_count = Attendance.query.filter_by(session_id=s.id, status='excused').count()
-            total_count = present_count + absent_count + late_count + excused_count
-            
-            if total_count > 0:
-                attendance_rate = (present_count + late_count) / total_count * 100
-            else:
-                attendance_rate = 0
-                
-            session_data.append({
-                'date': s.session_date.strftime('%Y-%m-%d'),
-                'title': s.title or f"Session on {s.session_date.strftime('%b %d')}",
-                'present': present_count,
-                'absent': absent_count,
-                'late': late_count,
-                'excused': excused_count,
-                'attendance_rate': attendance_rate
-            })
+        faculty = current_faculty()
+        courses = Course.query.filter(Course.id.in_(department_course_ids(faculty.department))).order_by(
+            Course.id
+        ).all()
+        
+        versions = get_course_versions([course.id for course in courses])
+        etag = make_etag('department_report', faculty.department, date.today(), sorted(
+            (course_id, version) for course_id, (version, _) in versions.items()
+        ))
+        last_modified = last_modified_from(versions, daily=True)
+        if is_not_modified(etag, last_modified):
+            return with_validators(Response(status=304), etag, last_modified)
+        
+        cache_key = ('department_report', etag)
+        body = response_cache.get(cache_key)
+        if body is None:
+            report = build_department_report(courses)
+            report['department'] = faculty.department
+            body = jsonify(report).get_data()
+            response_cache.set(cache_key, body, [course.id for course in courses])
+        
+        return with_validators(Response(body, mimetype='application/json'), etag, last_modified)
+
+    @app.route('/faculty/export/course/<int:course_id>', methods=['GET'])
+    @replica_reads
+    @login_required
+    def export_course_attendance(course_id):
+        if current_user.user_type != 'faculty':
+            flash('Access denied', 'danger')
+            return redirect(url_for('index'))
         
-        # Get students below threshold
-        students_below_threshold = [s for s in student_data if s['below_threshold']]
+        faculty = current_faculty()
+        course = Course.query.get_or_404(course_id)
         
-        # Calculate overall attendance rate
-        total_attendance = total_present + total_absent + total_late + total_excused
-        if total_attendance > 0:
-            overall_attendance_rate = (total_present + total_late) / total_attendance * 100
-        else:
-            overall_attendance_rate = 0
+        if course.faculty_id != faculty.id:
+            flash('You do not have permission to export this course', 'danger')
+            return redirect(url_for('attendance_reports'))
+        
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            flash('Unknown export format', 'danger')
+            return redirect(url_for('attendance_reports'))
+        
+        return export_response([course.id], export_format, f'attendance_{course.course_code}')
+
+    @app.route('/faculty/export/department', methods=['GET'])
+    @replica_reads
+    @login_required
+    def export_department_attendance():
+        if current_user.user_type != 'faculty':
+            flash('Access denied', 'danger')
+            return redirect(url_for('index'))
+        
+        faculty = current_faculty()
+        
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            flash('Unknown export format', 'danger')
+            return redirect(url_for('attendance_reports'))
+        
+        course_ids = department_course_ids(faculty.department)
+        return export_response(course_ids, export_format, secure_filename(f'attendance_{faculty.department}'))
+
+    # Timetable routes
+    @app.route('/timetable')
+    @replica_reads
+    @login_required
+    def timetable():
+        owner = timetable_owner(current_user)
+        if not owner:
+            flash('Please complete your profile first', 'warning')
+            return redirect(url_for('index'))
+        
+        try:
+            day = parse_timetable_date(request.args.get('date'))
+        except ValueError:
+            flash('Invalid date', 'danger')
+            return redirect(url_for('timetable'))
+        
+        start, end = week_bounds(day)
+        days = timetable_index.lookup(owner[0], owner[1], start, end)
+        
+        return render_template('timetable.html',
+                              title='Timetable',
+                              days=days,
+                              start=start,
+                              end=end,
+                              today=date.today(),
+                              previous_week=start - timedelta(days=7),
+                              next_week=start + timedelta(days=7),
+                              feed_url=url_for('timetable_feed', token=feed_token(current_user), _external=True))
+
+    @app.route('/api/timetable', methods=['GET'])
+    @replica_reads
+    @login_required
+    def api_timetable():
+        owner = timetable_owner(current_user)
+        if not owner:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        view = request.args.get('view', 'day')
+        if view not in ('day', 'week'):
+            return jsonify({'error': 'view must be day or week'}), 400
+        try:
+            day = parse_timetable_date(request.args.get('date'))
+        except ValueError:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+        
+        start, end = (day, day) if view == 'day' else week_bounds(day)
+        days = timetable_index.lookup(owner[0], owner[1], start, end)
+        return jsonify(calendar_json(view, start, end, days))
+
+    @app.route('/timetable/<token>.ics', methods=['GET'])
+    @replica_reads
+    def timetable_feed(token):
+        # Calendar apps fetch this without a session; the signed token identifies the user
+        user_id = feed_user_id(token)
+        user = db.session.get(User, user_id) if isinstance(user_id, int) else None
+        owner = timetable_owner(user) if user else None
+        if not owner:
+            return Response('Unknown calendar feed', status=404, mimetype='text/plain')
+        
+        start, end = timetable_index.current_window()
+        days = timetable_index.lookup(owner[0], owner[1], start, end)
+        entries = [entry for day in sorted(days) for entry in days[day]]
+        
+        etag = make_etag('timetable_feed', owner, [tuple(entry) for entry in entries])
+        if is_not_modified(etag):
+            return with_validators(Response(status=304), etag)
+        
+        body = ical_feed(f'{owner[2]} - Timetable', entries, host=request.host)
+        return with_validators(Response(body, mimetype='text/calendar'), etag)
+
+    # Check-in ingestion for card readers and QR kiosks, authorized by a device token
+    @app.route('/api/checkins', methods=['POST'])
+    @csrf.exempt
+    def api_checkins():
+        device = authenticate_device(request.headers.get('Authorization'))
+        if device is None:
+            return jsonify({'error': 'Invalid device token'}), 401
+        
+        payload = request.get_json(silent=True)
+        try:
+            result = ingest_checkins(device, payload, app.config)
+        except CheckinError as error:
+            db.session.rollback()
+            return jsonify({'error': str(error)}), 400
+        except CheckinBackpressure as error:
+            db.session.rollback()
+            return jsonify({'error': str(error), 'retry_after': error.retry_after}), 503, \
+                {'Retry-After': str(error.retry_after)}
+        
+        db.session.commit()
+        return jsonify(result), 202
+
+    @app.route('/api/checkins/<path:idempotency_key>', methods=['GET'])
+    def api_checkin_status(idempotency_key):
+        device = authenticate_device(request.headers.get('Authorization'))
+        if device is None:
+            return jsonify({'error': 'Invalid device token'}), 401
+        
+        event = CheckinEvent.query.filter_by(device_id=device.id, idempotency_key=idempotency_key).first()
+        if event is None:
+            return jsonify({'error': 'Unknown check-in'}), 404
         
         return jsonify({
-            'course': {
-                'id': course.id,
-                'code': course.course_code,
-                'title': course.title,
-                'min_attendance': course.min_attendance_percent
-            },
-            'summary': {
-                'total_students': len(enrollments),
-                'total_sessions': total_sessions,
-                'overall_attendance_rate': overall_attendance_rate,
-                'students_below_threshold': len(students_below_threshold)
-            },
-            'students': student_data,
-            'sessions': session_data
+            'idempotency_key': event.idempotency_key,
+            'status': event.status,
+            'attendance_status': event.attendance_status,
+            'error': event.error
         })
 
     # Common routes
@@ -813,7 +1510,7 @@ def register_routes(app):
     @login_required
     def update_profile():
         if current_user.user_type == 'student':
-            student = Student.query.filter_by(user_id=current_user.id).first()
+            student = current_student()
             if not student:
                 return redirect(url_for('create_student_profile'))
                 
@@ -830,6 +1527,7 @@ def register_routes(app):
                     form.populate_obj(student)
                 
                 db.session.commit()
+                invalidate_identity(current_user.id)
                 flash('Your profile has been updated!', 'success')
                 return redirect(url_for('student_dashboard'))
                 
@@ -838,7 +1536,7 @@ def register_routes(app):
                                   form=form, 
                                   edit_mode=True)
         else:
-            faculty = Faculty.query.filter_by(user_id=current_user.id).first()
+            faculty = current_faculty()
             if not faculty:
                 return redirect(url_for('create_faculty_profile'))
                 
@@ -855,6 +1553,7 @@ def register_routes(app):
                     form.populate_obj(faculty)
                 
                 db.session.commit()
+                invalidate_identity(current_user.id)
                 flash('Your profile has been updated!', 'success')
                 return redirect(url_for('faculty_dashboard'))
                 
@@ -862,3 +1561,25 @@ def register_routes(app):
                                   title='Update Profile', 
                                   form=form, 
                                   edit_mode=True)
+
+    @app.route('/admin/metrics', methods=['GET', 'POST'])
+    @login_required
+    def admin_metrics():
+        # Metrics are process-wide and can be reset, so only configured administrators may see them
+        if current_user.username not in app.config['ADMIN_USERNAMES']:
+            flash('Access denied', 'danger')
+            return redirect(url_for('index'))
+
+        if request.method == 'POST':
+            endpoint_metrics.reset()
+            flash('Request metrics have been reset.', 'success')
+            return redirect(url_for('admin_metrics'))
+
+        result_cache = get_result_cache()
+        return render_template('admin/metrics.html',
+                              title='Request Metrics',
+                              endpoints=endpoint_metrics.snapshot(),
+                              result_cache=result_cache,
+                              result_cache_stats=result_cache.stats.as_dict(),
+                              response_cache=response_cache,
+                              timetable_index=timetable_index)
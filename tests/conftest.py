@@ -0,0 +1,106 @@
+import os
+import sys
+import tempfile
+from datetime import time
+
+import pytest
+
+# app.py reads DATABASE_URL at import time, so point it at a scratch database first
+_db_dir = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, db  # noqa: E402
+from http_cache import response_cache  # noqa: E402
+from models import User, Student, Faculty, Course, CourseEnrollment, CourseSession, Attendance  # noqa: E402
+
+PASSWORD = 'password1'
+STATUSES = ('present', 'absent', 'late', 'excused')
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        # Keep logins fast; the default scrypt parameters are deliberately slow
+        PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',
+    )
+    # Every test starts from an empty database, so cached bodies from earlier tests must not be served
+    response_cache.clear()
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def faculty(app):
+    user = User(username='faculty', email='faculty@example.com', user_type='faculty')
+    user.set_password(PASSWORD)
+    db.session.add(user)
+    db.session.flush()
+    faculty = Faculty(user_id=user.id, faculty_id='F001', full_name='Faculty One',
+                      department='CS', position='Lecturer')
+    db.session.add(faculty)
+    db.session.commit()
+    return faculty
+
+
+@pytest.fixture
+def students(app):
+    """Sixty students with placeholder password hashes; they never log in."""
+    students = []
+    for i in range(60):
+        user = User(username=f'student{i}', email=f'student{i}@example.com', user_type='student', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        student = Student(user_id=user.id, student_id=f'S{i:04d}', full_name=f'Student {i}',
+                          department='CS', year_of_study=1)
+        db.session.add(student)
+        students.append(student)
+    db.session.commit()
+    return students
+
+
+@pytest.fixture
+def faculty_client(client, faculty):
+    response = client.post('/login', data={'username': 'faculty', 'password': PASSWORD})
+    assert response.status_code == 302 and '/login' not in response.headers['Location']
+    return client
+
+
+@pytest.fixture
+def make_course(faculty):
+    """
+    Factory for courses taught by the faculty fixture.
+
+    Every student is enrolled and the sessions run 09:00-10:00 on the given
+    dates. With record=True each student gets a record per session, the
+    status rotating through STATUSES.
+    """
+    def make(code, students, session_dates, record=True):
+        course = Course(course_code=code, title=f'Course {code}', faculty_id=faculty.id,
+                        schedule='MWF 09:00-10:00', location='Room 1')
+        db.session.add(course)
+        db.session.flush()
+        for student in students:
+            db.session.add(CourseEnrollment(student_id=student.id, course_id=course.id))
+        for day, session_date in enumerate(session_dates):
+            session = CourseSession(course_id=course.id, session_date=session_date,
+                                    start_time=time(9), end_time=time(10))
+            db.session.add(session)
+            db.session.flush()
+            if record:
+                for i, student in enumerate(students):
+                    db.session.add(Attendance(student_id=student.id, session_id=session.id,
+                                              status=STATUSES[(i + day) % len(STATUSES)]))
+        db.session.commit()
+        return course
+    return make
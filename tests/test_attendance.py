@@ -0,0 +1,97 @@
+from datetime import date
+
+import rollups
+from app import db
+from models import Attendance, AttendanceRollup, CourseSession
+from utils import upsert_attendance
+
+
+def recorded(session_id):
+    db.session.expire_all()
+    return {record.student_id: (record.status, record.notes)
+            for record in Attendance.query.filter_by(session_id=session_id)}
+
+
+def counters(course_id, student_id):
+    db.session.expire_all()
+    rollup = AttendanceRollup.query.filter_by(course_id=course_id, student_id=student_id).one()
+    return {column: getattr(rollup, column) for column in rollups.COUNTER_COLUMNS}
+
+
+def test_upsert_inserts_new_and_updates_existing_records(make_course, students):
+    course = make_course('C1', students[:3], [date(2024, 1, 1)], record=False)
+    session = CourseSession.query.filter_by(course_id=course.id).one()
+    first, second, third = (student.id for student in students[:3])
+
+    upsert_attendance([
+        {'student_id': first, 'session_id': session.id, 'status': 'present'},
+        {'student_id': second, 'session_id': session.id, 'status': 'absent', 'notes': 'Sick'},
+    ])
+    db.session.commit()
+    assert recorded(session.id) == {first: ('present', None), second: ('absent', 'Sick')}
+
+    upsert_attendance([
+        {'student_id': second, 'session_id': session.id, 'status': 'excused', 'notes': 'Doctor\'s note'},
+        {'student_id': third, 'session_id': session.id, 'status': 'late', 'notes': ''},
+    ])
+    db.session.commit()
+    assert recorded(session.id) == {
+        first: ('present', None),
+        second: ('excused', 'Doctor\'s note'),
+        third: ('late', ''),
+    }
+    assert Attendance.query.filter_by(session_id=session.id).count() == 3
+
+
+def test_upsert_without_records_does_nothing(app):
+    upsert_attendance([])
+
+    assert Attendance.query.count() == 0
+
+
+def test_take_attendance_keeps_rollups_in_sync(faculty_client, make_course, students):
+    course = make_course('C1', students[:3], [date(2024, 1, 1), date(2024, 1, 2)], record=False)
+    rollups.rebuild_rollups()
+    db.session.commit()
+    session = CourseSession.query.filter_by(course_id=course.id).order_by(CourseSession.id).first()
+    first, second, third = (student.id for student in students[:3])
+
+    response = faculty_client.post(f'/faculty/take_attendance/{session.id}', data={
+        f'status_{first}': 'present',
+        f'status_{second}': 'absent',
+        f'status_{third}': 'late',
+    })
+    assert response.status_code == 302
+    assert rollups.verify_rollups() == []
+    assert counters(course.id, second) == {
+        'session_count': 2, 'recorded_count': 1,
+        'present_count': 0, 'absent_count': 1, 'late_count': 0, 'excused_count': 0
+    }
+
+    # Retaking attendance moves counts between statuses; a student left blank keeps their record
+    response = faculty_client.post(f'/faculty/take_attendance/{session.id}', data={
+        f'status_{first}': 'present',
+        f'status_{second}': 'excused',
+    })
+    assert response.status_code == 302
+    assert rollups.verify_rollups() == []
+    assert counters(course.id, second) == {
+        'session_count': 2, 'recorded_count': 1,
+        'present_count': 0, 'absent_count': 0, 'late_count': 0, 'excused_count': 1
+    }
+    assert counters(course.id, third)['late_count'] == 1
+
+
+def test_take_attendance_rejects_unknown_status(faculty_client, make_course, students):
+    course = make_course('C1', students[:1], [date(2024, 1, 1)], record=False)
+    rollups.rebuild_rollups()
+    db.session.commit()
+    session = CourseSession.query.filter_by(course_id=course.id).one()
+
+    response = faculty_client.post(f'/faculty/take_attendance/{session.id}', data={
+        f'status_{students[0].id}': 'asleep',
+    })
+
+    assert response.status_code == 302
+    assert Attendance.query.count() == 0
+    assert rollups.verify_rollups() == []
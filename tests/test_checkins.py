@@ -0,0 +1,132 @@
+from datetime import date, datetime, time
+
+import pytest
+
+import rollups
+from app import db
+from checkins import CheckinWorker, create_device, ingest_checkins
+from models import Attendance, CheckinEvent, CourseSession
+
+
+@pytest.fixture
+def course(make_course, students):
+    """A course with a 09:00-10:00 session today, the first four students enrolled and no records."""
+    course = make_course('C1', students[:4], [date.today()], record=False)
+    rollups.rebuild_rollups()
+    db.session.commit()
+    return course
+
+
+@pytest.fixture
+def session(course):
+    return CourseSession.query.filter_by(course_id=course.id).one()
+
+
+@pytest.fixture
+def device(app):
+    device, _ = create_device('Reader 1', location='Room 1')
+    db.session.commit()
+    return device
+
+
+def at(hour, minute):
+    return datetime.combine(date.today(), time(hour, minute)).isoformat()
+
+
+def scan(app, device, *events):
+    """Queue events as the device and apply them; return each event's (status, attendance_status, error)."""
+    events = [{'idempotency_key': f'k{index}', **event} for index, event in enumerate(events)]
+    result = ingest_checkins(device, {'events': events}, app.config)
+    db.session.commit()
+    assert result['rejected'] == []
+    CheckinWorker.from_config(app.config).apply_once()
+    db.session.expire_all()
+    outcomes = {event.idempotency_key: (event.status, event.attendance_status, event.error)
+                for event in CheckinEvent.query}
+    return [outcomes[event['idempotency_key']] for event in events]
+
+
+def statuses(session):
+    return {record.student_id: record.status for record in Attendance.query.filter_by(session_id=session.id)}
+
+
+def test_scan_time_decides_present_or_late(app, device, session, students):
+    outcomes = scan(app, device,
+                    {'student_id': 'S0000', 'session_id': session.id, 'scanned_at': at(8, 50)},
+                    {'student_id': 'S0001', 'session_id': session.id, 'scanned_at': at(9, 5)},
+                    {'student_id': 'S0002', 'session_id': session.id, 'scanned_at': at(9, 6)})
+
+    assert outcomes == [('applied', 'present', None), ('applied', 'present', None), ('applied', 'late', None)]
+    assert statuses(session) == {students[0].id: 'present', students[1].id: 'present', students[2].id: 'late'}
+    assert rollups.verify_rollups() == []
+
+
+def test_scan_outside_the_session_is_rejected(app, device, session):
+    outcomes = scan(app, device,
+                    {'student_id': 'S0000', 'session_id': session.id, 'scanned_at': at(8, 44)},
+                    {'student_id': 'S0001', 'session_id': session.id, 'scanned_at': at(10, 1)},
+                    {'student_id': 'S0002', 'course_code': 'C1', 'scanned_at': at(12, 0)})
+
+    assert outcomes == [
+        ('rejected', None, 'The scan is outside the session'),
+        ('rejected', None, 'The scan is outside the session'),
+        ('rejected', None, 'No session at the time of the scan'),
+    ]
+    assert statuses(session) == {}
+
+
+def test_session_is_found_by_course_code_or_device_location(app, device, session, students):
+    outcomes = scan(app, device,
+                    {'student_id': 'S0000', 'course_code': 'C1', 'scanned_at': at(9, 0)},
+                    {'student_id': 'S0001', 'scanned_at': at(9, 30)})
+
+    assert outcomes == [('applied', 'present', None), ('applied', 'late', None)]
+    assert statuses(session) == {students[0].id: 'present', students[1].id: 'late'}
+
+
+def test_earliest_scan_of_a_student_wins(app, device, session, students):
+    outcomes = scan(app, device,
+                    {'student_id': 'S0000', 'session_id': session.id, 'scanned_at': at(9, 20)},
+                    {'student_id': 'S0000', 'session_id': session.id, 'scanned_at': at(9, 2)})
+
+    assert outcomes == [('ignored', 'present', None), ('applied', 'present', None)]
+    assert statuses(session) == {students[0].id: 'present'}
+    assert rollups.verify_rollups() == []
+
+
+def test_scan_never_lowers_a_recorded_status(app, device, session, students):
+    for student, status in ((students[0], 'present'), (students[1], 'absent')):
+        db.session.add(Attendance(student_id=student.id, session_id=session.id, status=status))
+    rollups.rebuild_rollups()
+    db.session.commit()
+
+    outcomes = scan(app, device,
+                    {'student_id': 'S0000', 'session_id': session.id, 'scanned_at': at(9, 30)},
+                    {'student_id': 'S0001', 'session_id': session.id, 'scanned_at': at(9, 30)})
+
+    assert outcomes == [('ignored', 'present', None), ('applied', 'late', None)]
+    assert statuses(session) == {students[0].id: 'present', students[1].id: 'late'}
+    assert rollups.verify_rollups() == []
+
+
+def test_unknown_and_unenrolled_students_are_rejected(app, device, session):
+    outcomes = scan(app, device,
+                    {'student_id': 'NOPE', 'session_id': session.id, 'scanned_at': at(9, 0)},
+                    {'student_id': 'S0010', 'session_id': session.id, 'scanned_at': at(9, 0)})
+
+    assert outcomes == [
+        ('rejected', None, 'Unknown student ID'),
+        ('rejected', None, 'Student is not enrolled in this course'),
+    ]
+    assert statuses(session) == {}
+
+
+def test_replayed_event_is_not_queued_again(app, device, session):
+    event = {'idempotency_key': 'k1', 'student_id': 'S0000', 'session_id': session.id, 'scanned_at': at(9, 0)}
+    ingest_checkins(device, event, app.config)
+    db.session.commit()
+
+    result = ingest_checkins(device, event, app.config)
+
+    assert result == {'accepted': 0, 'duplicates': 1, 'rejected': []}
+    assert CheckinEvent.query.count() == 1
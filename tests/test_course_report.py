@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app import db
+from routes import build_course_report
+
+
+def session_dates(count):
+    return [date(2024, 1, 1) + timedelta(days=day) for day in range(count)]
+
+
+def count_statements(function, *args):
+    """Run function(*args) and return how many SQL statements it executed."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db.session.expire_all()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        function(*args)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def test_course_report_query_count_does_not_grow_with_course_size(make_course, students):
+    small = make_course('SMALL', students[:2], session_dates(2))
+    large = make_course('LARGE', students, session_dates(30))
+
+    small_count = count_statements(build_course_report, small)
+    large_count = count_statements(build_course_report, large)
+
+    assert small_count > 0
+    assert small_count == large_count
+
+
+def test_course_report_endpoint(faculty_client, make_course, students):
+    course = make_course('SMALL', students[:2], session_dates(2))
+
+    response = faculty_client.get(f'/api/course_report/{course.id}')
+
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['course']['code'] == 'SMALL'
+    assert report['summary'] == {
+        'total_students': 2,
+        'total_sessions': 2,
+        # present, absent / absent, late: two of four records count as attended
+        'overall_attendance_rate': 50.0,
+        'students_below_threshold': 2
+    }
+    assert {(row['student_id'], row['present'], row['absent'], row['late']) for row in report['students']} == {
+        ('S0000', 1, 1, 0), ('S0001', 0, 1, 1)
+    }
+    assert [(row['date'], row['attendance_rate']) for row in report['sessions']] == [
+        ('2024-01-01', 50.0), ('2024-01-02', 50.0)
+    ]
+
+    revalidated = faculty_client.get(f'/api/course_report/{course.id}',
+                                     headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_course_report_endpoint_requires_login(client, make_course, students):
+    course = make_course('SMALL', students[:2], session_dates(2))
+
+    response = client.get(f'/api/course_report/{course.id}')
+
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
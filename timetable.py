@@ -0,0 +1,376 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Course, CourseEnrollment, CourseSession, CourseDataVersion
+
+TimetableEntry = namedtuple('TimetableEntry', [
+    'id', 'course_id', 'course_code', 'course_title', 'location',
+    'session_date', 'start_time', 'end_time', 'title'
+])
+
+# Salt for signed calendar feed tokens
+FEED_SALT = 'timetable-feed'
+
+def _entry_columns():
+    return (CourseSession.id, CourseSession.course_id, Course.course_code, Course.title, Course.location,
+            CourseSession.session_date, CourseSession.start_time, CourseSession.end_time, CourseSession.title)
+
+def _sort_key(entry):
+    return entry.session_date, entry.start_time, entry.course_code, entry.id
+
+class TimetableIndex:
+    """
+    Sessions by (date, faculty) and by (date, course) for one process, with
+    each student's enrolled courses, so "what do I have today" is answered
+    from memory.
+
+    Sessions are indexed for a window around today (TIMETABLE_DAYS_BACK to
+    TIMETABLE_DAYS_AHEAD); dates outside it are read from the database. A
+    student's day is merged from the (date, course) lists of their courses
+    rather than stored per student, which keeps memory proportional to the
+    number of sessions instead of sessions times enrollments.
+
+    The index is kept current one course at a time. Writes in this process
+    mark their courses stale when they commit (see courses_changed), and every
+    TIMETABLE_SYNC_SECONDS one query compares course data versions to catch
+    writes made by other workers. Stale courses are reloaded from the primary
+    database on the next lookup; the whole index is rebuilt only on first use
+    and when the date window moves.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._window = None
+        self._synced_at = 0.0
+        self._stale = set()
+        self._versions = {}
+        self._course_faculty = {}
+        self._course_students = {}
+        self._course_days = {}
+        self._faculty_courses = {}
+        self._faculty_days = {}
+        self._student_courses = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.rebuilds = 0
+
+    def current_window(self):
+        """First and last date the index covers as of today."""
+        config = current_app.config
+        today = date.today()
+        return (today - timedelta(days=config.get('TIMETABLE_DAYS_BACK', 14)),
+                today + timedelta(days=config.get('TIMETABLE_DAYS_AHEAD', 180)))
+
+    def size(self):
+        return sum(len(entries) for days in self._course_days.values() for entries in days.values())
+
+    def mark_stale(self, course_ids):
+        with self._lock:
+            self._stale.update(course_ids)
+
+    def clear(self):
+        with self._lock:
+            self._window = None
+
+    def _load(self, window, course_ids=None):
+        """Read courses, versions, enrollments and windowed sessions from the primary database."""
+        def scoped(statement, column):
+            return statement if course_ids is None else statement.where(column.in_(course_ids))
+
+        # Versions are read first: a write committing mid-load then leaves the course stale, never current
+        with db.engine.connect() as conn:
+            versions = dict(conn.execute(scoped(
+                select(CourseDataVersion.course_id, CourseDataVersion.version), CourseDataVersion.course_id
+            )).all())
+            faculty = dict(conn.execute(scoped(select(Course.id, Course.faculty_id), Course.id)).all())
+            students = {}
+            for course_id, student_id in conn.execute(scoped(
+                select(CourseEnrollment.course_id, CourseEnrollment.student_id), CourseEnrollment.course_id
+            )):
+                students.setdefault(course_id, set()).add(student_id)
+            days = {}
+            for row in conn.execute(scoped(
+                select(*_entry_columns()).join(Course, CourseSession.course_id == Course.id).where(
+                    CourseSession.session_date.between(*window)
+                ), CourseSession.course_id
+            )):
+                entry = TimetableEntry(*row)
+                days.setdefault(entry.course_id, {}).setdefault(entry.session_date, []).append(entry)
+
+        for course_days in days.values():
+            for entries in course_days.values():
+                entries.sort(key=_sort_key)
+        return {
+            course_id: (versions.get(course_id, 0), faculty_id, frozenset(students.get(course_id, ())),
+                        days.get(course_id, {}))
+            for course_id, faculty_id in faculty.items()
+        }
+
+    def _apply(self, loaded, removed=()):
+        """Swap in reloaded courses and rebuild the faculty days they touch; caller holds the lock."""
+        touched_faculty = set()
+        for course_id in set(removed) | set(loaded):
+            old_faculty = self._course_faculty.pop(course_id, None)
+            if old_faculty is not None:
+                self._faculty_courses.get(old_faculty, set()).discard(course_id)
+                touched_faculty.add(old_faculty)
+            for student_id in self._course_students.pop(course_id, ()):
+                self._student_courses.get(student_id, set()).discard(course_id)
+            self._course_days.pop(course_id, None)
+            self._versions.pop(course_id, None)
+
+        for course_id, (version, faculty_id, students, days) in loaded.items():
+            self._versions[course_id] = version
+            self._course_faculty[course_id] = faculty_id
+            self._course_students[course_id] = students
+            self._course_days[course_id] = days
+            self._faculty_courses.setdefault(faculty_id, set()).add(course_id)
+            touched_faculty.add(faculty_id)
+            for student_id in students:
+                self._student_courses.setdefault(student_id, set()).add(course_id)
+
+        for faculty_id in touched_faculty:
+            faculty_days = {}
+            for course_id in self._faculty_courses.get(faculty_id, ()):
+                for day, entries in self._course_days[course_id].items():
+                    faculty_days.setdefault(day, []).extend(entries)
+            for entries in faculty_days.values():
+                entries.sort(key=_sort_key)
+            self._faculty_days[faculty_id] = faculty_days
+
+    def rebuild(self):
+        """Reload every course for the current date window."""
+        window = self.current_window()
+        loaded = self._load(window)
+        with self._lock:
+            self._versions, self._course_faculty, self._course_students = {}, {}, {}
+            self._course_days, self._faculty_courses, self._faculty_days = {}, {}, {}
+            self._student_courses = {}
+            self._stale.clear()
+            self._apply(loaded)
+            self._window = window
+            self._synced_at = time.monotonic()
+            self.rebuilds += 1
+
+    def refresh(self, course_ids):
+        """Reload some courses; courses that no longer exist are dropped."""
+        course_ids = sorted(set(course_ids))
+        if not course_ids:
+            return
+        loaded = self._load(self._window, course_ids)
+        with self._lock:
+            self._apply(loaded, removed=course_ids)
+            self.refreshes += 1
+
+    def sync(self):
+        """Bring the index up to date before a lookup."""
+        if self._window != self.current_window():
+            self.rebuild()
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            stale = set(self._stale)
+            self._stale.clear()
+            poll = now - self._synced_at >= current_app.config.get('TIMETABLE_SYNC_SECONDS', 5)
+            if poll:
+                self._synced_at = now
+
+        if poll:
+            with db.engine.connect() as conn:
+                current = dict(conn.execute(
+                    select(Course.id, CourseDataVersion.version).outerjoin(
+                        CourseDataVersion, CourseDataVersion.course_id == Course.id
+                    )
+                ).all())
+            stale.update(course_id for course_id, version in current.items()
+                         if self._versions.get(course_id) != (version or 0))
+            stale.update(set(self._versions) - set(current))
+
+        if stale:
+            self.refresh(stale)
+
+    def lookup(self, owner, owner_id, start, end):
+        """
+        Sessions of a faculty member or student between two dates.
+
+        Args:
+            owner: 'faculty' or 'student'
+            owner_id: Faculty or Student ID
+            start: First date
+            end: Last date (inclusive)
+
+        Returns:
+            Dictionary mapping every date in the range to a list of
+            TimetableEntry tuples ordered by start time
+        """
+        self.sync()
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        window_start, window_end = self._window
+        outside = [day for day in days if not window_start <= day <= window_end]
+
+        with self._lock:
+            if owner == 'faculty':
+                course_ids = set(self._faculty_courses.get(owner_id, ()))
+                faculty_days = self._faculty_days.get(owner_id, {})
+                results = {day: list(faculty_days.get(day, ())) for day in days}
+            else:
+                course_ids = set(self._student_courses.get(owner_id, ()))
+                results = {}
+                for day in days:
+                    entries = [entry for course_id in course_ids
+                               for entry in self._course_days[course_id].get(day, ())]
+                    entries.sort(key=_sort_key)
+                    results[day] = entries
+            self.hits += len(days) - len(outside)
+            self.misses += len(outside)
+
+        if outside and course_ids:
+            for day in outside:
+                results[day] = []
+            for row in db.session.query(*_entry_columns()).join(
+                Course, CourseSession.course_id == Course.id
+            ).filter(
+                CourseSession.course_id.in_(course_ids),
+                CourseSession.session_date.between(min(outside), max(outside))
+            ).order_by(CourseSession.session_date, CourseSession.start_time, Course.course_code, CourseSession.id):
+                if row.session_date in results and not window_start <= row.session_date <= window_end:
+                    results[row.session_date].append(TimetableEntry(*row))
+        return results
+
+    def day(self, owner, owner_id, day):
+        """Sessions of a faculty member or student on one date."""
+        return self.lookup(owner, owner_id, day, day)[day]
+
+timetable_index = TimetableIndex()
+
+def courses_changed(course_ids):
+    """
+    Mark courses stale in this process's timetable index once the current
+    transaction commits. Called by bump_course_versions.
+    """
+    db.session().info.setdefault('timetable_courses', set()).update(course_ids)
+
+def _mark_committed(session):
+    course_ids = session.info.pop('timetable_courses', None)
+    if course_ids:
+        timetable_index.mark_stale(course_ids)
+
+def _discard_pending(session):
+    session.info.pop('timetable_courses', None)
+
+event.listen(Session, 'after_commit', _mark_committed)
+event.listen(Session, 'after_rollback', _discard_pending)
+
+def week_bounds(day):
+    """Monday and Sunday of the week containing a date."""
+    monday = day - timedelta(days=day.weekday())
+    return monday, monday + timedelta(days=6)
+
+def entry_json(entry):
+    return {
+        'session_id': entry.id,
+        'course_id': entry.course_id,
+        'course_code': entry.course_code,
+        'course_title': entry.course_title,
+        'location': entry.location,
+        'date': entry.session_date.isoformat(),
+        'start_time': entry.start_time.strftime('%H:%M'),
+        'end_time': entry.end_time.strftime('%H:%M'),
+        'title': entry.title
+    }
+
+def calendar_json(view, start, end, days):
+    """JSON body of a day or week calendar."""
+    return {
+        'view': view,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': [
+            {'date': day.isoformat(), 'sessions': [entry_json(entry) for entry in days[day]]}
+            for day in sorted(days)
+        ]
+    }
+
+def _ical_text(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def _ical_fold(line):
+    # Lines longer than 75 octets continue on the next line after a single space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts)
+
+def ical_feed(name, entries, host='attendance'):
+    """
+    Format sessions as an iCalendar (RFC 5545) feed.
+
+    Times are written as floating local times, i.e. in the calendar app's
+    own time zone, as sessions carry no zone of their own.
+
+    Args:
+        name: Calendar name shown by calendar apps
+        entries: Iterable of TimetableEntry tuples
+        host: Domain used in event UIDs
+
+    Returns:
+        The feed as a string with CRLF line endings
+    """
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Attendance Management System//Timetable//EN',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_ical_text(name)}',
+    ]
+    for entry in entries:
+        summary = f'{entry.course_code} {entry.course_title}'
+        if entry.title:
+            summary += f': {entry.title}'
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:session-{entry.id}@{host}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{datetime.combine(entry.session_date, entry.start_time):%Y%m%dT%H%M%S}',
+            f'DTEND:{datetime.combine(entry.session_date, entry.end_time):%Y%m%dT%H%M%S}',
+            f'SUMMARY:{_ical_text(summary)}',
+            f'LOCATION:{_ical_text(entry.location)}',
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_ical_fold(line) for line in lines) + '\r\n'
+
+def feed_token(user):
+    """
+    Signed token identifying a user in their calendar feed URL.
+
+    Calendar apps cannot log in, so the feed is authorized by this token
+    alone; rotating SESSION_SECRET revokes every issued feed URL.
+    """
+    return URLSafeSerializer(current_app.secret_key, salt=FEED_SALT).dumps(user.id)
+
+def feed_user_id(token):
+    """User ID of a feed token, or None if the token is not valid."""
+    try:
+        return URLSafeSerializer(current_app.secret_key, salt=FEED_SALT).loads(token)
+    except BadSignature:
+        return None
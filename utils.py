@@ -1,12 +1,69 @@
+from collections import defaultdict
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_, exists
+from sqlalchemy.dialects import postgresql, sqlite
 from app import db
-from models import CourseSession, Attendance, CourseEnrollment
+from models import Student, Course, CourseSession, Attendance, CourseEnrollment, AttendanceRollup, AbsenceRequest
+from rollups import COUNTER_COLUMNS, aggregate_attendance_counts
+from notifications import queue_low_attendance_notifications, withdraw_low_attendance_notifications
+from course_versions import bump_course_versions
+from result_cache import cached_results, course_tag, student_tag
+import rollups
+from metrics import count_attendance_writes
+
+def _empty_attendance_stats():
+    return {
+        'total': 0,
+        'present': 0,
+        'absent': 0,
+        'late': 0,
+        'excused': 0,
+        'percentage': 0
+    }
+
+def _attendance_stats_from_counts(total_sessions, recorded_sessions, present_count, absent_count,
+                                  late_count, excused_count):
+    """
+    Build the attendance stats dictionary from raw counters.
+
+    Sessions without an attendance record count as absent, and excused
+    sessions are left out of the denominator.
+    """
+    if not total_sessions:
+        return _empty_attendance_stats()
+    
+    # Add unattended sessions as 'absent'
+    absent_count += total_sessions - recorded_sessions
+    
+    total_required = total_sessions - excused_count
+    
+    if total_required > 0:
+        percentage = (present_count + late_count) / total_required * 100
+    else:
+        percentage = 0
+    
+    return {
+        'total': total_sessions,
+        'present': present_count,
+        'absent': absent_count,
+        'late': late_count,
+        'excused': excused_count,
+        'percentage': round(percentage, 2)
+    }
+
+def _stats_from_counters(counters):
+    return _attendance_stats_from_counts(
+        counters['session_count'], counters['recorded_count'], counters['present_count'],
+        counters['absent_count'], counters['late_count'], counters['excused_count']
+    )
 
 def calculate_attendance(student_id, course_id):
     """
     Calculate attendance statistics for a student in a specific course.
     
+    Results go through the result cache (see result_cache.py) and are dropped
+    whenever the course's data changes.
+    
     Args:
         student_id: ID of the student
         course_id: ID of the course
@@ -14,20 +71,30 @@ def calculate_attendance(student_id, course_id):
     Returns:
         Dictionary containing attendance stats
     """
+    key = f'attendance:{student_id}:{course_id}'
+    return cached_results(
+        {key: (course_tag(course_id), student_tag(student_id))},
+        lambda missing: {key: _compute_attendance(student_id, course_id)}
+    )[key]
+
+def _compute_attendance(student_id, course_id):
+    """
+    Compute attendance statistics for a student in a course without the cache.
+    
+    Reads the student's rollup row when one exists and falls back to counting
+    raw attendance records otherwise.
+    """
+    rollup = AttendanceRollup.query.filter_by(student_id=student_id, course_id=course_id).first()
+    if rollup:
+        return _stats_from_counters({column: getattr(rollup, column) for column in COUNTER_COLUMNS})
+    
     # Get all sessions for this course
     session_ids = db.session.query(CourseSession.id).filter_by(course_id=course_id).all()
     session_ids = [session[0] for session in session_ids]
     
     # If no sessions, return default stats
     if not session_ids:
-        return {
-            'total': 0,
-            'present': 0,
-            'absent': 0,
-            'late': 0,
-            'excused': 0,
-            'percentage': 0
-        }
+        return _empty_attendance_stats()
     
     # Get all attendance records for this student in these sessions
     attendance_records = Attendance.query.filter(
@@ -41,112 +108,369 @@ def calculate_attendance(student_id, course_id):
     late_count = sum(1 for record in attendance_records if record.status == 'late')
     excused_count = sum(1 for record in attendance_records if record.status == 'excused')
     
-    # Calculate attendance percentage (present + late) / (total non-excused sessions)
-    recorded_sessions = len(attendance_records)
-    unattended_sessions = len(session_ids) - recorded_sessions
+    return _attendance_stats_from_counts(len(session_ids), len(attendance_records), present_count,
+                                         absent_count, late_count, excused_count)
+
+def calculate_attendance_bulk(course_ids=None, student_ids=None):
+    """
+    Calculate attendance statistics for many enrolled students at once.
     
-    # Add unattended sessions as 'absent'
-    absent_count += unattended_sessions
+    Counters come from the attendance rollup table in a single query. Enrolled
+    pairs without a rollup row (e.g. before the first rebuild) are aggregated
+    from the raw tables with one GROUP BY, so the numbers always match
+    calculate_attendance.
     
-    total_sessions = len(session_ids)
-    total_required = total_sessions - excused_count
+    Args:
+        course_ids: Optional iterable of course IDs to restrict to
+        student_ids: Optional iterable of student IDs to restrict to
+        
+    Returns:
+        Dictionary mapping (student_id, course_id) to attendance stats
+    """
+    if course_ids is not None:
+        course_ids = list(course_ids)
+    if student_ids is not None:
+        student_ids = list(student_ids)
     
-    if total_required > 0:
-        percentage = (present_count + late_count) / total_required * 100
-    else:
-        percentage = 0
+    query = db.session.query(
+        CourseEnrollment.student_id,
+        CourseEnrollment.course_id,
+        AttendanceRollup
+    ).outerjoin(
+        AttendanceRollup, (AttendanceRollup.student_id == CourseEnrollment.student_id) &
+                          (AttendanceRollup.course_id == CourseEnrollment.course_id)
+    )
     
+    if course_ids is not None:
+        query = query.filter(CourseEnrollment.course_id.in_(course_ids))
+    if student_ids is not None:
+        query = query.filter(CourseEnrollment.student_id.in_(student_ids))
+    
+    results = {}
+    missing = False
+    for student_id, course_id, rollup in query.all():
+        if rollup is None:
+            missing = True
+            continue
+        results[(student_id, course_id)] = _stats_from_counters(
+            {column: getattr(rollup, column) for column in COUNTER_COLUMNS}
+        )
+    
+    if missing:
+        for key, counters in aggregate_attendance_counts(course_ids, student_ids).items():
+            results.setdefault(key, _stats_from_counters(counters))
+    
+    return results
+
+def _empty_course_stats():
     return {
-        'total': total_sessions,
-        'present': present_count,
-        'absent': absent_count,
-        'late': late_count,
-        'excused': excused_count,
-        'percentage': round(percentage, 2)
+        'attendance_rate': 0,
+        'sessions_count': 0,
+        'student_count': 0,
+        'below_threshold': 0
     }
 
-def get_attendance_stats(course_id):
+def get_attendance_stats_bulk(courses):
     """
-    Get overall attendance statistics for a course.
+    Get overall attendance statistics for several courses with a fixed number of queries.
+    
+    Students are counted as below threshold against each course's own
+    min_attendance_percent. Each course's stats are kept in the result cache;
+    only courses missing from it are computed, together.
     
     Args:
-        course_id: ID of the course
+        courses: Iterable of Course objects
         
     Returns:
-        Dictionary containing attendance stats
+        Dictionary mapping course ID to attendance stats
     """
-    # Get all sessions for this course
-    sessions = CourseSession.query.filter_by(course_id=course_id).all()
-    if not sessions:
-        return {
-            'attendance_rate': 0,
-            'sessions_count': 0,
-            'student_count': 0,
-            'below_threshold': 0
-        }
+    courses_by_key = {f'course_stats:{course.id}': course for course in courses}
+    if not courses_by_key:
+        return {}
+    
+    def compute(missing):
+        stats = _compute_attendance_stats([courses_by_key[key] for key in missing])
+        return {f'course_stats:{course_id}': course_stats for course_id, course_stats in stats.items()}
     
-    # Get all enrollments for this course
-    enrollments = CourseEnrollment.query.filter_by(course_id=course_id).all()
-    student_count = len(enrollments)
+    results = cached_results(
+        {key: (course_tag(course.id),) for key, course in courses_by_key.items()},
+        compute
+    )
+    return {course.id: results[key] for key, course in courses_by_key.items()}
+
+def _compute_attendance_stats(courses):
+    """Compute get_attendance_stats_bulk results for a list of courses without the cache."""
+    course_ids = [course.id for course in courses]
     
-    # Calculate statistics
-    total_present = 0
-    total_late = 0
-    total_records = 0
-    below_threshold = 0
+    sessions_count = dict(db.session.query(
+        CourseSession.course_id, func.count(CourseSession.id)
+    ).filter(
+        CourseSession.course_id.in_(course_ids)
+    ).group_by(CourseSession.course_id).all())
     
-    for enrollment in enrollments:
-        stats = calculate_attendance(enrollment.student_id, course_id)
-        if stats['total'] > 0:
-            below_threshold += 1 if stats['percentage'] < 75 else 0
+    student_count = dict(db.session.query(
+        CourseEnrollment.course_id, func.count(CourseEnrollment.id)
+    ).filter(
+        CourseEnrollment.course_id.in_(course_ids)
+    ).group_by(CourseEnrollment.course_id).all())
     
-    # Calculate overall attendance rate from Attendance records
+    # Overall attendance rate from Attendance records, per course and status
     attendance_records = db.session.query(
+        CourseSession.course_id,
         Attendance.status,
-        func.count(Attendance.id).label('count')
+        func.count(Attendance.id)
     ).join(
         CourseSession, Attendance.session_id == CourseSession.id
     ).filter(
-        CourseSession.course_id == course_id
+        CourseSession.course_id.in_(course_ids)
     ).group_by(
-        Attendance.status
+        CourseSession.course_id, Attendance.status
     ).all()
     
-    total_records = 0
-    present_late_count = 0
-    
-    for status, count in attendance_records:
-        total_records += count
+    total_records = defaultdict(int)
+    present_late_count = defaultdict(int)
+    for course_id, status, count in attendance_records:
+        total_records[course_id] += count
         if status in ['present', 'late']:
-            present_late_count += count
+            present_late_count[course_id] += count
     
-    attendance_rate = (present_late_count / total_records * 100) if total_records > 0 else 0
+    thresholds = {course.id: course.min_attendance_percent for course in courses}
+    below_threshold = defaultdict(int)
+    for (_, course_id), stats in calculate_attendance_bulk(course_ids=course_ids).items():
+        if stats['total'] > 0 and stats['percentage'] < thresholds[course_id]:
+            below_threshold[course_id] += 1
     
-    return {
-        'attendance_rate': round(attendance_rate, 2),
-        'sessions_count': len(sessions),
-        'student_count': student_count,
-        'below_threshold': below_threshold
-    }
+    results = {}
+    for course_id in course_ids:
+        if not sessions_count.get(course_id):
+            results[course_id] = _empty_course_stats()
+            continue
+        
+        records = total_records[course_id]
+        attendance_rate = (present_late_count[course_id] / records * 100) if records > 0 else 0
+        
+        results[course_id] = {
+            'attendance_rate': round(attendance_rate, 2),
+            'sessions_count': sessions_count[course_id],
+            'student_count': student_count.get(course_id, 0),
+            'below_threshold': below_threshold[course_id]
+        }
+    
+    return results
 
-def send_attendance_notification(student, course, attendance_percentage):
+def lower_prefix_match(column, prefix):
     """
-    Send notification to student about low attendance.
-    In a real application, this would send an email or other notification.
-    For this implementation, we'll just print to the console.
+    Case-insensitive prefix filter that can use an index on lower(column).
+    
+    PostgreSQL serves lower(column) LIKE 'abc%' from a text_pattern_ops
+    expression index. SQLite only uses an index for LIKE on a NOCASE column,
+    so there the prefix becomes a range on lower(column) instead.
+    
+    Args:
+        column: String column to match
+        prefix: Text the column should start with
+        
+    Returns:
+        SQL boolean expression
+    """
+    lowered = func.lower(column)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # U+10FFFF sorts after every character in SQLite's default binary collation
+        return and_(lowered >= func.lower(prefix), lowered < func.lower(prefix + '\U0010ffff'))
+    
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return lowered.like(func.lower(escaped + '%'), escape='\\')
+
+def search_available_students(course_id, search=None, page=1, per_page=20):
+    """
+    Find students who are not enrolled in a course, one page at a time.
+    
+    Enrolled students are excluded with a NOT EXISTS anti-join on
+    course_enrollment, so nothing is loaded beyond the requested page. The
+    optional search term matches the start of the full name, student ID or
+    department, ignoring case.
+    
+    Args:
+        course_id: ID of the course
+        search: Optional prefix to match
+        page: 1-based page number
+        per_page: Number of students per page
+        
+    Returns:
+        Tuple of (list of Student objects ordered by name, whether more pages exist)
+    """
+    enrolled = exists().where(
+        CourseEnrollment.student_id == Student.id,
+        CourseEnrollment.course_id == course_id
+    )
+    query = Student.query.filter(~enrolled)
+    
+    search = (search or '').strip()
+    if search:
+        query = query.filter(or_(
+            lower_prefix_match(Student.full_name, search),
+            lower_prefix_match(Student.student_id, search),
+            lower_prefix_match(Student.department, search)
+        ))
+    
+    # Fetch one extra row to tell whether another page follows without a COUNT
+    students = query.order_by(Student.full_name, Student.id).offset(
+        (page - 1) * per_page
+    ).limit(per_page + 1).all()
+    return students[:per_page], len(students) > per_page
+
+def dialect_insert(table):
+    """
+    Build an INSERT for the current database that supports ON CONFLICT clauses.
+    
+    Args:
+        table: Table to insert into
+        
+    Returns:
+        PostgreSQL or SQLite insert construct
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f'INSERT ... ON CONFLICT is not supported on {dialect}')
+
+def upsert_attendance(records):
+    """
+    Insert or update many attendance records with one INSERT ... ON CONFLICT statement.
+    
+    Rows that already exist for the same student and session (the
+    unique_attendance constraint) get their status and notes replaced. The
+    statement is compiled once and executed for all records together; on
+    PostgreSQL SQLAlchemy sends them as multi-row VALUES batches, on SQLite as
+    a single executemany. The caller is responsible for committing.
+    
+    Args:
+        records: List of dictionaries with student_id, session_id, status and notes
+    """
+    if not records:
+        return
+    
+    statement = dialect_insert(Attendance.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['student_id', 'session_id'],
+        set_={
+            'status': statement.excluded.status,
+            'notes': statement.excluded.notes
+        }
+    )
+    
+    recorded_at = datetime.utcnow()
+    db.session.execute(statement, [
+        {'recorded_at': recorded_at, 'notes': None, **record}
+        for record in records
+    ])
+    count_attendance_writes(records)
+
+def check_attendance_thresholds(course, student_ids):
+    """
+    Recompute attendance for some students of a course and update their low
+    attendance warnings in the caller's transaction.
+    
+    Students below the course minimum get a warning queued in the outbox, and
+    pending warnings for the others are withdrawn. Only the given students are
+    recomputed, so callers pass the students whose records actually changed.
     
     Args:
-        student: Student object
         course: Course object
-        attendance_percentage: Current attendance percentage
-    """
-    # This would be replaced with actual notification logic in a production system
-    print(f"⚠️ NOTIFICATION: Student {student.full_name} ({student.student_id}) "
-          f"has attendance of {attendance_percentage:.2f}% in {course.title}, "
-          f"which is below the required minimum of {course.min_attendance_percent}%.")
-    
-    # In a real system, you could:
-    # 1. Send an email
-    # 2. Generate a notification in the UI
-    # 3. Send an SMS
-    # etc.
+        student_ids: Iterable of student IDs
+    """
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    
+    stats = calculate_attendance_bulk(course_ids=[course.id], student_ids=student_ids)
+    below = {
+        student_id: student_stats['percentage']
+        for (student_id, _), student_stats in stats.items()
+        if student_stats['percentage'] < course.min_attendance_percent
+    }
+    queue_low_attendance_notifications(course, below)
+    withdraw_low_attendance_notifications(course, student_ids - set(below))
+
+def respond_to_absence_requests(absence_requests, status, response_notes=None):
+    """
+    Approve or reject absence requests in the caller's transaction.
+    
+    When approving, every session of the request's course within the absence
+    period is marked excused. The sessions and existing statuses for all
+    requests are read with one query and written with one upsert, rollups are
+    adjusted per course, and attendance thresholds are rechecked only for the
+    students whose records changed. The caller is responsible for committing.
+    
+    Args:
+        absence_requests: List of AbsenceRequest objects
+        status: 'approved' or 'rejected'
+        response_notes: Optional notes shown to the students
+        
+    Returns:
+        Number of attendance records that were created or changed
+    """
+    responded_at = datetime.utcnow()
+    for absence_request in absence_requests:
+        absence_request.status = status
+        absence_request.response_notes = response_notes
+        absence_request.responded_at = responded_at
+    bump_course_versions(absence_request.course_id for absence_request in absence_requests)
+    
+    if status != 'approved' or not absence_requests:
+        return 0
+    
+    requests_by_id = {absence_request.id: absence_request for absence_request in absence_requests}
+    rows = db.session.query(
+        AbsenceRequest.id,
+        CourseSession.id,
+        Attendance.status
+    ).join(
+        CourseSession, and_(
+            CourseSession.course_id == AbsenceRequest.course_id,
+            CourseSession.session_date >= AbsenceRequest.from_date,
+            CourseSession.session_date <= AbsenceRequest.to_date
+        )
+    ).outerjoin(
+        Attendance, and_(
+            Attendance.session_id == CourseSession.id,
+            Attendance.student_id == AbsenceRequest.student_id
+        )
+    ).filter(
+        AbsenceRequest.id.in_(list(requests_by_id))
+    ).order_by(AbsenceRequest.id, CourseSession.id).all()
+    
+    # Overlapping requests from the same student must excuse each session only once
+    records = {}
+    status_changes = defaultdict(list)
+    for request_id, session_id, old_status in rows:
+        absence_request = requests_by_id[request_id]
+        key = (absence_request.student_id, session_id)
+        if key in records:
+            continue
+        records[key] = {
+            'student_id': absence_request.student_id,
+            'session_id': session_id,
+            'status': 'excused',
+            'notes': f"Excused absence: {absence_request.reason}"
+        }
+        status_changes[absence_request.course_id].append((absence_request.student_id, old_status, 'excused'))
+    
+    upsert_attendance(list(records.values()))
+    for course_id, changes in status_changes.items():
+        rollups.apply_status_changes(course_id, changes)
+    
+    courses = Course.query.filter(Course.id.in_(list(status_changes))).all()
+    for course in courses:
+        check_attendance_thresholds(course, {
+            student_id for student_id, old_status, new_status in status_changes[course.id]
+            if old_status != new_status
+        })
+    
+    return sum(
+        1 for changes in status_changes.values()
+        for _, old_status, new_status in changes
+        if old_status != new_status
+    )